@@ -3,6 +3,15 @@ from flask import Flask
 from flask_cors import CORS
 from routes.api_routes import api_bp
 from config import Config
+from utils.db_executor import init_db_executor
+from utils.replica import init_replica
+from utils.admission import init_upload_admission
+from utils.risk import init_risk_engine
+from utils.charts import init_chart_service
+from utils.news_store import init_news_store
+from utils.snapshot import init_snapshot_service
+from utils.responses import init_response_layer
+from utils.profiling import init_profiler
 
 def create_app():
     app = Flask(__name__)
@@ -10,9 +19,36 @@ def create_app():
     
     CORS(app)
     
+    # Opt-in cProfile of requests; first so the other hooks are profiled too
+    init_profiler(app)
+    
+    # Fast JSON encoding and negotiated gzip/deflate compression
+    init_response_layer(app)
+    
     # Ensure upload directory exists
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
+    # Run database work off the request threads
+    init_db_executor(app)
+    
+    # Keep the read-only replica fresh for expensive reads
+    init_replica(app)
+    
+    # Bound concurrent upload parsing so uploads cannot starve reads
+    init_upload_admission(app)
+    
+    # Shared risk analytics caches
+    init_risk_engine(app)
+    
+    # Downsampled chart series, sharing the risk engine's price history
+    init_chart_service(app)
+    
+    # Local full-text news index
+    init_news_store(app)
+    
+    # Memory-mapped holdings snapshots for cross-user analytics
+    init_snapshot_service(app)
+    
     # Register blueprints
     app.register_blueprint(api_bp, url_prefix='/api')
     
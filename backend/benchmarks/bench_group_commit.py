@@ -0,0 +1,102 @@
+"""
+Benchmark: portfolio uploads/sec under concurrent clients.
+
+Compares the per-request path (insert_portfolio + insert_holdings, one
+commit each) against the group-commit writer (ingest_portfolio) on a
+fresh temporary database.
+
+Usage:
+    cd backend
+    python benchmarks/bench_group_commit.py --clients 50 --uploads 20 --holdings 50 [--shards 1 4]
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.database import DatabaseManager  # noqa: E402
+
+
+def make_holdings(count):
+    return [
+        {
+            'ticker': f"T{i % 500:03d}",
+            'shares': 10.0 + i,
+            'purchase_price': 100.0 + i / 10,
+            'purchase_date': '2024-01-15',
+        }
+        for i in range(count)
+    ]
+
+
+def per_request_upload(manager, user_id, holdings):
+    portfolio_id = manager.insert_portfolio(user_id, 'bench.csv')
+    manager.insert_holdings(portfolio_id, holdings)
+
+
+def group_commit_upload(manager, user_id, holdings):
+    manager.ingest_portfolio(user_id, 'bench.csv', holdings)
+
+
+def run(label, upload, clients, uploads_per_client, holdings, shards=1):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'), shards)
+        errors = {'locked': 0, 'other': 0}
+        lock = threading.Lock()
+        start_barrier = threading.Barrier(clients + 1)
+
+        def client(index):
+            start_barrier.wait()
+            for n in range(uploads_per_client):
+                try:
+                    upload(manager, f"user{index}@example.com", holdings)
+                except sqlite3.OperationalError as e:
+                    with lock:
+                        errors['locked' if 'locked' in str(e) else 'other'] += 1
+                except Exception:
+                    with lock:
+                        errors['other'] += 1
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        start_barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        total = clients * uploads_per_client
+        succeeded = total - errors['locked'] - errors['other']
+        print(f"{label:<14} {succeeded:>6}/{total} ok  {elapsed:7.2f}s  "
+              f"{succeeded / elapsed:8.1f} uploads/s  "
+              f"locked={errors['locked']} other={errors['other']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--uploads', type=int, default=20, help='uploads per client')
+    parser.add_argument('--holdings', type=int, default=50, help='holdings per upload')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1], help='shard counts to compare')
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)  # lock errors are counted instead
+    holdings = make_holdings(args.holdings)
+
+    print(f"{args.clients} clients x {args.uploads} uploads x {args.holdings} holdings")
+    for shards in args.shards:
+        print(f"-- {shards} shard(s)")
+        run('per-request', per_request_upload, args.clients, args.uploads, holdings, shards)
+        run('group-commit', group_commit_upload, args.clients, args.uploads, holdings, shards)
+
+
+if __name__ == '__main__':
+    main()
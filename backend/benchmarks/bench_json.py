@@ -0,0 +1,124 @@
+"""
+Benchmark: serializing and compressing a large portfolio response.
+
+Ingests one portfolio (default 50,000 holdings) into a temporary database,
+then measures the GET /api/portfolio/<id> payload:
+
+  * serialization time of the holdings with the stdlib encoder over row
+    dictionaries (the previous path), orjson over row dictionaries, and
+    orjson over the columnar layout built from cursor tuples
+  * bytes on the wire uncompressed, gzip and deflate
+  * end-to-end request time through the app with and without compression
+
+Usage:
+    cd backend
+    python benchmarks/bench_json.py --holdings 50000 --repeat 5
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_holdings(count):
+    sectors = ['Technology', 'Health Care', 'Energy', 'Financials', 'Utilities', None]
+    return [
+        {
+            'ticker': f"T{i % 2000:04d}",
+            'shares': 10.0 + i % 997,
+            'purchase_price': round(20 + (i * 7919 % 50000) / 100, 2),
+            'purchase_date': f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}",
+            'company_name': f"Company {i % 2000}",
+            'sector': sectors[i % len(sectors)],
+            'notes': 'rebalanced' if i % 10 == 0 else None,
+        }
+        for i in range(count)
+    ]
+
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return min(times), statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--holdings', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # The database manager is configured from the environment at import time
+        os.environ['CAPTURA_DB_PATH'] = os.path.join(tmp_dir, 'bench.db')
+        os.environ['CAPTURA_NEWS_DB_PATH'] = os.path.join(tmp_dir, 'news.db')
+        from app import create_app
+        from utils import responses
+        from utils.database import db_manager
+
+        portfolio_id, _ = db_manager.ingest_portfolio('bench@example.com', 'bench.csv',
+                                                      make_holdings(args.holdings))
+        app = create_app()
+        records = db_manager.get_holdings_by_portfolio(portfolio_id)
+        columns, rows = db_manager.get_holding_rows(portfolio_id)
+
+        print(f"{args.holdings} holdings, best/median of {args.repeat}")
+        print("-- serialization (holdings only, includes fetching from SQLite)")
+        stdlib = lambda: json.dumps(db_manager.get_holdings_by_portfolio(portfolio_id),
+                                    sort_keys=True, separators=(',', ':')).encode()
+        cases = [('stdlib, records', stdlib)]
+        if responses.orjson is not None:
+            provider = app.json
+            cases += [
+                ('orjson, records', lambda: provider.dumps_bytes(db_manager.get_holdings_by_portfolio(portfolio_id))),
+                ('orjson, columns', lambda: provider.dumps_bytes(
+                    responses.columnar(*db_manager.get_holding_rows(portfolio_id)))),
+            ]
+        else:
+            print("   (orjson not installed, only the stdlib encoder is measured)")
+        for label, fn in cases:
+            best, median, body = best_time(fn, args.repeat)
+            print(f"{label:<18} {best * 1000:8.1f} ms {median * 1000:8.1f} ms  {len(body):>11,} bytes")
+
+        print("-- serialization only (rows already fetched)")
+        encode_cases = [('stdlib, records', lambda: json.dumps(records, sort_keys=True, separators=(',', ':')).encode())]
+        if responses.orjson is not None:
+            encode_cases += [
+                ('orjson, records', lambda: app.json.dumps_bytes(records)),
+                ('orjson, columns', lambda: app.json.dumps_bytes(responses.columnar(columns, rows))),
+            ]
+        for label, fn in encode_cases:
+            best, median, body = best_time(fn, args.repeat)
+            print(f"{label:<18} {best * 1000:8.1f} ms {median * 1000:8.1f} ms  {len(body):>11,} bytes")
+
+        print("-- bytes on the wire (GET /api/portfolio/<id>)")
+        client = app.test_client()
+        for layout in ('records', 'columns'):
+            for encoding in ('identity', 'gzip', 'deflate'):
+                url = f"/api/portfolio/{portfolio_id}?layout={layout}"
+                best, median, response = best_time(
+                    lambda: client.get(url, headers={'Accept-Encoding': encoding}), args.repeat)
+                body = response.get_data()
+                if encoding == 'gzip':
+                    json.loads(gzip.decompress(body))
+                elif encoding == 'deflate':
+                    json.loads(zlib.decompress(body))
+                print(f"{layout:<8} {encoding:<9} {len(body):>11,} bytes  "
+                      f"{best * 1000:8.1f} ms {median * 1000:8.1f} ms per request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark: portfolio news lookups on a large local news index.
+
+Bulk-loads synthetic articles (default one million) tagged with one to
+three tickers each, with ticker popularity skewed so large caps get most
+of the coverage, then times NewsStore.search for portfolios of different
+sizes: latest articles, latest within 30 days, and a full-text query.
+
+Usage:
+    cd backend
+    python benchmarks/bench_news.py --articles 1000000 --universe 5000 --queries 20
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.news_store import NewsStore  # noqa: E402
+
+WORDS = ("earnings guidance revenue margin upgrade downgrade merger acquisition dividend buyback "
+         "lawsuit recall launch partnership outlook forecast inflation rates tariffs supply chain "
+         "chip cloud ai demand growth decline record quarter analyst rating target layoffs "
+         "expansion regulator approval probe settlement ceo resigns strike shortage").split()
+SOURCES = ("Reuters", "Bloomberg", "CNBC", "WSJ", "MarketWatch", "Barron's")
+
+
+def zipf_cum_weights(n):
+    total, cum_weights = 0.0, []
+    for rank in range(n):
+        total += 1 / (rank + 1)
+        cum_weights.append(total)
+    return cum_weights
+
+
+def generate_articles(count, universe, rng):
+    start = date.today() - timedelta(days=3 * 365)
+    ticker_weights = zipf_cum_weights(len(universe))
+    # Filler vocabulary so full-text terms are about as selective as in real news
+    filler = [f"w{i}" for i in range(20000)]
+    vocabulary = filler[:200] + list(WORDS) + filler[200:]
+    word_weights = zipf_cum_weights(len(vocabulary))
+    for n in range(count):
+        tickers = set(rng.choices(universe, cum_weights=ticker_weights, k=rng.randint(1, 3)))
+        words = rng.choices(vocabulary, cum_weights=word_weights, k=38)
+        yield {
+            'id': str(n),
+            'published_at': (start + timedelta(days=n * 3 * 365 // count)).isoformat(),
+            'title': f"{' '.join(sorted(tickers))} {' '.join(words[:8])}",
+            'summary': ' '.join(words[8:]),
+            'source': rng.choice(SOURCES),
+            'url': f"https://news.example.com/{n}",
+            'tickers': ';'.join(tickers),
+        }
+
+
+def time_queries(store, portfolios, **kwargs):
+    timings = []
+    for tickers in portfolios:
+        started = time.perf_counter()
+        store.search(tickers, **kwargs)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark portfolio news lookups")
+    parser.add_argument('--articles', type=int, default=1000000)
+    parser.add_argument('--universe', type=int, default=5000, help='distinct tickers')
+    parser.add_argument('--queries', type=int, default=20, help='portfolios per size')
+    parser.add_argument('--db', help='keep the generated index at this path')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    rng = random.Random(42)
+    universe = [f"T{i:04d}" for i in range(args.universe)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = NewsStore(args.db or os.path.join(tmp, 'news.db'))
+
+        started = time.perf_counter()
+        loaded = store.load_records(generate_articles(args.articles, universe, rng))
+        elapsed = time.perf_counter() - started
+        print(f"loaded {loaded} articles in {elapsed:.1f} s ({loaded / elapsed:,.0f} articles/s)")
+
+        for size in (10, 50, 500):
+            portfolios = [rng.sample(universe, size) for _ in range(args.queries)]
+            print(f"\n{size}-ticker portfolios (median / max ms)")
+            for label, kwargs in (("latest 20", {}),
+                                  ("latest 20, last 30 days", {'days': 30}),
+                                  ("full-text 'earnings guidance'", {'query': 'earnings guidance'})):
+                median, worst = time_queries(store, portfolios, limit=20, **kwargs)
+                print(f"  {label:32s} {median:8.1f} {worst:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
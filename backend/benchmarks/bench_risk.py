@@ -0,0 +1,81 @@
+"""
+Benchmark: risk metrics for 500-ticker portfolios.
+
+Generates synthetic daily price files for a universe of tickers, then
+times RiskEngine.compute for portfolios drawn from that universe: the
+first portfolio on cold caches, then further portfolios that share most
+of their tickers and reuse cached return columns and covariance.
+
+Usage:
+    cd backend
+    python benchmarks/bench_risk.py --universe 800 --tickers 500 --days 756 --portfolios 10
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.risk import PriceHistoryStore, RiskEngine  # noqa: E402
+
+
+def write_series(data_dir, ticker, dates, returns):
+    closes = 100 * np.cumprod(1 + returns)
+    with open(os.path.join(data_dir, f"{ticker}.csv"), 'w') as file:
+        file.write('date,close\n')
+        file.writelines(f"{d},{c:.4f}\n" for d, c in zip(dates, closes))
+
+
+def write_prices(data_dir, tickers, days, rng):
+    dates = np.arange(np.datetime64('2021-01-04'), np.datetime64('2021-01-04') + days)
+    market = rng.normal(0.0003, 0.01, days)
+    write_series(data_dir, 'SPY', dates, market)
+    for ticker in tickers:
+        beta = rng.uniform(0.5, 1.5)
+        write_series(data_dir, ticker, dates, beta * market + rng.normal(0, 0.015, days))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark portfolio risk metrics")
+    parser.add_argument('--universe', type=int, default=800, help='tickers with price history')
+    parser.add_argument('--tickers', type=int, default=500, help='tickers per portfolio')
+    parser.add_argument('--days', type=int, default=756, help='days of price history')
+    parser.add_argument('--window', type=int, default=252, help='daily returns used')
+    parser.add_argument('--portfolios', type=int, default=10)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    rng = np.random.default_rng(42)
+    universe = [f"T{i:04d}" for i in range(args.universe)]
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_prices(data_dir, universe, args.days, rng)
+        engine = RiskEngine(PriceHistoryStore(data_dir), default_window=args.window)
+
+        timings = []
+        for n in range(args.portfolios):
+            tickers = rng.choice(universe, size=args.tickers, replace=False)
+            holdings = [{'ticker': t, 'shares': float(rng.integers(1, 100)), 'purchase_price': 100.0}
+                        for t in tickers]
+            started = time.perf_counter()
+            risk = engine.compute(holdings)
+            timings.append(time.perf_counter() - started)
+
+        print(f"{args.tickers}-ticker portfolios from a {args.universe}-ticker universe, "
+              f"{args.window}-day window")
+        print(f"first portfolio (cold cache): {timings[0] * 1000:8.1f} ms")
+        if len(timings) > 1:
+            warm = np.array(timings[1:]) * 1000
+            print(f"next {len(warm)} portfolios:      mean {warm.mean():8.1f} ms  max {warm.max():8.1f} ms")
+        print(f"last result: volatility={risk['annualized_volatility']:.4f} "
+              f"beta={risk['beta']:.3f} max_drawdown={risk['max_drawdown']:.4f}")
+
+
+if __name__ == '__main__':
+    main()
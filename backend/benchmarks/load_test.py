@@ -0,0 +1,335 @@
+"""
+Load test: throughput and tail latency per endpoint at increasing concurrency.
+
+Starts the app from create_app on a local port (threaded WSGI server, fresh
+temporary database) unless --url points at a running server, seeds a few
+users with portfolios, then drives a weighted mix of
+
+    upload      POST /api/upload
+    portfolio   GET  /api/portfolio/<id>
+    user        GET  /api/portfolios/user/<user_id>
+    health      GET  /api/health
+
+with N closed-loop clients for each concurrency level. Each level reports
+requests/s and p50/p95/p99 latency and error rate per endpoint; the level
+where throughput stops growing (or p99 passes --slo-ms) is flagged as the
+saturation point. --json saves the results and --baseline compares against
+a saved run, for before/after comparisons of a change.
+
+Usage:
+    cd backend
+    python benchmarks/load_test.py --concurrency 1 4 16 64 --duration 10 \\
+        [--mix upload=1,portfolio=6,user=2,health=1] [--holdings 50] \\
+        [--url http://127.0.0.1:5000] [--json after.json] [--baseline before.json]
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ENDPOINTS = ('upload', 'portfolio', 'user', 'health')
+DEFAULT_MIX = 'upload=1,portfolio=6,user=2,health=1'
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}' (use {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("The mix needs at least one endpoint with a positive weight")
+    return mix
+
+
+def make_csv(holdings):
+    lines = ['ticker,shares,purchase_price,purchase_date']
+    for i in range(holdings):
+        lines.append(f"T{i % 500:03d},{10 + i},{100 + i / 10:.2f},2024-01-15")
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def multipart_body(user_id, file_name, content):
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        f'--{boundary}\r\nContent-Disposition: form-data; name="user_id"\r\n\r\n{user_id}\r\n'.encode(),
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+        f'Content-Type: text/csv\r\n\r\n'.encode(),
+        content,
+        f'\r\n--{boundary}--\r\n'.encode(),
+    ])
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class LoadClient:
+    """
+    Issues requests against one server and tracks the ids it can read back.
+    """
+
+    def __init__(self, base_url, csv_content, users):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.csv_content = csv_content
+        self.users = users
+        self.portfolio_ids = []
+        self._lock = threading.Lock()
+
+    def request(self, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            conn.request(method, self.prefix + path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            payload = response.read()
+            return response.status, payload
+        finally:
+            conn.close()
+
+    def upload(self, rng, user_id=None):
+        user_id = user_id or rng.choice(self.users)
+        body, content_type = multipart_body(user_id, 'load.csv', self.csv_content)
+        status, payload = self.request('POST', '/api/upload', body, {'Content-Type': content_type})
+        if status == 200:
+            with self._lock:
+                self.portfolio_ids.append(json.loads(payload)['portfolio_id'])
+        return status
+
+    def portfolio(self, rng):
+        with self._lock:
+            portfolio_id = rng.choice(self.portfolio_ids)
+        return self.request('GET', f'/api/portfolio/{portfolio_id}')[0]
+
+    def user(self, rng):
+        return self.request('GET', f'/api/portfolios/user/{rng.choice(self.users)}')[0]
+
+    def health(self, rng):
+        return self.request('GET', '/api/health')[0]
+
+
+def run_level(client, mix, concurrency, duration, seed):
+    """
+    Run closed-loop clients for `duration` seconds.
+
+    Returns:
+        Dict: Per-endpoint latencies (seconds), statuses and failures
+    """
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = {name: {'latencies': [], 'statuses': [], 'failures': 0} for name in names}
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+    deadline = [0.0]
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        local = {name: ([], [], [0]) for name in names}
+        barrier.wait()
+        while time.perf_counter() < deadline[0]:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = getattr(client, name)(rng)
+            except Exception:
+                local[name][2][0] += 1
+                continue
+            local[name][0].append(time.perf_counter() - started)
+            local[name][1].append(status)
+        with lock:
+            for name, (latencies, statuses, failures) in local.items():
+                samples[name]['latencies'].extend(latencies)
+                samples[name]['statuses'].extend(statuses)
+                samples[name]['failures'] += failures[0]
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    deadline[0] = time.perf_counter() + duration
+    started = time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    """
+    Reduce raw samples to throughput, latency percentiles and error rates.
+    """
+    report = {}
+    all_latencies = []
+    total_requests = total_errors = 0
+    for name, sample in samples.items():
+        latencies = np.array(sample['latencies'])
+        statuses = np.array(sample['statuses'], dtype=int)
+        requests = len(latencies) + sample['failures']
+        errors = int((statuses >= 400).sum()) + sample['failures']
+        report[name] = {
+            'requests': requests,
+            'rps': requests / elapsed,
+            'error_rate': errors / requests if requests else 0.0,
+            'rejected': int(np.isin(statuses, (429, 503)).sum()),
+            **latency_percentiles(latencies),
+        }
+        all_latencies.append(latencies)
+        total_requests += requests
+        total_errors += errors
+    report['all'] = {
+        'requests': total_requests,
+        'rps': total_requests / elapsed,
+        'error_rate': total_errors / total_requests if total_requests else 0.0,
+        'rejected': sum(entry['rejected'] for entry in report.values()),
+        **latency_percentiles(np.concatenate(all_latencies) if all_latencies else np.array([])),
+    }
+    return report
+
+
+def latency_percentiles(latencies):
+    if not len(latencies):
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99}
+
+
+def format_ms(value):
+    return f"{value:8.1f}" if value is not None else f"{'-':>8}"
+
+
+def print_level(concurrency, report, baseline=None):
+    print(f"\n-- concurrency {concurrency}")
+    print(f"{'endpoint':<10} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'errors':>7} {'shed':>5}" + ('   vs baseline' if baseline else ''))
+    for name, entry in report.items():
+        line = (f"{name:<10} {entry['requests']:>8} {entry['rps']:>8.1f} {format_ms(entry['p50_ms'])} "
+                f"{format_ms(entry['p95_ms'])} {format_ms(entry['p99_ms'])} "
+                f"{entry['error_rate']:>6.1%} {entry['rejected']:>5}")
+        before = (baseline or {}).get(name)
+        if before and before['rps'] and before['p99_ms'] and entry['p99_ms']:
+            line += (f"   req/s {entry['rps'] / before['rps'] - 1:+.0%}, "
+                     f"p99 {entry['p99_ms'] / before['p99_ms'] - 1:+.0%}")
+        print(line)
+
+
+def find_saturation(levels, slo_ms):
+    """
+    Get the first concurrency level past the saturation point.
+
+    That is the first level whose throughput grew by less than 5% over the
+    previous one, or whose overall p99 latency exceeds slo_ms.
+    """
+    previous = None
+    for concurrency, report in levels:
+        overall = report['all']
+        if slo_ms and overall['p99_ms'] is not None and overall['p99_ms'] > slo_ms:
+            return concurrency, f"p99 {overall['p99_ms']:.0f} ms over the {slo_ms:.0f} ms SLO"
+        if previous is not None and overall['rps'] < previous * 1.05:
+            return concurrency, f"throughput {overall['rps']:.1f} req/s vs {previous:.1f} at the previous level"
+        previous = overall['rps']
+    return None, None
+
+
+def start_local_server(db_path, news_db_path):
+    """
+    Start the app on a free local port in a background thread.
+
+    Returns:
+        Tuple[str, BaseWSGIServer]: Base URL and the server
+    """
+    # The database manager is configured from the environment at import time
+    os.environ['CAPTURA_DB_PATH'] = db_path
+    os.environ['CAPTURA_NEWS_DB_PATH'] = news_db_path
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='test a running server instead of starting one in-process')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64],
+                        help='concurrent clients per level')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per level')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='endpoint weights (default: %(default)s)')
+    parser.add_argument('--holdings', type=int, default=50, help='holdings per uploaded CSV')
+    parser.add_argument('--users', type=int, default=20, help='distinct user ids')
+    parser.add_argument('--seed-uploads', type=int, default=2, help='portfolios uploaded per user before the run')
+    parser.add_argument('--slo-ms', type=float, help='p99 latency target used to flag saturation')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare against results saved with --json')
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {level['concurrency']: level['report'] for level in json.load(f)['levels']}
+
+    logging.disable(logging.WARNING)  # per-request logging would dominate the run
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        server = None
+        base_url = args.url
+        if base_url is None:
+            base_url, server = start_local_server(os.path.join(tmp_dir, 'load.db'),
+                                                  os.path.join(tmp_dir, 'news.db'))
+        try:
+            users = [f"load{i}@example.com" for i in range(args.users)]
+            client = LoadClient(base_url, make_csv(args.holdings), users)
+            rng = random.Random(0)
+            for user_id in users:
+                for _ in range(args.seed_uploads):
+                    if client.upload(rng, user_id) != 200:
+                        sys.exit(f"Seeding upload to {base_url} failed")
+
+            print(f"{base_url}  mix {args.mix}  {args.holdings} holdings/upload  {args.duration:g}s per level")
+            levels = []
+            for concurrency in args.concurrency:
+                samples, elapsed = run_level(client, mix, concurrency, args.duration, seed=concurrency)
+                report = summarize(samples, elapsed)
+                levels.append((concurrency, report))
+                print_level(concurrency, report, (baseline or {}).get(concurrency))
+        finally:
+            if server is not None:
+                server.shutdown()
+
+    concurrency, reason = find_saturation(levels, args.slo_ms)
+    if concurrency is None:
+        print("\nNo saturation within the tested concurrency levels")
+    else:
+        print(f"\nSaturated at concurrency {concurrency}: {reason}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'url': args.url,
+                'mix': mix,
+                'holdings': args.holdings,
+                'duration': args.duration,
+                'levels': [{'concurrency': c, 'report': report} for c, report in levels],
+            }, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,4 +3,82 @@ import os
 class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
-    ALLOWED_EXTENSIONS = {'csv'}
+    ALLOWED_EXTENSIONS = {'csv', 'csv.gz', 'csv.bz2', 'csv.xz', 'zip'}
+    MAX_DECOMPRESSED_LENGTH = 256 * 1024 * 1024  # 256MB max size after decompression
+    
+    # Database executor: one writer thread plus a pool of reader threads
+    DB_READER_THREADS = 4
+    DB_MAX_PENDING_READS = 64   # reads queued or running before returning 503
+    DB_MAX_PENDING_WRITES = 64  # writes queued or running before returning 503
+    DB_READ_TIMEOUT = 10        # seconds a request waits for a read
+    DB_WRITE_TIMEOUT = 60       # seconds a request waits for a write
+    
+    # Read-only replica at CAPTURA_DB_REPLICA_PATH, refreshed with paged online backups
+    DB_REPLICA_INTERVAL = 300   # seconds between refreshes; 0 refreshes only on demand
+    DB_REPLICA_READS = os.environ.get('CAPTURA_DB_REPLICA_READS', '0') == '1'  # user portfolio lists and stats
+    DB_BACKUP_PAGES = 1024      # pages copied per backup step
+    DB_BACKUP_PAUSE = 0.005     # seconds slept between steps so the writer is not starved
+    
+    # Upload admission: parse slots, a bounded FIFO wait queue, then 503 (429 per user)
+    UPLOAD_MAX_CONCURRENT_PARSES = 4
+    UPLOAD_MAX_PENDING_BYTES = 64 * 1024 * 1024  # request bytes of running and queued uploads
+    UPLOAD_MAX_QUEUED = 16      # uploads waiting for a slot before rejecting
+    UPLOAD_QUEUE_TIMEOUT = 5    # seconds an upload waits for a slot
+    UPLOAD_MAX_PER_USER = 2     # running and queued uploads per user
+    UPLOAD_RETRY_AFTER = 2      # minimum Retry-After seconds on rejection
+    
+    # CSV validation: stop after this many row errors, and reject files whose
+    # first CSV_PREVALIDATE_ROWS rows are at least this share invalid
+    CSV_MAX_ERRORS = 100
+    CSV_PREVALIDATE_ROWS = 100
+    CSV_PREVALIDATE_MAX_ERROR_RATIO = 0.5
+    
+    # Risk analytics: daily closes as <PRICE_HISTORY_DIR>/<TICKER>.csv (date,close)
+    PRICE_HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'prices')
+    RISK_BENCHMARK = 'SPY'
+    RISK_WINDOW_DAYS = 252
+    RISK_CACHE_BLOCKS = 2  # covariance caches kept, one per (benchmark, window)
+    RISK_CACHE_TICKERS = 2000  # tickers per covariance cache before it is cleared
+    
+    # Tax lots: default matching of inferred sells to lots ('fifo' or 'specific')
+    LOT_METHOD = 'fifo'
+    LOT_REBUILD_INTERVAL = 3600  # seconds between rebuilds (?rebuild=1 or a method change) per user
+    
+    # Chart series: LTTB-downsampled to ?points=N, cached per (series, N)
+    CHART_MAX_POINTS = 5000
+    CHART_CACHE_SIZE = 1024
+    
+    # Local news index (SQLite FTS5), loaded with tools/load_news.py
+    NEWS_DB_PATH = os.environ.get(
+        'CAPTURA_NEWS_DB_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'news.db')
+    )
+    NEWS_DEFAULT_LIMIT = 20
+    NEWS_MAX_LIMIT = 100
+    
+    # Retention purges: portfolios deleted per transaction, pages vacuumed per chunk
+    RETENTION_CHUNK_SIZE = 500
+    RETENTION_VACUUM_PAGES = 2000
+    # POST /api/retention/purge requires X-Captura-Retention: <RETENTION_TOKEN>;
+    # without a token the endpoint is disabled and purges are CLI-only
+    RETENTION_TOKEN = os.environ.get('CAPTURA_RETENTION_TOKEN')
+    
+    # Columnar analytics snapshots of all holdings (tools/snapshot_holdings.py or the schedule)
+    SNAPSHOT_DIR = os.environ.get(
+        'CAPTURA_SNAPSHOT_DIR',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'snapshots')
+    )
+    SNAPSHOT_INTERVAL = 0  # seconds between in-app builds; 0 leaves scheduling to cron
+    SNAPSHOT_KEEP = 3
+    
+    # Request profiling with cProfile, off (no request hooks) unless one is set:
+    # requests sending X-Captura-Profile: <PROFILE_TOKEN>, and PROFILE_SAMPLE_RATE
+    # of all requests. Reading /api/debug/profiles requires the token.
+    PROFILE_TOKEN = os.environ.get('CAPTURA_PROFILE_TOKEN')
+    PROFILE_SAMPLE_RATE = float(os.environ.get('CAPTURA_PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_BUFFER_SIZE = 50  # profiles kept, oldest dropped first
+    
+    # Response compression, negotiated from Accept-Encoding (gzip or deflate)
+    COMPRESS_MIN_SIZE = 1024  # bytes; smaller bodies are sent as is
+    COMPRESS_LEVEL = 6
+    COMPRESS_MIMETYPES = {'application/json', 'text/csv', 'text/plain'}
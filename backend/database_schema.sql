@@ -4,6 +4,10 @@
 -- Enable foreign key constraints
 PRAGMA foreign_keys = ON;
 
+-- Let retention purges return free pages with incremental_vacuum
+-- (must run before the first table is created)
+PRAGMA auto_vacuum = INCREMENTAL;
+
 -- =============================================
 -- PORTFOLIOS TABLE
 -- =============================================
@@ -15,6 +19,25 @@ CREATE TABLE portfolios (
     file_name TEXT NOT NULL                -- Original filename of the uploaded CSV
 );
 
+-- =============================================
+-- TICKERS TABLE
+-- =============================================
+-- One row per stock symbol, referenced from holdings by integer id
+CREATE TABLE tickers (
+    id INTEGER PRIMARY KEY,                -- Unique identifier for each ticker
+    symbol TEXT NOT NULL UNIQUE,           -- Stock symbol (e.g., 'AAPL', 'MSFT')
+    company_name TEXT                      -- Company name, when an upload provided one
+);
+
+-- =============================================
+-- SECTORS TABLE
+-- =============================================
+-- Sector names from uploads, matched case-insensitively
+CREATE TABLE sectors (
+    id INTEGER PRIMARY KEY,                -- Unique identifier for each sector
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE  -- Sector name (e.g., 'Technology')
+);
+
 -- =============================================
 -- HOLDINGS TABLE
 -- =============================================
@@ -22,16 +45,101 @@ CREATE TABLE portfolios (
 CREATE TABLE holdings (
     id INTEGER PRIMARY KEY AUTOINCREMENT,  -- Unique identifier for each holding
     portfolio_id INTEGER NOT NULL,         -- Foreign key reference to portfolios table
-    ticker TEXT NOT NULL,                  -- Stock symbol (e.g., 'AAPL', 'MSFT')
+    ticker_id INTEGER NOT NULL,            -- Foreign key reference to tickers table
     shares REAL NOT NULL,                  -- Number of shares owned (allows fractional shares)
     purchase_price REAL NOT NULL,          -- Price per share when purchased
     purchase_date DATE,                    -- Date when the shares were purchased
+    sector_id INTEGER,                     -- Foreign key reference to sectors table (optional)
+    notes TEXT,                            -- Free-form notes from the upload (optional)
     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,  -- When this holding record was created
     
+    -- Foreign key constraints
+    FOREIGN KEY (portfolio_id) REFERENCES portfolios(id) ON DELETE CASCADE,
+    FOREIGN KEY (ticker_id) REFERENCES tickers(id),
+    FOREIGN KEY (sector_id) REFERENCES sectors(id)
+);
+
+-- =============================================
+-- PORTFOLIO DIGESTS TABLE
+-- =============================================
+-- Compact precomputed summary of each portfolio, built once at ingest time
+CREATE TABLE portfolio_digests (
+    portfolio_id INTEGER PRIMARY KEY,      -- Portfolio this digest summarizes
+    digest TEXT NOT NULL,                  -- JSON summary (top positions, concentration, sectors, ...)
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,  -- When the digest was built
+    
     -- Foreign key constraint
     FOREIGN KEY (portfolio_id) REFERENCES portfolios(id) ON DELETE CASCADE
 );
 
+-- =============================================
+-- LOTS TABLE
+-- =============================================
+-- Tax lots reconstructed from a user's successive uploads
+CREATE TABLE lots (
+    id INTEGER PRIMARY KEY,                -- Unique identifier for each lot
+    user_id TEXT NOT NULL,                 -- Owner of the lot
+    ticker_id INTEGER NOT NULL,            -- Foreign key reference to tickers table
+    purchase_date DATE,                    -- Purchase date as uploaded (matches the lot across uploads)
+    acquired_date DATE NOT NULL,           -- Purchase date, or the upload date when none was given
+    cost_per_share REAL NOT NULL,          -- Purchase price per share
+    shares REAL NOT NULL,                  -- Shares acquired
+    remaining REAL NOT NULL,               -- Shares not sold yet
+    portfolio_id INTEGER NOT NULL,         -- Upload the lot first appeared in
+    
+    -- Foreign key constraint
+    FOREIGN KEY (ticker_id) REFERENCES tickers(id)
+);
+
+-- =============================================
+-- REALIZED GAINS TABLE
+-- =============================================
+-- Sales inferred between uploads, matched to lots FIFO or by specific lot
+CREATE TABLE realized_gains (
+    id INTEGER PRIMARY KEY,                -- Unique identifier for each sale
+    user_id TEXT NOT NULL,                 -- Owner of the lot
+    lot_id INTEGER NOT NULL,               -- Foreign key reference to lots table
+    portfolio_id INTEGER NOT NULL,         -- Upload the sale was inferred from
+    sale_date DATE NOT NULL,               -- Date of that upload
+    shares REAL NOT NULL,                  -- Shares sold from the lot
+    cost_basis REAL NOT NULL,              -- shares * cost_per_share
+    proceeds REAL,                         -- shares * close on the sale date (NULL without price history)
+    gain REAL,                             -- proceeds - cost_basis
+    term TEXT NOT NULL,                    -- 'short' or 'long' (held over 365 days)
+    
+    -- Foreign key constraint
+    FOREIGN KEY (lot_id) REFERENCES lots(id) ON DELETE CASCADE
+);
+
+-- =============================================
+-- LOT STATE TABLE
+-- =============================================
+-- Last upload applied to each user's lots, so only newer uploads are processed
+CREATE TABLE lot_state (
+    user_id TEXT PRIMARY KEY,              -- User the lots belong to
+    method TEXT NOT NULL,                  -- 'fifo' or 'specific'
+    last_upload_date DATETIME NOT NULL,    -- upload_date of the last processed portfolio
+    last_portfolio_id INTEGER NOT NULL,    -- Last processed portfolio
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,  -- When lots were last updated
+    rebuilt_at DATETIME                    -- When lots were last rebuilt from the first upload
+);
+
+-- =============================================
+-- LOT POSITIONS TABLE
+-- =============================================
+-- Positions of the last upload applied to each user's lots. The next upload
+-- is compared with these, so purging that upload does not lose them
+CREATE TABLE lot_positions (
+    user_id TEXT NOT NULL,                 -- User the lots belong to
+    ticker_id INTEGER NOT NULL,            -- Foreign key reference to tickers table
+    purchase_date TEXT NOT NULL,           -- Purchase date as uploaded ('' when none was given)
+    price REAL NOT NULL,                   -- Purchase price, rounded to 6 decimals
+    shares REAL NOT NULL,                  -- Shares at this date and price
+    
+    PRIMARY KEY (user_id, ticker_id, purchase_date, price),
+    FOREIGN KEY (ticker_id) REFERENCES tickers(id)
+);
+
 -- =============================================
 -- INDEXES FOR PERFORMANCE
 -- =============================================
@@ -42,15 +150,23 @@ CREATE INDEX idx_portfolios_user_id ON portfolios(user_id);
 -- Index on upload_date for chronological portfolio queries
 CREATE INDEX idx_portfolios_upload_date ON portfolios(upload_date);
 
--- Index on portfolio_id for fast holdings lookups
-CREATE INDEX idx_holdings_portfolio_id ON holdings(portfolio_id);
+-- Index on portfolio_id for fast holdings lookups, covering the sector and
+-- ticker allocation rollups
+CREATE INDEX idx_holdings_allocation ON holdings(portfolio_id, sector_id, ticker_id, shares, purchase_price);
 
--- Index on ticker for stock-specific queries
-CREATE INDEX idx_holdings_ticker ON holdings(ticker);
+-- Index on ticker_id for stock-specific queries
+CREATE INDEX idx_holdings_ticker_id ON holdings(ticker_id);
 
 -- Index on purchase_date for date-based queries
 CREATE INDEX idx_holdings_purchase_date ON holdings(purchase_date);
 
+-- Index on open lots in FIFO order
+CREATE INDEX idx_lots_open ON lots(user_id, acquired_date, id) WHERE remaining > 0;
+
+-- Indexes on realized gains by user and by lot
+CREATE INDEX idx_realized_gains_user ON realized_gains(user_id, sale_date);
+CREATE INDEX idx_realized_gains_lot ON realized_gains(lot_id);
+
 -- =============================================
 -- SAMPLE DATA (OPTIONAL - FOR TESTING)
 -- =============================================
@@ -58,14 +174,28 @@ CREATE INDEX idx_holdings_purchase_date ON holdings(purchase_date);
 -- Insert a sample portfolio
 INSERT INTO portfolios (user_id, file_name) VALUES ('user@example.com', 'my_portfolio.csv');
 
+-- Insert the sample tickers
+INSERT INTO tickers (id, symbol) VALUES
+(1, 'AAPL'),
+(2, 'MSFT'),
+(3, 'GOOGL'),
+(4, 'TSLA'),
+(5, 'AMZN'),
+(6, 'NVDA');
+
+-- Insert the sample sectors
+INSERT INTO sectors (id, name) VALUES
+(1, 'Technology'),
+(2, 'Consumer Discretionary');
+
 -- Insert sample holdings for the portfolio
-INSERT INTO holdings (portfolio_id, ticker, shares, purchase_price, purchase_date) VALUES
-(1, 'AAPL', 50, 175.43, '2024-01-15'),
-(1, 'MSFT', 30, 378.85, '2024-01-20'),
-(1, 'GOOGL', 20, 142.56, '2024-02-01'),
-(1, 'TSLA', 15, 248.50, '2024-02-10'),
-(1, 'AMZN', 25, 155.30, '2024-02-15'),
-(1, 'NVDA', 10, 875.20, '2024-02-20');
+INSERT INTO holdings (portfolio_id, ticker_id, shares, purchase_price, purchase_date, sector_id) VALUES
+(1, 1, 50, 175.43, '2024-01-15', 1),
+(1, 2, 30, 378.85, '2024-01-20', 1),
+(1, 3, 20, 142.56, '2024-02-01', 1),
+(1, 4, 15, 248.50, '2024-02-10', 2),
+(1, 5, 25, 155.30, '2024-02-15', 2),
+(1, 6, 10, 875.20, '2024-02-20', 1);
 
 -- =============================================
 -- USEFUL QUERIES
@@ -75,8 +205,9 @@ INSERT INTO holdings (portfolio_id, ticker, shares, purchase_price, purchase_dat
 -- SELECT * FROM portfolios WHERE user_id = 'user@example.com' ORDER BY upload_date DESC;
 
 -- Get all holdings for a specific portfolio
--- SELECT h.*, p.file_name, p.upload_date 
+-- SELECT h.*, t.symbol AS ticker, p.file_name, p.upload_date 
 -- FROM holdings h 
+-- JOIN tickers t ON t.id = h.ticker_id
 -- JOIN portfolios p ON h.portfolio_id = p.id 
 -- WHERE p.id = 1;
 
@@ -92,10 +223,20 @@ INSERT INTO holdings (portfolio_id, ticker, shares, purchase_price, purchase_dat
 -- WHERE p.user_id = 'user@example.com'
 -- GROUP BY p.id, p.file_name, p.upload_date;
 
+-- Get sector weights of a portfolio
+-- SELECT COALESCE(s.name, 'Unclassified') AS sector,
+--     SUM(h.shares * h.purchase_price) / SUM(SUM(h.shares * h.purchase_price)) OVER () AS weight
+-- FROM holdings h
+-- LEFT JOIN sectors s ON s.id = h.sector_id
+-- WHERE h.portfolio_id = 1
+-- GROUP BY h.sector_id
+-- ORDER BY weight DESC;
+
 -- Get holdings by ticker across all portfolios
--- SELECT ticker, SUM(shares) as total_shares, AVG(purchase_price) as avg_price
+-- SELECT t.symbol, SUM(h.shares) as total_shares, AVG(h.purchase_price) as avg_price
 -- FROM holdings h
 -- JOIN portfolios p ON h.portfolio_id = p.id
+-- JOIN tickers t ON t.id = h.ticker_id
 -- WHERE p.user_id = 'user@example.com'
--- GROUP BY ticker
+-- GROUP BY h.ticker_id
 -- ORDER BY total_shares DESC;
@@ -1,10 +1,25 @@
 import os
+import hmac
 import logging
-from flask import Blueprint, jsonify, request, current_app
+from datetime import datetime
+from flask import Blueprint, jsonify, request, current_app, Response, stream_with_context
 from werkzeug.utils import secure_filename
-from utils.csv_parser import parse_portfolio_csv
-from utils.database import insert_portfolio, insert_holdings, get_portfolio_by_id, get_holdings_by_portfolio, get_portfolio_summary
-from utils.file_utils import allowed_file
+from utils.csv_parser import parse_portfolio_csv_stream
+from utils.database import get_portfolio_by_id, get_portfolio_digest, save_portfolio_digest, get_holdings_by_portfolio, get_holding_rows, get_portfolio_tickers, get_portfolio_summary, get_portfolio_allocation, get_user_allocation, plan_user_lots, sync_user_lots, get_user_lots, iter_holdings_export, purge_portfolios, DatabaseManager
+from utils.export_utils import EXPORT_FORMATS, export_chunks
+from utils.file_utils import allowed_file, open_upload_stream, UploadDecompressionError, DecompressedSizeError
+from utils.db_executor import run_read, run_write, run_ingest, get_db_executor, ExecutorSaturatedError
+from utils.admission import get_upload_admission, AdmissionRejectedError
+from utils.digest import build_portfolio_digest, DIGEST_VERSION
+from utils.risk import get_risk_engine, validate_ticker, PriceHistoryError, InvalidTickerError
+from utils.charts import get_chart_service
+from utils.news_store import get_news_store, NewsQueryError
+from utils.snapshot import get_snapshot_service, SnapshotQueryError
+from utils.profiling import get_profiler
+from utils.replica import get_replica
+from utils.responses import columnar
+from utils.lots import validate_method, LotMethodError, LotRebuildThrottledError, LotSyncConflictError
+from concurrent.futures import TimeoutError as DatabaseTimeoutError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,13 +31,62 @@ api_bp = Blueprint('api', __name__)
 def hello():
     return jsonify({"message": "Hello from Flask backend!"})
 
+def _load_portfolio(portfolio_id, columnar_holdings=False):
+    """
+    Load a portfolio with its holdings and summary. Runs on a database reader thread.
+    
+    With columnar_holdings the holdings are returned in the columnar layout.
+    Returns None if the portfolio does not exist.
+    """
+    portfolio = get_portfolio_by_id(portfolio_id)
+    if not portfolio:
+        return None
+    
+    if columnar_holdings:
+        holdings = columnar(*get_holding_rows(portfolio_id))
+    else:
+        holdings = get_holdings_by_portfolio(portfolio_id)
+    summary = get_portfolio_summary(portfolio_id)
+    return portfolio, holdings, summary
+
+def _load_holdings(portfolio_id):
+    """
+    Load a portfolio's holdings. Runs on a database reader thread.
+    
+    Returns None if the portfolio does not exist.
+    """
+    if not get_portfolio_by_id(portfolio_id):
+        return None
+    return get_holdings_by_portfolio(portfolio_id)
+
+def _build_digest(holdings):
+    """
+    Build a portfolio digest, pricing positions from the local price history.
+    
+    Returns None if the digest cannot be built; it is then built on first read.
+    """
+    try:
+        return build_portfolio_digest(holdings, get_risk_engine().prices.latest_close)
+    except Exception as e:
+        logger.error(f"Failed to build portfolio digest: {str(e)}")
+        return None
+
 @api_bp.route("/upload", methods=['POST'])
 def upload_portfolio():
     """
     Upload and process portfolio CSV file.
     Parses CSV, validates data, and saves to database.
+    
+    Uploads are admitted to a bounded number of parse slots; when the wait
+    queue is full the request gets 503 (429 past the per-user cap) with a
+    Retry-After header.
     """
     try:
+        # Fail fast while the upload queue is full, before reading the body
+        admission = get_upload_admission()
+        request_bytes = request.content_length or 0
+        admission.check(request_bytes)
+        
         # Validate file presence
         if 'file' not in request.files:
             logger.warning("Upload request missing file")
@@ -36,7 +100,7 @@ def upload_portfolio():
         
         if not allowed_file(file.filename):
             logger.warning(f"Invalid file type uploaded: {file.filename}")
-            return jsonify({"error": "Invalid file type. Only CSV files are allowed"}), 400
+            return jsonify({"error": "Invalid file type. Only CSV files (optionally .gz, .bz2, .xz or .zip compressed) are allowed"}), 400
         
         # Get user ID from request (default to 'anonymous' if not provided)
         user_id = request.form.get('user_id', 'anonymous')
@@ -44,51 +108,70 @@ def upload_portfolio():
         
         logger.info(f"Processing upload for user {user_id}: {filename}")
         
-        # Read file content
-        try:
-            csv_content = file.read().decode('utf-8')
-        except UnicodeDecodeError:
-            logger.error(f"Failed to decode file {filename} as UTF-8")
-            return jsonify({"error": "File encoding error. Please ensure the file is UTF-8 encoded"}), 400
-        
-        # Parse CSV using new parser
-        logger.info(f"Parsing CSV content for {filename}")
-        parse_result = parse_portfolio_csv(csv_content, filename)
-        
-        # Check for parsing errors
-        if not parse_result['success']:
-            logger.error(f"CSV parsing failed for {filename}: {parse_result['errors']}")
-            return jsonify({
-                "error": "CSV validation failed",
-                "details": parse_result['errors'],
-                "warnings": parse_result['warnings']
-            }), 400
-        
-        # Save to database
-        try:
-            logger.info(f"Inserting portfolio for user {user_id}")
-            portfolio_id = insert_portfolio(user_id, filename)
+        # Parse and ingest in one of the bounded upload slots
+        with admission.admit(user_id, request_bytes):
+            # Stream (and decompress) file content straight into the parser
+            try:
+                csv_stream = open_upload_stream(file, filename, current_app.config['MAX_DECOMPRESSED_LENGTH'])
+                try:
+                    logger.info(f"Parsing CSV content for {filename}")
+                    parse_result = parse_portfolio_csv_stream(
+                        csv_stream, filename,
+                        max_errors=current_app.config['CSV_MAX_ERRORS'],
+                        prevalidate_rows=current_app.config['CSV_PREVALIDATE_ROWS'],
+                        prevalidate_max_error_ratio=current_app.config['CSV_PREVALIDATE_MAX_ERROR_RATIO']
+                    )
+                finally:
+                    csv_stream.close()
+            except UnicodeDecodeError:
+                logger.error(f"Failed to decode file {filename} as UTF-8")
+                return jsonify({"error": "File encoding error. Please ensure the file is UTF-8 encoded"}), 400
+            except DecompressedSizeError as size_error:
+                logger.warning(f"Upload {filename} rejected: {str(size_error)}")
+                return jsonify({"error": "Decompressed file too large"}), 413
+            except UploadDecompressionError as decompress_error:
+                logger.error(f"Failed to decompress {filename}: {str(decompress_error)}")
+                return jsonify({"error": str(decompress_error)}), 400
             
-            logger.info(f"Inserting {len(parse_result['data'])} holdings for portfolio {portfolio_id}")
-            holdings_count = insert_holdings(portfolio_id, parse_result['data'])
+            # Check for parsing errors
+            if not parse_result['success']:
+                logger.error(f"CSV parsing failed for {filename}: {parse_result['errors']}")
+                return jsonify({
+                    "error": "CSV validation failed",
+                    "details": parse_result['errors'],
+                    "warnings": parse_result['warnings'],
+                    "aborted": parse_result['aborted']
+                }), 400
             
-            logger.info(f"Successfully processed portfolio {portfolio_id} with {holdings_count} holdings")
+            # Build the advisor digest once, while the parsed holdings are at hand
+            digest = _build_digest(parse_result['data'])
             
-            return jsonify({
-                "message": "Portfolio uploaded and processed successfully",
-                "portfolio_id": portfolio_id,
-                "filename": filename,
-                "holdings_count": holdings_count,
-                "warnings": parse_result['warnings'] if parse_result['warnings'] else None
-            }), 200
+            # Save to database
+            try:
+                logger.info(f"Ingesting portfolio for user {user_id} with {len(parse_result['data'])} holdings")
+                portfolio_id, holdings_count = run_ingest(user_id, filename, parse_result['data'], digest)
+                
+                logger.info(f"Successfully processed portfolio {portfolio_id} with {holdings_count} holdings")
+                
+                return jsonify({
+                    "message": "Portfolio uploaded and processed successfully",
+                    "portfolio_id": portfolio_id,
+                    "filename": filename,
+                    "holdings_count": holdings_count,
+                    "warnings": parse_result['warnings'] if parse_result['warnings'] else None
+                }), 200
+                
+            except (ExecutorSaturatedError, DatabaseTimeoutError):
+                raise
+            except Exception as db_error:
+                logger.error(f"Database error during portfolio insertion: {str(db_error)}")
+                return jsonify({
+                    "error": "Failed to save portfolio to database",
+                    "details": str(db_error)
+                }), 500
             
-        except Exception as db_error:
-            logger.error(f"Database error during portfolio insertion: {str(db_error)}")
-            return jsonify({
-                "error": "Failed to save portfolio to database",
-                "details": str(db_error)
-            }), 500
-        
+    except (ExecutorSaturatedError, DatabaseTimeoutError, AdmissionRejectedError):
+        raise
     except Exception as e:
         logger.error(f"Unexpected error during upload: {str(e)}")
         return jsonify({"error": f"Upload failed: {str(e)}"}), 500
@@ -97,31 +180,37 @@ def upload_portfolio():
 def get_portfolio(portfolio_id):
     """
     Get portfolio data with holdings by portfolio ID.
+    
+    With ?layout=columns holdings are sent as {"columns": [...], "rows": [[...]]},
+    which is smaller and faster to build for large portfolios.
     """
     try:
+        layout = request.args.get('layout', 'records')
+        if layout not in ('records', 'columns'):
+            return jsonify({"error": "layout must be 'records' or 'columns'"}), 400
+        
         logger.info(f"Fetching portfolio {portfolio_id}")
         
-        # Get portfolio information
-        portfolio = get_portfolio_by_id(portfolio_id)
-        if not portfolio:
+        # Get portfolio information, holdings and summary
+        result = run_read(_load_portfolio, portfolio_id, layout == 'columns')
+        if not result:
             logger.warning(f"Portfolio {portfolio_id} not found")
             return jsonify({"error": "Portfolio not found"}), 404
         
-        # Get holdings for the portfolio
-        holdings = get_holdings_by_portfolio(portfolio_id)
-        
-        # Get portfolio summary
-        summary = get_portfolio_summary(portfolio_id)
+        portfolio, holdings, summary = result
+        holdings_count = len(holdings['rows']) if layout == 'columns' else len(holdings)
         
-        logger.info(f"Successfully retrieved portfolio {portfolio_id} with {len(holdings)} holdings")
+        logger.info(f"Successfully retrieved portfolio {portfolio_id} with {holdings_count} holdings")
         
         return jsonify({
             "portfolio": portfolio,
             "holdings": holdings,
             "summary": summary,
-            "holdings_count": len(holdings)
+            "holdings_count": holdings_count
         }), 200
         
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
     except Exception as e:
         logger.error(f"Error fetching portfolio {portfolio_id}: {str(e)}")
         return jsonify({"error": f"Failed to fetch portfolio: {str(e)}"}), 500
@@ -135,7 +224,7 @@ def get_user_portfolios(user_id):
         logger.info(f"Fetching portfolios for user {user_id}")
         
         from utils.database import get_portfolios_by_user
-        portfolios = get_portfolios_by_user(user_id)
+        portfolios = run_read(get_portfolios_by_user, user_id, current_app.config['DB_REPLICA_READS'])
         
         logger.info(f"Successfully retrieved {len(portfolios)} portfolios for user {user_id}")
         
@@ -145,18 +234,603 @@ def get_user_portfolios(user_id):
             "count": len(portfolios)
         }), 200
         
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
     except Exception as e:
         logger.error(f"Error fetching portfolios for user {user_id}: {str(e)}")
         return jsonify({"error": f"Failed to fetch portfolios: {str(e)}"}), 500
 
+def _export_response(base_name, portfolio_id=None, user_id=None):
+    """
+    Build a streaming export response from the request's query parameters.
+    
+    Supports ?format=csv|ndjson and ?compression=gzip. The export reads its
+    cursor on the response thread, outside the reader pool, but holds a
+    read slot until the stream ends, so a saturated executor rejects it.
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unsupported export format. Use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    compression = request.args.get('compression', 'none').lower()
+    if compression not in ('none', 'gzip'):
+        return jsonify({"error": "Unsupported compression. Use 'gzip' or 'none'"}), 400
+    compress = compression == 'gzip'
+    
+    batches = iter_holdings_export(portfolio_id=portfolio_id, user_id=user_id)
+    chunks = get_db_executor().stream_read(
+        export_chunks(DatabaseManager.EXPORT_COLUMNS, batches, export_format, compress)
+    )
+    
+    download_name = secure_filename(f"{base_name}.{export_format}") or f"export.{export_format}"
+    mimetype = EXPORT_FORMATS[export_format]
+    if compress:
+        download_name += '.gz'
+        mimetype = 'application/gzip'
+    
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={download_name}"}
+    )
+
+@api_bp.route("/portfolio/<int:portfolio_id>/export", methods=['GET'])
+def export_portfolio(portfolio_id):
+    """
+    Stream all holdings of a portfolio as CSV or NDJSON.
+    """
+    try:
+        portfolio = run_read(get_portfolio_by_id, portfolio_id)
+        if not portfolio:
+            logger.warning(f"Portfolio {portfolio_id} not found for export")
+            return jsonify({"error": "Portfolio not found"}), 404
+        
+        logger.info(f"Exporting portfolio {portfolio_id}")
+        return _export_response(f"portfolio_{portfolio_id}", portfolio_id=portfolio_id)
+        
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Error exporting portfolio {portfolio_id}: {str(e)}")
+        return jsonify({"error": f"Failed to export portfolio: {str(e)}"}), 500
+
+@api_bp.route("/users/<user_id>/export", methods=['GET'])
+def export_user_holdings(user_id):
+    """
+    Stream holdings across all of a user's portfolios as CSV or NDJSON.
+    """
+    try:
+        logger.info(f"Exporting holdings for user {user_id}")
+        return _export_response(f"{user_id}_holdings", user_id=user_id)
+        
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Error exporting holdings for user {user_id}: {str(e)}")
+        return jsonify({"error": f"Failed to export holdings: {str(e)}"}), 500
+
+@api_bp.route("/export", methods=['GET'])
+def export_all_holdings():
+    """
+    Stream every holding in the database as CSV or NDJSON.
+    """
+    try:
+        logger.info("Exporting all holdings")
+        return _export_response("all_holdings")
+        
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Error exporting all holdings: {str(e)}")
+        return jsonify({"error": f"Failed to export holdings: {str(e)}"}), 500
+
+@api_bp.route("/portfolio/<int:portfolio_id>/risk", methods=['GET'])
+def get_portfolio_risk(portfolio_id):
+    """
+    Get risk metrics for a portfolio from local daily price history.
+    
+    Query parameters: benchmark (ticker), window (daily returns), correlation (0/1).
+    """
+    try:
+        benchmark = request.args.get('benchmark')
+        if benchmark is not None:
+            benchmark = validate_ticker(benchmark)
+        window = request.args.get('window', type=int)
+        if window is not None and not 2 <= window <= 10000:
+            return jsonify({"error": "window must be between 2 and 10000 days"}), 400
+        include_correlation = request.args.get('correlation', '1') not in ('0', 'false', 'no')
+        
+        logger.info(f"Computing risk for portfolio {portfolio_id}")
+        
+        holdings = run_read(_load_holdings, portfolio_id)
+        if holdings is None:
+            logger.warning(f"Portfolio {portfolio_id} not found")
+            return jsonify({"error": "Portfolio not found"}), 404
+        
+        risk = get_risk_engine().compute(holdings, benchmark, window, include_correlation)
+        
+        return jsonify({
+            "portfolio_id": portfolio_id,
+            "risk": risk
+        }), 200
+        
+    except InvalidTickerError as e:
+        return jsonify({"error": f"Invalid benchmark: {str(e)}"}), 400
+    except PriceHistoryError as e:
+        logger.warning(f"Risk unavailable for portfolio {portfolio_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Error computing risk for portfolio {portfolio_id}: {str(e)}")
+        return jsonify({"error": f"Failed to compute risk: {str(e)}"}), 500
+
+@api_bp.route("/portfolio/<int:portfolio_id>/digest", methods=['GET'])
+def get_digest(portfolio_id):
+    """
+    Get the compact precomputed digest of a portfolio for the advisor chat.
+    
+    Digests are built at upload time; portfolios uploaded before digests
+    existed, or whose digest predates DIGEST_VERSION, get theirs built and
+    stored on first request.
+    """
+    try:
+        digest = run_read(get_portfolio_digest, portfolio_id)
+        
+        if digest is None or digest.get('version') != DIGEST_VERSION:
+            holdings = run_read(_load_holdings, portfolio_id)
+            if holdings is None:
+                logger.warning(f"Portfolio {portfolio_id} not found")
+                return jsonify({"error": "Portfolio not found"}), 404
+            
+            logger.info(f"Building missing or outdated digest for portfolio {portfolio_id}")
+            digest = _build_digest(holdings)
+            if digest is None:
+                return jsonify({"error": "Failed to build portfolio digest"}), 500
+            run_write(save_portfolio_digest, portfolio_id, digest)
+        
+        return jsonify({
+            "portfolio_id": portfolio_id,
+            "digest": digest
+        }), 200
+        
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching digest for portfolio {portfolio_id}: {str(e)}")
+        return jsonify({"error": f"Failed to fetch digest: {str(e)}"}), 500
+
+@api_bp.route("/portfolio/<int:portfolio_id>/allocation", methods=['GET'])
+def get_allocation(portfolio_id):
+    """
+    Get a portfolio's cost-basis weights by sector and by ticker.
+    """
+    try:
+        allocation = run_read(get_portfolio_allocation, portfolio_id)
+        if allocation is None:
+            logger.warning(f"Portfolio {portfolio_id} not found")
+            return jsonify({"error": "Portfolio not found"}), 404
+        
+        return jsonify(allocation), 200
+        
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching allocation for portfolio {portfolio_id}: {str(e)}")
+        return jsonify({"error": f"Failed to fetch allocation: {str(e)}"}), 500
+
+@api_bp.route("/users/<user_id>/allocation", methods=['GET'])
+def get_user_allocation_rollup(user_id):
+    """
+    Get cost-basis weights by sector and by ticker across all of a user's portfolios.
+    """
+    try:
+        allocation = run_read(get_user_allocation, user_id)
+        return jsonify(allocation), 200
+        
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching allocation for user {user_id}: {str(e)}")
+        return jsonify({"error": f"Failed to fetch allocation: {str(e)}"}), 500
+
+@api_bp.route("/users/<user_id>/lots", methods=['GET'])
+def get_lots(user_id):
+    """
+    Get a user's tax lots and realized gains across their uploads.
+    
+    Uploads not applied yet (normally just the newest) are processed first.
+    Query parameters: method (fifo or specific), rebuild (1 to start over).
+    Rebuilds, including method changes, are allowed once per
+    LOT_REBUILD_INTERVAL per user.
+    """
+    try:
+        method = request.args.get('method', current_app.config['LOT_METHOD']).lower()
+        rebuild = request.args.get('rebuild', '0') in ('1', 'true', 'yes')
+        validate_method(method)
+        
+        plan = run_read(plan_user_lots, user_id, method, rebuild, current_app.config['LOT_REBUILD_INTERVAL'])
+        # Price the sales from the price files here, not on the writer thread
+        prices = get_risk_engine().prices
+        closes = {(ticker, day): prices.close_on(ticker, day) for ticker, day in plan['sales']}
+        sync = run_write(sync_user_lots, user_id, method, lambda ticker, day: closes.get((ticker, day)),
+                         plan['rebuild'], plan['through'])
+        lots = run_read(get_user_lots, user_id)
+        
+        return jsonify({**lots, "processed_uploads": sync['processed_uploads']}), 200
+        
+    except LotMethodError as e:
+        return jsonify({"error": str(e)}), 400
+    except LotRebuildThrottledError as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    except LotSyncConflictError as e:
+        return jsonify({"error": str(e)}), 409
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching lots for user {user_id}: {str(e)}")
+        return jsonify({"error": f"Failed to fetch lots: {str(e)}"}), 500
+
+def _chart_args():
+    """
+    Parse the points/start/end query parameters of chart endpoints.
+    
+    Returns:
+        Tuple[Optional[int], Optional[str], Optional[str]]: (points, start, end)
+    
+    Raises:
+        ValueError: If a parameter is invalid
+    """
+    max_points = current_app.config['CHART_MAX_POINTS']
+    points = request.args.get('points', type=int)
+    if points is not None and not 3 <= points <= max_points:
+        raise ValueError(f"points must be between 3 and {max_points}")
+    
+    dates = []
+    for name in ('start', 'end'):
+        value = request.args.get(name)
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f"{name} must be a YYYY-MM-DD date")
+        dates.append(value or None)
+    
+    return points, dates[0], dates[1]
+
+@api_bp.route("/tickers/<ticker>/history", methods=['GET'])
+def get_ticker_history(ticker):
+    """
+    Get a ticker's daily closes for charts and sparklines.
+    
+    Query parameters: points (downsample to at most N points), start, end.
+    """
+    try:
+        points, start, end = _chart_args()
+        ticker = validate_ticker(ticker)
+        
+        history = get_chart_service().ticker_history(ticker, points, start, end)
+        
+        return jsonify(history), 200
+    
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except PriceHistoryError as e:
+        logger.warning(str(e))
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error fetching history for {ticker}: {str(e)}")
+        return jsonify({"error": f"Failed to fetch price history: {str(e)}"}), 500
+
+@api_bp.route("/portfolio/<int:portfolio_id>/history", methods=['GET'])
+def get_portfolio_history(portfolio_id):
+    """
+    Get a portfolio's daily market value for the investment chart.
+    
+    Query parameters: points (downsample to at most N points), start, end.
+    """
+    try:
+        points, start, end = _chart_args()
+        
+        holdings = run_read(_load_holdings, portfolio_id)
+        if holdings is None:
+            logger.warning(f"Portfolio {portfolio_id} not found")
+            return jsonify({"error": "Portfolio not found"}), 404
+        
+        history = get_chart_service().portfolio_history(portfolio_id, holdings, points, start, end)
+        
+        return jsonify(history), 200
+    
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching history for portfolio {portfolio_id}: {str(e)}")
+        return jsonify({"error": f"Failed to fetch portfolio history: {str(e)}"}), 500
+
+@api_bp.route("/portfolio/<int:portfolio_id>/news", methods=['GET'])
+def get_portfolio_news(portfolio_id):
+    """
+    Get recent news for the tickers held in a portfolio.
+    
+    Query parameters: limit, days (published within), q (full-text query;
+    results are then ranked by relevance instead of recency).
+    """
+    try:
+        limit = request.args.get('limit', current_app.config['NEWS_DEFAULT_LIMIT'], type=int)
+        if not 1 <= limit <= current_app.config['NEWS_MAX_LIMIT']:
+            return jsonify({"error": f"limit must be between 1 and {current_app.config['NEWS_MAX_LIMIT']}"}), 400
+        days = request.args.get('days', type=int)
+        if days is not None and days < 1:
+            return jsonify({"error": "days must be positive"}), 400
+        query = request.args.get('q', '').strip() or None
+        
+        tickers = run_read(get_portfolio_tickers, portfolio_id)
+        if tickers is None:
+            logger.warning(f"Portfolio {portfolio_id} not found")
+            return jsonify({"error": "Portfolio not found"}), 404
+        
+        articles = run_read(get_news_store().search, tickers, query, limit, days)
+        
+        return jsonify({
+            "portfolio_id": portfolio_id,
+            "tickers": tickers,
+            "articles": articles,
+            "count": len(articles)
+        }), 200
+    
+    except NewsQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching news for portfolio {portfolio_id}: {str(e)}")
+        return jsonify({"error": f"Failed to fetch news: {str(e)}"}), 500
+
+RETENTION_HEADER = 'X-Captura-Retention'
+
+def _retention_access_error():
+    """
+    Get an error response unless the request carries the retention token.
+    """
+    token = current_app.config.get('RETENTION_TOKEN')
+    if not token:
+        return jsonify({"error": "Retention purges over HTTP are disabled (no retention token configured)"}), 404
+    supplied = request.headers.get(RETENTION_HEADER, '')
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return jsonify({"error": "Retention token required"}), 403
+    return None
+
+@api_bp.route("/retention/purge", methods=['POST'])
+def purge_old_portfolios():
+    """
+    Delete portfolios by user, age or keep-last-N.
+    
+    Requires the retention token in the X-Captura-Retention header.
+    JSON body: user_id, older_than_days, keep_last (at least one of them),
+    dry_run and confirm. Purges across all users (no user_id) must be a
+    dry_run or send "confirm": true. Portfolios matching every given
+    criterion are deleted in chunked transactions and the freed pages are
+    returned to the filesystem with incremental vacuum steps.
+    """
+    error = _retention_access_error()
+    if error:
+        return error
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        dry_run = bool(data.get('dry_run', False))
+        if data.get('user_id') is None and not dry_run and data.get('confirm') is not True:
+            return jsonify({"error": "Purging every user's portfolios needs \"dry_run\": true or \"confirm\": true"}), 400
+        older_than_days = data.get('older_than_days')
+        keep_last = data.get('keep_last')
+        if older_than_days is not None and (isinstance(older_than_days, bool) or not isinstance(older_than_days, (int, float))):
+            return jsonify({"error": "older_than_days must be a number"}), 400
+        if keep_last is not None and (isinstance(keep_last, bool) or not isinstance(keep_last, int)):
+            return jsonify({"error": "keep_last must be an integer"}), 400
+        
+        result = run_write(
+            purge_portfolios,
+            user_id=data.get('user_id'),
+            older_than_days=older_than_days,
+            keep_last=keep_last,
+            chunk_size=current_app.config['RETENTION_CHUNK_SIZE'],
+            vacuum_pages=current_app.config['RETENTION_VACUUM_PAGES'],
+            dry_run=dry_run
+        )
+        
+        return jsonify(result), 200
+    
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Error purging portfolios: {str(e)}")
+        return jsonify({"error": f"Failed to purge portfolios: {str(e)}"}), 500
+
+def _list_arg(name):
+    """
+    Read a list query parameter given repeated and/or comma-separated.
+    """
+    values = []
+    for value in request.args.getlist(name):
+        values.extend(item.strip() for item in value.split(',') if item.strip())
+    return values
+
+@api_bp.route("/analytics/exposure", methods=['GET'])
+def get_exposure():
+    """
+    Aggregate holdings across all users from the latest analytics snapshot.
+    
+    Query parameters: group_by (comma-separated ticker, sector, user,
+    portfolio; empty for totals only), ticker, sector and user filters,
+    latest (1 counts only each user's most recent upload, 0 every upload)
+    and limit. Results are as fresh as the snapshot they report.
+    """
+    try:
+        group_by = [key.strip() for key in request.args.get('group_by', 'ticker').split(',') if key.strip()]
+        limit = request.args.get('limit', 100, type=int)
+        latest = request.args.get('latest', '1')
+        if latest not in ('0', '1'):
+            return jsonify({"error": "latest must be 0 or 1"}), 400
+        
+        snapshot = get_snapshot_service().current()
+        if snapshot is None:
+            return jsonify({"error": "No analytics snapshot yet"}), 404
+        
+        result = snapshot.query(
+            group_by=group_by,
+            tickers=_list_arg('ticker'),
+            sectors=_list_arg('sector'),
+            users=_list_arg('user'),
+            latest_only=latest == '1',
+            limit=limit
+        )
+        
+        return jsonify(result), 200
+        
+    except SnapshotQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error querying exposure: {str(e)}")
+        return jsonify({"error": f"Failed to query exposure: {str(e)}"}), 500
+
+@api_bp.route("/analytics/snapshots", methods=['GET', 'POST'])
+def analytics_snapshots():
+    """
+    GET describes the current analytics snapshot; POST queues a new build
+    on the snapshot service's background thread and returns 202 right away.
+    Poll GET (or /api/metrics) to see it published.
+    """
+    try:
+        service = get_snapshot_service()
+        
+        if request.method == 'POST':
+            queued = service.request_refresh()
+            logger.info("Analytics snapshot build " + ("queued" if queued else "already queued"))
+            return jsonify({**service.stats(), "queued": queued}), 202
+        
+        snapshot = service.current()
+        if snapshot is None:
+            return jsonify({"error": "No analytics snapshot yet"}), 404
+        
+        return jsonify(snapshot.manifest), 200
+        
+    except Exception as e:
+        logger.error(f"Error with analytics snapshot: {str(e)}")
+        return jsonify({"error": f"Analytics snapshot failed: {str(e)}"}), 500
+
+def _profiles_access_error():
+    """
+    Get an error response unless the request may read profiles.
+    """
+    profiler = get_profiler()
+    if profiler.token is None:
+        return jsonify({"error": "Profile access is disabled (no profiling token configured)"}), 404
+    if not profiler.authorized():
+        return jsonify({"error": "Profiling token required"}), 403
+    return None
+
+@api_bp.route("/debug/profiles", methods=['GET'])
+def list_profiles():
+    """
+    List the stored request profiles, newest first.
+    
+    Requires the profiling token in the X-Captura-Profile header.
+    """
+    error = _profiles_access_error()
+    if error:
+        return error
+    
+    profiler = get_profiler()
+    profiles = profiler.list_profiles()
+    return jsonify({
+        "profiles": profiles,
+        "count": len(profiles),
+        "capacity": profiler.capacity
+    }), 200
+
+@api_bp.route("/debug/profiles/<request_id>", methods=['GET'])
+def get_request_profile(request_id):
+    """
+    Download one request profile.
+    
+    ?format=pstats (default) returns a file for pstats or snakeviz;
+    ?format=text returns the pstats report, ordered by ?sort= (cumulative,
+    tottime, calls) and cut at ?limit= functions.
+    """
+    error = _profiles_access_error()
+    if error:
+        return error
+    
+    profiler = get_profiler()
+    entry = profiler.get_profile(request_id)
+    if entry is None:
+        return jsonify({"error": "Profile not found"}), 404
+    
+    output_format = request.args.get('format', 'pstats')
+    if output_format == 'pstats':
+        download_name = secure_filename(f"{request_id}.prof") or "profile.prof"
+        return Response(
+            profiler.dump(entry),
+            mimetype='application/octet-stream',
+            headers={"Content-Disposition": f"attachment; filename={download_name}"}
+        )
+    if output_format == 'text':
+        limit = request.args.get('limit', 30, type=int)
+        if limit < 1:
+            return jsonify({"error": "limit must be positive"}), 400
+        try:
+            report = profiler.render(entry, request.args.get('sort', 'cumulative'), limit)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return Response(report, mimetype='text/plain')
+    
+    return jsonify({"error": "format must be 'pstats' or 'text'"}), 400
+
+@api_bp.route("/replica/refresh", methods=['POST'])
+def refresh_replica():
+    """
+    Queue a refresh of the read-only replica of every shard on the replica
+    refresher's background thread and return 202 right away.
+    """
+    try:
+        replica = get_replica()
+        if not replica.configured:
+            return jsonify({"error": "No replica configured (set CAPTURA_DB_REPLICA_PATH)"}), 404
+        
+        queued = replica.request_refresh()
+        logger.info("Database replica refresh " + ("queued" if queued else "already queued"))
+        
+        return jsonify({**replica.stats(), "queued": queued}), 202
+        
+    except Exception as e:
+        logger.error(f"Error refreshing replica: {str(e)}")
+        return jsonify({"error": f"Failed to refresh replica: {str(e)}"}), 500
+
+def _health_stats(replica):
+    """
+    Probe the primary database, then gather its stats (from the replica when
+    replica is set). Runs on a database reader thread.
+    """
+    from utils.database import ping_database, get_database_stats
+    ping_database()
+    return get_database_stats(replica)
+
 @api_bp.route("/health", methods=['GET'])
 def health_check():
     """
     Health check endpoint for monitoring.
+    
+    Connectivity is always checked against the primary database; only the
+    stats payload is read from the replica when DB_REPLICA_READS is set.
     """
     try:
-        from utils.database import get_database_stats
-        stats = get_database_stats()
+        stats = run_read(_health_stats, current_app.config['DB_REPLICA_READS'])
         
         return jsonify({
             "status": "healthy",
@@ -164,6 +838,8 @@ def health_check():
             "stats": stats
         }), 200
         
+    except (ExecutorSaturatedError, DatabaseTimeoutError):
+        raise
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         return jsonify({
@@ -171,6 +847,69 @@ def health_check():
             "error": str(e)
         }), 500
 
+def _prometheus_lines(prefix, values):
+    """
+    Yield 'name value' lines for the numeric leaves of a nested dict.
+    """
+    for key, value in values.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from _prometheus_lines(name, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{name} {value}\n"
+
+@api_bp.route("/metrics", methods=['GET'])
+def get_metrics():
+    """
+    Get load metrics: upload admission queue depth and rejections, database
+    executor queues, chart cache counters, analytics snapshot builds,
+    request profiling and replica refreshes.
+    
+    With ?format=prometheus the flattened numeric values are returned in the
+    Prometheus text exposition format.
+    """
+    try:
+        output_format = request.args.get('format', 'json')
+        if output_format not in ('json', 'prometheus'):
+            return jsonify({"error": "format must be 'json' or 'prometheus'"}), 400
+        
+        metrics = {
+            "uploads": get_upload_admission().stats(),
+            "database": get_db_executor().stats(),
+            "charts": get_chart_service().stats(),
+            "snapshots": get_snapshot_service().stats(),
+            "profiling": get_profiler().stats(),
+            "replica": get_replica().stats()
+        }
+        
+        if output_format == 'prometheus':
+            return Response(''.join(_prometheus_lines('captura', metrics)),
+                            content_type='text/plain; version=0.0.4; charset=utf-8')
+        
+        return jsonify(metrics), 200
+        
+    except Exception as e:
+        logger.error(f"Error collecting metrics: {str(e)}")
+        return jsonify({"error": f"Failed to collect metrics: {str(e)}"}), 500
+
+@api_bp.errorhandler(AdmissionRejectedError)
+def upload_rejected(e):
+    response = jsonify({"error": "Too many uploads in progress, please retry shortly", "reason": e.reason})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, e.status
+
+@api_bp.errorhandler(ExecutorSaturatedError)
+def database_busy(e):
+    logger.warning(f"Rejecting request: {str(e)}")
+    response = jsonify({"error": "Server busy, please retry shortly"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@api_bp.errorhandler(DatabaseTimeoutError)
+def database_timeout(e):
+    logger.error("Database operation timed out")
+    return jsonify({"error": "Database operation timed out"}), 504
+
 @api_bp.errorhandler(413)
 def too_large(e):
     return jsonify({"error": "File too large"}), 413
@@ -0,0 +1,97 @@
+"""
+Checks for upload admission: FIFO slots, per-user caps and early rejections.
+
+Run from the backend directory:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.admission import AdmissionRejectedError, UploadAdmission  # noqa: E402
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+def test_waiting_uploads_are_admitted_in_arrival_order():
+    admission = UploadAdmission(max_concurrent=1, queue_timeout=5.0)
+    order = []
+
+    def upload(user_id):
+        with admission.admit(user_id, 0):
+            order.append(user_id)
+
+    with admission.admit('holder', 0):
+        threads = []
+        for position, user_id in enumerate(['a', 'b', 'c', 'd'], start=1):
+            thread = threading.Thread(target=upload, args=(user_id,))
+            thread.start()
+            threads.append(thread)
+            wait_for(lambda: admission.stats()['queued'] == position)
+    for thread in threads:
+        thread.join()
+
+    assert order == ['a', 'b', 'c', 'd']
+    stats = admission.stats()
+    assert (stats['active'], stats['queued'], stats['users_uploading']) == (0, 0, 0)
+    assert stats['admitted'] == 5
+
+
+def test_per_user_cap_rejects_with_429():
+    admission = UploadAdmission(max_concurrent=4, max_per_user=1)
+    with admission.admit('u1', 10):
+        with pytest.raises(AdmissionRejectedError) as rejected:
+            with admission.admit('u1', 10):
+                pass
+        assert (rejected.value.reason, rejected.value.status) == ('user_limit', 429)
+
+        # Other users are not affected
+        with admission.admit('u2', 10):
+            assert admission.stats()['users_uploading'] == 2
+
+    # The cap counts uploads in progress, not uploads made
+    with admission.admit('u1', 10):
+        pass
+    assert admission.stats()['rejected']['user_limit'] == 1
+
+
+def test_full_queue_and_byte_budget_reject_at_once():
+    admission = UploadAdmission(max_concurrent=1, max_queued=0, max_pending_bytes=100)
+    with admission.admit('u1', 80):
+        with pytest.raises(AdmissionRejectedError) as rejected:
+            admission.check(10)
+        assert (rejected.value.reason, rejected.value.status) == ('queue_full', 503)
+        assert rejected.value.retry_after >= admission.retry_after
+
+    admission = UploadAdmission(max_concurrent=2, max_pending_bytes=100)
+    with admission.admit('u1', 80):
+        with pytest.raises(AdmissionRejectedError) as rejected:
+            with admission.admit('u2', 30):
+                pass
+        assert rejected.value.reason == 'pending_bytes'
+
+    # A single upload larger than the budget still runs when nothing else is pending
+    with admission.admit('u2', 500):
+        pass
+
+
+def test_queue_timeout_gives_back_the_reservation():
+    admission = UploadAdmission(max_concurrent=1, queue_timeout=0.05)
+    with admission.admit('u1', 10):
+        with pytest.raises(AdmissionRejectedError) as rejected:
+            with admission.admit('u2', 20):
+                pass
+        assert (rejected.value.reason, rejected.value.status) == ('timeout', 503)
+        stats = admission.stats()
+        assert (stats['queued'], stats['pending_bytes'], stats['users_uploading']) == (0, 10, 1)
@@ -0,0 +1,70 @@
+"""
+Checks for LTTB downsampling of chart series.
+
+Run from the backend directory:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.charts import downsample, lttb_indices  # noqa: E402
+
+
+def reference_lttb(x, y, points):
+    # Straightforward per-bucket LTTB with the same bucket boundaries
+    length = len(x)
+    starts = [int(s) for s in np.floor(np.linspace(1, length - 1, points - 1))]
+    kept = [0]
+    for bucket in range(points - 2):
+        low, high = starts[bucket], starts[bucket + 1]
+        if bucket + 2 < len(starts):
+            following = range(starts[bucket + 1], starts[bucket + 2])
+            next_x = sum(x[i] for i in following) / len(following)
+            next_y = sum(y[i] for i in following) / len(following)
+        else:
+            next_x, next_y = x[-1], y[-1]
+        ax, ay = x[kept[-1]], y[kept[-1]]
+        areas = [abs((ax - next_x) * (y[i] - ay) - (ax - x[i]) * (next_y - ay)) for i in range(low, high)]
+        kept.append(low + int(np.argmax(areas)))
+    kept.append(length - 1)
+    return kept
+
+
+@pytest.mark.parametrize('length, points', [(10, 3), (100, 7), (1000, 50), (1001, 999), (5000, 300)])
+def test_keeps_ends_and_at_most_n_points(length, points):
+    rng = np.random.default_rng(length)
+    x = np.arange(length, dtype=np.float64)
+    y = np.cumsum(rng.normal(size=length))
+
+    indices = lttb_indices(x, y, points)
+    assert len(indices) == points
+    assert indices[0] == 0 and indices[-1] == length - 1
+    assert np.all(np.diff(indices) > 0)
+    assert list(indices) == reference_lttb(x, y, points)
+
+
+def test_short_series_are_returned_whole():
+    x = np.arange(5, dtype=np.float64)
+    assert list(lttb_indices(x, x, 5)) == [0, 1, 2, 3, 4]
+    assert list(lttb_indices(x, x, 50)) == [0, 1, 2, 3, 4]
+    assert list(lttb_indices(x[:2], x[:2], 3)) == [0, 1]
+    with pytest.raises(ValueError):
+        lttb_indices(x, x, 2)
+
+
+def test_spikes_survive_downsampling():
+    dates = np.arange(np.datetime64('2020-01-01'), np.datetime64('2020-01-01') + 1000)
+    values = np.full(1000, 100.0)
+    values[[137, 612]] = [250.0, 10.0]
+
+    kept_dates, kept_values = downsample(dates, values, 20)
+    assert len(kept_dates) == 20
+    assert kept_dates[0] == dates[0] and kept_dates[-1] == dates[-1]
+    assert {250.0, 10.0} <= set(kept_values)
+    assert downsample(dates, values, None)[0] is dates
@@ -0,0 +1,80 @@
+"""
+Checks for decompressing uploads under a size limit.
+
+Run from the backend directory:
+    python -m pytest -q tests
+"""
+
+import gzip
+import io
+import os
+import sys
+import zipfile
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.file_utils import (  # noqa: E402
+    DecompressedSizeError, UploadDecompressionError, get_file_extension, open_upload_stream
+)
+
+CSV = b"ticker,shares,purchase_price,purchase_date\nAAPL,10,150.0,2024-01-02\n"
+
+
+def upload(data, filename):
+    return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def zipped(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_compound_extensions():
+    assert get_file_extension('holdings.CSV.GZ') == 'csv.gz'
+    assert get_file_extension('holdings.2024.csv') == 'csv'
+    assert get_file_extension('holdings.tar.gz') == 'gz'
+
+
+@pytest.mark.parametrize('filename, data', [
+    ('holdings.csv', CSV),
+    ('holdings.csv.gz', gzip.compress(CSV)),
+    ('holdings.zip', zipped({'holdings.csv': CSV})),
+])
+def test_reads_within_limit(filename, data):
+    stream = open_upload_stream(upload(data, filename), filename, max_decompressed_bytes=len(CSV))
+    assert stream.read() == CSV.decode()
+
+
+def test_gzip_bomb_stops_at_limit():
+    # 64 MB of zeros compresses to about 64 KB
+    bomb = gzip.compress(b'0' * (64 * 1024 * 1024))
+    stream = open_upload_stream(upload(bomb, 'bomb.csv.gz'), 'bomb.csv.gz', max_decompressed_bytes=1024 * 1024)
+
+    read = 0
+    with pytest.raises(DecompressedSizeError):
+        while stream.read(64 * 1024):
+            read += 64 * 1024
+    assert read <= 1024 * 1024
+
+
+def test_zip_bomb_stops_at_limit():
+    bomb = zipped({'bomb.csv': b'0' * (16 * 1024 * 1024)})
+    stream = open_upload_stream(upload(bomb, 'bomb.zip'), 'bomb.zip', max_decompressed_bytes=1024 * 1024)
+    with pytest.raises(DecompressedSizeError):
+        stream.read()
+
+
+def test_corrupt_and_ambiguous_archives():
+    truncated = gzip.compress(CSV * 100)[:-20]
+    with pytest.raises(UploadDecompressionError):
+        open_upload_stream(upload(truncated, 'cut.csv.gz'), 'cut.csv.gz').read()
+
+    two_members = zipped({'a.csv': CSV, 'b.csv': CSV})
+    with pytest.raises(UploadDecompressionError):
+        open_upload_stream(upload(two_members, 'two.zip'), 'two.zip')
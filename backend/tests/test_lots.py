@@ -0,0 +1,70 @@
+"""
+Regression checks for tax lots synced across uploads.
+
+Run from the backend directory:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Importing utils.database opens the global database; keep it out of the tree
+os.environ.setdefault('CAPTURA_DB_PATH', os.path.join(tempfile.mkdtemp(), 'captura.db'))
+
+from utils.database import DatabaseManager  # noqa: E402
+from utils.lots import LotRebuildThrottledError  # noqa: E402
+
+
+def upload(manager, user_id, rows):
+    portfolio_id = manager.insert_portfolio(user_id, 'lots.csv')
+    manager.insert_holdings(portfolio_id, [
+        {'ticker': 'AAA', 'shares': shares, 'purchase_price': price, 'purchase_date': day}
+        for day, price, shares in rows
+    ])
+    return portfolio_id
+
+
+def sync(manager, user_id, method='fifo'):
+    plan = manager.plan_user_lots(user_id, method)
+    return manager.sync_user_lots(user_id, method, None, plan['rebuild'], plan['through'])
+
+
+def test_purged_watermark_upload_does_not_invent_trades(tmp_path):
+    manager = DatabaseManager(str(tmp_path / 'captura.db'))
+    upload(manager, 'u1', [('2020-01-02', 100.0, 10), ('2022-01-03', 200.0, 10)])
+    sync(manager, 'u1')
+    # The 2022 row shrinks by 5; FIFO sells them from the 2020 lot
+    upload(manager, 'u1', [('2020-01-02', 100.0, 10), ('2022-01-03', 200.0, 5)])
+    sync(manager, 'u1')
+    before = manager.get_user_lots('u1')
+    assert [(lot['acquired_date'], lot['remaining']) for lot in before['open_lots']] == [
+        ('2020-01-02', 5), ('2022-01-03', 10)
+    ]
+    assert [gain['shares'] for gain in before['realized']] == [5]
+
+    # An identical upload, applied after the previous one is purged
+    upload(manager, 'u1', [('2020-01-02', 100.0, 10), ('2022-01-03', 200.0, 5)])
+    manager.purge_portfolios(user_id='u1', keep_last=1)
+    assert sync(manager, 'u1')['processed_uploads'] == 1
+
+    after = manager.get_user_lots('u1')
+    assert after['open_lots'] == before['open_lots']
+    assert after['realized'] == before['realized']
+
+
+def test_rebuild_replays_kept_uploads(tmp_path):
+    manager = DatabaseManager(str(tmp_path / 'captura.db'))
+    upload(manager, 'u1', [('2020-01-02', 100.0, 10), ('2022-01-03', 200.0, 10)])
+    upload(manager, 'u1', [('2022-01-03', 200.0, 10)])
+    sync(manager, 'u1', 'fifo')
+    assert sync(manager, 'u1', 'specific')['processed_uploads'] == 2
+
+    lots = manager.get_user_lots('u1')
+    assert lots['method'] == 'specific'
+    assert [(gain['acquired_date'], gain['shares']) for gain in lots['realized']] == [('2020-01-02', 10)]
+    with pytest.raises(LotRebuildThrottledError):
+        manager.plan_user_lots('u1', 'fifo', min_rebuild_interval=60)
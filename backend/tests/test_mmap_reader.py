@@ -0,0 +1,72 @@
+"""
+Checks that the memory-mapped CSV reader yields the same rows as csv.DictReader.
+
+Run from the backend directory:
+    python -m pytest -q tests
+"""
+
+import csv
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.mmap_reader import MappedCSVReader, should_use_mmap  # noqa: E402
+
+COLUMNS = ['ticker', 'shares', 'notes']
+
+
+def mapped_rows(path, columns=None):
+    with MappedCSVReader(str(path), columns=columns) as reader:
+        return reader.fieldnames, list(reader)
+
+
+def dict_rows(path, columns):
+    with open(path, 'r', newline='', encoding='utf-8-sig') as file:
+        reader = csv.DictReader(file)
+        return reader.fieldnames, [{name: row.get(name) for name in columns} for row in reader]
+
+
+@pytest.mark.parametrize('content', [
+    b'ticker,shares,notes\nAAPL,10,plain\nMSFT,5,"quoted, with comma"\n',
+    b'ticker,shares,notes\r\nAAPL,10,plain\r\nMSFT,5,"two\r\nlines"\r\n',
+    b'ticker,shares,notes\nAAPL,10,"line one\nline two\n""quoted"" three"\nMSFT,5,after\n',
+    b'\xef\xbb\xbfticker,shares,notes\r\nAAPL,10,bom\r\n',
+    b'ticker,shares,notes\n\nAAPL,10,blank lines\n\r\nMSFT,5\nNVDA,1,no trailing newline',
+    'ticker,shares,notes\nNESN.SW,3,"Zürich, CH"\n'.encode('utf-8'),
+], ids=['quoted-comma', 'crlf', 'quoted-newlines', 'bom', 'blank-and-short', 'utf8'])
+def test_matches_dict_reader(tmp_path, content):
+    path = tmp_path / 'holdings.csv'
+    path.write_bytes(content)
+    assert mapped_rows(path, COLUMNS) == dict_rows(path, COLUMNS)
+
+
+def test_quoted_newline_stays_in_one_row(tmp_path):
+    path = tmp_path / 'holdings.csv'
+    path.write_bytes(b'ticker,shares,notes\r\nAAPL,10,"first\r\nsecond"\r\nMSFT,5,x\r\n')
+    fieldnames, rows = mapped_rows(path)
+    assert fieldnames == COLUMNS
+    assert rows == [
+        {'ticker': 'AAPL', 'shares': '10', 'notes': 'first\r\nsecond'},
+        {'ticker': 'MSFT', 'shares': '5', 'notes': 'x'},
+    ]
+
+
+def test_only_selected_columns_are_returned(tmp_path):
+    path = tmp_path / 'holdings.csv'
+    path.write_bytes(b'\xef\xbb\xbfticker,shares,notes\nAAPL,10,x\n')
+    fieldnames, rows = mapped_rows(path, columns=['ticker'])
+    assert fieldnames == COLUMNS
+    assert rows == [{'ticker': 'AAPL'}]
+
+
+def test_should_use_mmap(tmp_path):
+    path = tmp_path / 'holdings.csv'
+    assert not should_use_mmap(str(path))
+    path.write_bytes(b'')
+    assert not should_use_mmap(str(path), threshold=0)
+    path.write_bytes(b'ticker\n' * 10)
+    assert should_use_mmap(str(path), threshold=70)
+    assert not should_use_mmap(str(path), threshold=71)
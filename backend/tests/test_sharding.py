@@ -0,0 +1,89 @@
+"""
+Checks for user shard routing, global portfolio ids and shard rebalancing.
+
+Run from the backend directory:
+    python -m pytest -q tests
+"""
+
+import csv
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Importing utils.database opens the global database; keep it out of the tree
+os.environ.setdefault('CAPTURA_DB_PATH', os.path.join(tempfile.mkdtemp(), 'captura.db'))
+
+from utils.database import DatabaseManager  # noqa: E402
+from tools.rebalance_shards import rebalance  # noqa: E402
+
+USERS = [f"user{n}" for n in range(12)]
+
+
+def upload(manager, user_id, tickers):
+    portfolio_id = manager.insert_portfolio(user_id, f"{user_id}.csv")
+    manager.insert_holdings(portfolio_id, [
+        {'ticker': ticker, 'shares': 10, 'purchase_price': 100.0, 'purchase_date': '2024-01-02'}
+        for ticker in tickers
+    ])
+    return portfolio_id
+
+
+def test_shard_paths():
+    assert DatabaseManager.get_shard_paths('data/captura.db', 1) == ['data/captura.db']
+    assert DatabaseManager.get_shard_paths('data/captura.db', 2) == [
+        'data/captura.shard0.db', 'data/captura.shard1.db'
+    ]
+
+
+def test_portfolio_id_round_trip(tmp_path):
+    manager = DatabaseManager(str(tmp_path / 'captura.db'), shard_count=3)
+    for shard in range(3):
+        for local_id in (1, 2 ** 40 - 1):
+            assert manager.decode_portfolio_id(manager.encode_portfolio_id(shard, local_id)) == (shard, local_id)
+
+    assert manager.decode_portfolio_id(-1) is None
+    assert manager.decode_portfolio_id(manager.encode_portfolio_id(3, 1)) is None
+
+
+def test_users_stay_on_their_shard(tmp_path):
+    manager = DatabaseManager(str(tmp_path / 'captura.db'), shard_count=4)
+    shards = {user: manager.shard_for_user(user) for user in USERS}
+    # Placement is a stable hash, not per-process state
+    assert shards == {user: DatabaseManager(str(tmp_path / 'other.db'), shard_count=4).shard_for_user(user)
+                      for user in USERS}
+    assert len(set(shards.values())) > 1
+
+    for user in USERS:
+        portfolio_id = upload(manager, user, ['AAPL', 'MSFT'])
+        assert manager.decode_portfolio_id(portfolio_id)[0] == shards[user]
+        assert manager.get_portfolio_by_id(portfolio_id)['user_id'] == user
+        assert len(manager.get_holdings_by_portfolio(portfolio_id)) == 2
+
+
+def test_rebalance_mapping_round_trip(tmp_path):
+    source = DatabaseManager(str(tmp_path / 'single.db'))
+    for n, user in enumerate(USERS):
+        upload(source, user, ['AAPL', 'MSFT', 'NVDA'][:n % 3 + 1])
+    # Includes the schema's sample portfolio
+    with sqlite3.connect(source.db_path) as conn:
+        before = {portfolio_id: (user, holdings) for portfolio_id, user, holdings in conn.execute(
+            "SELECT p.id, p.user_id, COUNT(h.id) FROM portfolios p "
+            "LEFT JOIN holdings h ON h.portfolio_id = p.id GROUP BY p.id"
+        )}
+
+    mapping = tmp_path / 'ids.csv'
+    copied = rebalance(str(tmp_path / 'single.db'), 3, str(tmp_path / 'sharded.db'), str(mapping))
+    assert sum(copied) == len(before)
+
+    target = DatabaseManager(str(tmp_path / 'sharded.db'), shard_count=3)
+    with open(mapping, newline='') as file:
+        pairs = {int(row['old_portfolio_id']): int(row['new_portfolio_id']) for row in csv.DictReader(file)}
+    assert set(pairs) == set(before)
+
+    for old_id, new_id in pairs.items():
+        user, holdings = before[old_id]
+        assert target.decode_portfolio_id(new_id) == (target.shard_for_user(user), old_id)
+        assert target.get_portfolio_by_id(new_id)['user_id'] == user
+        assert len(target.get_holdings_by_portfolio(new_id)) == holdings
@@ -0,0 +1,52 @@
+"""
+Take a hot backup of the Captura database while the app keeps running.
+
+Copies every shard with the SQLite online backup API in paged steps,
+sleeping between steps so the application's writer is not starved. Each
+copy is written next to its destination and renamed into place when it is
+complete. With N shards the backups are named like the shard files
+(<name>.shard0<ext> ...).
+
+Usage:
+    cd backend
+    python tools/backup_db.py backups/captura-2024-06-01.db [--db captura.db] [--shards N]
+        [--pages 1024] [--pause 0.005]
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.database import DatabaseManager  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up a live Captura database")
+    parser.add_argument('output', help='backup path (shard suffixes are added when sharded)')
+    parser.add_argument('--db', default=os.environ.get('CAPTURA_DB_PATH', 'captura.db'),
+                        help='database path (default: $CAPTURA_DB_PATH or captura.db)')
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('CAPTURA_DB_SHARDS', '1')),
+                        help='number of shards (default: $CAPTURA_DB_SHARDS or 1)')
+    parser.add_argument('--pages', type=int, default=1024, help='pages copied per step')
+    parser.add_argument('--pause', type=float, default=0.005, help='seconds slept between steps')
+    args = parser.parse_args()
+
+    if args.pages < 1:
+        parser.error('--pages must be at least 1')
+
+    manager = DatabaseManager(args.db, shard_count=args.shards)
+
+    for shard, path in enumerate(DatabaseManager.get_shard_paths(args.output, manager.shard_count)):
+        result = manager.backup(path, shard, pages=args.pages, pause=args.pause)
+        print(f"Shard {shard}: {result['pages']} pages to {path} in {result['steps']} steps, "
+              f"{result['seconds']}s" + (f" ({result['restarts']} restarts)" if result['restarts'] else ''))
+
+
+if __name__ == '__main__':
+    main()
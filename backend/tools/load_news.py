@@ -0,0 +1,44 @@
+"""
+Bulk-load market news dumps into the local news index.
+
+Accepts JSON (a list of articles or {"articles": [...]}), NDJSON and CSV
+dumps. Each article needs a title and published_at (ISO 8601, epoch seconds
+or milliseconds, RFC 2822 or e.g. "Jan 15, 2024"; stored as UTC); id, summary,
+source, url and tickers are optional. In CSV files tickers are separated by
+';', '|', ',' or spaces. Articles already loaded are skipped.
+
+Usage:
+    cd backend
+    python tools/load_news.py news-2024.jsonl news-archive.csv [--db news.db]
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from utils.news_store import NewsStore  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load news dumps into the local news index")
+    parser.add_argument('files', nargs='+', help='JSON, NDJSON or CSV news dumps')
+    parser.add_argument('--db', default=Config.NEWS_DB_PATH, help='news database path')
+    parser.add_argument('--batch-size', type=int, default=10000, help='articles per insert batch')
+    args = parser.parse_args()
+
+    store = NewsStore(args.db)
+    loaded = store.load_files(args.files, args.batch_size)
+    stats = store.get_stats()
+    print(f"Loaded {loaded} new articles; {stats['articles']} articles in {args.db}"
+          + (f" ({store.skipped_records} unusable records skipped)" if store.skipped_records else ''))
+
+
+if __name__ == '__main__':
+    main()
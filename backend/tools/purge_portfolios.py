@@ -0,0 +1,79 @@
+"""
+Expire old portfolio uploads in bulk.
+
+Deletes the portfolios matching every given criterion (user, age,
+keep-last-N per user) in chunked transactions, returning freed pages to the
+filesystem with incremental_vacuum steps instead of a blocking full VACUUM.
+
+Databases created before auto_vacuum=INCREMENTAL was the default need a
+one-time conversion (a full VACUUM) with --enable-incremental-vacuum before
+their file can shrink.
+
+Usage:
+    cd backend
+    python tools/purge_portfolios.py [--db captura.db] [--shards N]
+        [--user USER] [--older-than-days DAYS] [--keep-last N]
+        [--chunk-size 500] [--vacuum-pages 2000] [--dry-run]
+    python tools/purge_portfolios.py --enable-incremental-vacuum [--db captura.db] [--shards N]
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.database import DatabaseManager  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete old Captura portfolios and reclaim their space")
+    parser.add_argument('--db', default=os.environ.get('CAPTURA_DB_PATH', 'captura.db'),
+                        help='database path (default: $CAPTURA_DB_PATH or captura.db)')
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('CAPTURA_DB_SHARDS', '1')),
+                        help='number of shards (default: $CAPTURA_DB_SHARDS or 1)')
+    parser.add_argument('--user', help="only purge this user's portfolios")
+    parser.add_argument('--older-than-days', type=float, help='only purge portfolios uploaded before this many days ago')
+    parser.add_argument('--keep-last', type=int, help="keep each user's N most recent portfolios")
+    parser.add_argument('--chunk-size', type=int, default=500, help='portfolios deleted per transaction')
+    parser.add_argument('--vacuum-pages', type=int, default=2000,
+                        help='pages freed after each chunk (0 disables vacuuming)')
+    parser.add_argument('--dry-run', action='store_true', help='only count the matching portfolios')
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='convert the database to auto_vacuum=INCREMENTAL (runs a full VACUUM once)')
+    args = parser.parse_args()
+
+    manager = DatabaseManager(args.db, shard_count=args.shards)
+
+    if args.enable_incremental_vacuum:
+        for shard in range(manager.shard_count):
+            converted = manager.enable_incremental_vacuum(shard)
+            print(f"Shard {shard}: {'converted' if converted else 'already incremental'}")
+        if args.user is None and args.older_than_days is None and args.keep_last is None:
+            return
+
+    try:
+        result = manager.purge_portfolios(
+            user_id=args.user,
+            older_than_days=args.older_than_days,
+            keep_last=args.keep_last,
+            chunk_size=args.chunk_size,
+            vacuum_pages=args.vacuum_pages,
+            dry_run=args.dry_run
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+    if result['dry_run']:
+        print(f"Would delete {result['portfolios']} portfolios")
+    else:
+        print(f"Deleted {result['portfolios']} portfolios and {result['holdings']} holdings, "
+              f"reclaimed {result['pages_reclaimed']} pages")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Rebalance a single-file Captura database into N user shards.
+
+Every portfolio keeps its row id inside its new shard, so its new global
+id is DatabaseManager.encode_portfolio_id(shard, old_id). With --mapping
+the old -> new id pairs are written to a CSV file for clients that stored
+portfolio ids.
+
+Usage:
+    cd backend
+    python tools/rebalance_shards.py captura.db --shards 4 [--dest captura.db] [--mapping ids.csv]
+
+Then start the app with CAPTURA_DB_SHARDS=4 (and CAPTURA_DB_PATH=<dest>).
+"""
+
+import argparse
+import csv
+import logging
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.database import DatabaseManager  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tables copied per shard, with the SQL selecting a shard's rows from the source.
+# Rows are placed by the owning user_id; each shard gets the tickers and
+# sectors its holdings and lots reference, keeping their ids.
+SHARDED_TABLES = [
+    ('sectors', "SELECT {columns} FROM src.sectors WHERE id IN "
+                "(SELECT sector_id FROM src.holdings WHERE portfolio_id IN "
+                "(SELECT id FROM src.portfolios WHERE shard_of(user_id) = ?)) ORDER BY id"),
+    ('tickers', "SELECT {columns} FROM src.tickers WHERE id IN "
+                "(SELECT ticker_id FROM src.holdings WHERE portfolio_id IN "
+                "(SELECT id FROM src.portfolios WHERE shard_of(user_id) = ?1)) "
+                "OR id IN (SELECT ticker_id FROM src.lots WHERE shard_of(user_id) = ?1) "
+                "OR id IN (SELECT ticker_id FROM src.lot_positions WHERE shard_of(user_id) = ?1) ORDER BY id"),
+    ('portfolios', "SELECT {columns} FROM src.portfolios WHERE shard_of(user_id) = ? ORDER BY id"),
+    ('holdings', "SELECT {columns} FROM src.holdings WHERE portfolio_id IN "
+                 "(SELECT id FROM src.portfolios WHERE shard_of(user_id) = ?) ORDER BY id"),
+    ('portfolio_digests', "SELECT {columns} FROM src.portfolio_digests WHERE portfolio_id IN "
+                          "(SELECT id FROM src.portfolios WHERE shard_of(user_id) = ?)"),
+    ('lots', "SELECT {columns} FROM src.lots WHERE shard_of(user_id) = ? ORDER BY id"),
+    ('realized_gains', "SELECT {columns} FROM src.realized_gains WHERE shard_of(user_id) = ? ORDER BY id"),
+    ('lot_state', "SELECT {columns} FROM src.lot_state WHERE shard_of(user_id) = ?"),
+    ('lot_positions', "SELECT {columns} FROM src.lot_positions WHERE shard_of(user_id) = ?"),
+]
+
+
+def _table_columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def rebalance(source_path, shard_count, dest_path=None, mapping_path=None):
+    """
+    Copy a single-file database into shard files.
+
+    Args:
+        source_path (str): Existing single-file database
+        shard_count (int): Number of shards to create
+        dest_path (str): Base path for the shard files (defaults to source_path)
+        mapping_path (str): Optional CSV file for old -> new portfolio ids
+
+    Returns:
+        List[int]: Portfolios copied per shard
+    """
+    if shard_count < 2:
+        raise ValueError("Rebalancing needs at least 2 shards")
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(source_path)
+
+    # Opening the source brings it to the current schema (e.g. ticker ids)
+    DatabaseManager(source_path)
+    target = DatabaseManager(dest_path or source_path, shard_count)
+
+    for shard in range(shard_count):
+        with target.get_connection(shard) as conn:
+            if conn.execute("SELECT COUNT(*) FROM portfolios").fetchone()[0]:
+                raise ValueError(f"Shard {target.shard_paths[shard]} is not empty")
+
+    copied = []
+    for shard in range(shard_count):
+        with target.get_connection(shard) as conn:
+            conn.create_function('shard_of', 1, target.shard_for_user, deterministic=True)
+            conn.execute("ATTACH DATABASE ? AS src", (source_path,))
+
+            for table, select_sql in SHARDED_TABLES:
+                source_columns = set(_table_columns(conn, 'src', table))
+                if not source_columns:
+                    # Table predates the source database's schema version
+                    continue
+                columns = [c for c in _table_columns(conn, 'main', table) if c in source_columns]
+                column_list = ', '.join(columns)
+                conn.execute(
+                    f"INSERT INTO main.{table} ({column_list}) "
+                    + select_sql.format(columns=column_list),
+                    (shard,)
+                )
+
+            count = conn.execute("SELECT COUNT(*) FROM main.portfolios").fetchone()[0]
+            conn.commit()
+            conn.execute("DETACH DATABASE src")
+            copied.append(count)
+            logger.info(f"Shard {shard}: copied {count} portfolios to {target.shard_paths[shard]}")
+
+    if mapping_path:
+        with sqlite3.connect(source_path) as source, open(mapping_path, 'w', newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(['old_portfolio_id', 'new_portfolio_id'])
+            for old_id, user_id in source.execute("SELECT id, user_id FROM portfolios ORDER BY id"):
+                writer.writerow([old_id, target.encode_portfolio_id(target.shard_for_user(user_id), old_id)])
+        logger.info(f"Wrote portfolio id mapping to {mapping_path}")
+
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebalance a Captura database into user shards")
+    parser.add_argument('source', help='existing single-file database')
+    parser.add_argument('--shards', type=int, required=True, help='number of shards')
+    parser.add_argument('--dest', help='base path for shard files (default: source path)')
+    parser.add_argument('--mapping', help='write old -> new portfolio ids to this CSV file')
+    args = parser.parse_args()
+
+    copied = rebalance(args.source, args.shards, args.dest, args.mapping)
+    print(f"Copied {sum(copied)} portfolios into {args.shards} shards: {copied}")
+
+
+if __name__ == '__main__':
+    main()
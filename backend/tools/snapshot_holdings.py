@@ -0,0 +1,59 @@
+"""
+Build a columnar analytics snapshot of all holdings.
+
+Exports every holding into memory-mappable NumPy column files with ticker,
+sector and user dictionaries (see utils/snapshot.py), publishes it as the
+current snapshot and removes snapshots beyond --keep. Run it from cron, or
+with --every to keep rebuilding in the foreground. The API picks up a new
+snapshot on its next query.
+
+Usage:
+    cd backend
+    python tools/snapshot_holdings.py [--db captura.db] [--shards N]
+        [--dir data/snapshots] [--keep 3] [--every SECONDS]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from utils.database import DatabaseManager  # noqa: E402
+from utils.snapshot import build_snapshot  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Captura holdings analytics snapshot")
+    parser.add_argument('--db', default=os.environ.get('CAPTURA_DB_PATH', 'captura.db'),
+                        help='database path (default: $CAPTURA_DB_PATH or captura.db)')
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('CAPTURA_DB_SHARDS', '1')),
+                        help='number of shards (default: $CAPTURA_DB_SHARDS or 1)')
+    parser.add_argument('--dir', default=Config.SNAPSHOT_DIR,
+                        help='snapshot directory (default: $CAPTURA_SNAPSHOT_DIR or data/snapshots)')
+    parser.add_argument('--keep', type=int, default=Config.SNAPSHOT_KEEP, help='snapshots to keep')
+    parser.add_argument('--every', type=float, help='rebuild every this many seconds until interrupted')
+    args = parser.parse_args()
+
+    if args.keep < 1:
+        parser.error('--keep must be at least 1')
+
+    manager = DatabaseManager(args.db, shard_count=args.shards)
+
+    while True:
+        manifest = build_snapshot(manager, args.dir, keep=args.keep)
+        print(f"Snapshot {manifest['id']}: {manifest['holdings']} holdings, "
+              f"{manifest['tickers']} tickers, {manifest['users']} users in {manifest['build_seconds']}s")
+        if not args.every:
+            return
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    main()
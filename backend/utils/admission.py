@@ -0,0 +1,225 @@
+"""
+Admission control for portfolio uploads.
+Parsing a large CSV is CPU bound and its ingest holds the SQLite write
+lock, so a burst of uploads can starve every other request. Uploads are
+admitted to a fixed number of parse slots; the rest wait in a bounded FIFO
+queue for a limited time. When the queue, the pending byte budget or a
+user's own cap is exhausted the upload is rejected immediately with a
+Retry-After hint instead of piling up behind the others.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+from flask import current_app
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Upper bound of the Retry-After hint, in seconds
+MAX_RETRY_AFTER = 60
+
+# Weight of the latest upload in the moving average of slot hold time
+HOLD_TIME_SMOOTHING = 0.2
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when an upload is not admitted."""
+
+    def __init__(self, reason: str, message: str, retry_after: int, status: int = 503):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status = status
+
+
+class UploadAdmission:
+    """
+    Bounded admission of uploads to a fixed number of parse slots.
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_pending_bytes: int = 64 * 1024 * 1024,
+                 max_queued: int = 16, queue_timeout: float = 5.0, max_per_user: int = 2,
+                 retry_after: int = 2):
+        """
+        Initialize the admission controller.
+
+        Args:
+            max_concurrent (int): Uploads parsed and ingested at the same time
+            max_pending_bytes (int): Request bytes of running and queued uploads
+            max_queued (int): Uploads waiting for a slot before rejecting
+            queue_timeout (float): Seconds an upload waits for a slot
+            max_per_user (int): Running and queued uploads per user
+            retry_after (int): Minimum Retry-After hint in seconds
+        """
+        self.max_concurrent = max_concurrent
+        self.max_pending_bytes = max_pending_bytes
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.max_per_user = max_per_user
+        self.retry_after = retry_after
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._active = 0
+        self._pending_bytes = 0
+        self._per_user = Counter()
+
+        self._admitted = 0
+        self._rejected = Counter()
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._hold_seconds = None
+
+    def _retry_after(self) -> int:
+        # Expected time for the current queue to drain through the slots
+        if self._hold_seconds is None:
+            return self.retry_after
+        backlog = (len(self._queue) + self._active) / self.max_concurrent
+        return min(MAX_RETRY_AFTER, max(self.retry_after, math.ceil(backlog * self._hold_seconds)))
+
+    def _reject(self, reason: str, message: str, status: int = 503):
+        self._rejected[reason] += 1
+        logger.warning(f"Upload rejected ({reason}): {message}")
+        raise AdmissionRejectedError(reason, message, self._retry_after(), status)
+
+    def _check_capacity(self, nbytes: int):
+        # Callers hold self._cond
+        if self._active >= self.max_concurrent and len(self._queue) >= self.max_queued:
+            self._reject('queue_full', f"{self._active} uploads running and {len(self._queue)} queued")
+        if self._pending_bytes and self._pending_bytes + nbytes > self.max_pending_bytes:
+            self._reject('pending_bytes', f"{self._pending_bytes} bytes already pending")
+
+    def check(self, nbytes: int):
+        """
+        Reject an upload early, before its body is read, if it cannot queue.
+
+        Nothing is reserved; admit() checks again.
+
+        Raises:
+            AdmissionRejectedError: If the wait queue or the byte budget is full
+        """
+        with self._cond:
+            self._check_capacity(nbytes)
+
+    @contextmanager
+    def admit(self, user_id: str, nbytes: int) -> Iterator[None]:
+        """
+        Hold a parse slot for the duration of the block.
+
+        Uploads that find every slot busy wait in FIFO order for up to
+        queue_timeout seconds.
+
+        Args:
+            user_id (str): Uploading user
+            nbytes (int): Request size in bytes (0 if unknown)
+
+        Raises:
+            AdmissionRejectedError: 429 when the user is at max_per_user,
+                503 when the queue or byte budget is full or the wait times out
+        """
+        with self._cond:
+            if self._per_user[user_id] >= self.max_per_user:
+                self._reject('user_limit', f"user {user_id} has {self._per_user[user_id]} uploads in progress", 429)
+            self._check_capacity(nbytes)
+
+            self._pending_bytes += nbytes
+            self._per_user[user_id] += 1
+            ticket = object()
+            self._queue.append(ticket)
+            queued_at = time.monotonic()
+            deadline = queued_at + self.queue_timeout
+            while self._queue[0] is not ticket or self._active >= self.max_concurrent:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(ticket)
+                    self._release(user_id, nbytes)
+                    self._reject('timeout', f"no upload slot within {self.queue_timeout:g}s")
+                self._cond.wait(remaining)
+
+            self._queue.popleft()
+            self._active += 1
+            self._admitted += 1
+            waited = time.monotonic() - queued_at
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+            # The next ticket may be admissible too
+            self._cond.notify_all()
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - started
+            with self._cond:
+                self._active -= 1
+                self._release(user_id, nbytes)
+                if self._hold_seconds is None:
+                    self._hold_seconds = held
+                else:
+                    self._hold_seconds += HOLD_TIME_SMOOTHING * (held - self._hold_seconds)
+
+    def _release(self, user_id: str, nbytes: int):
+        # Callers hold self._cond
+        self._pending_bytes -= nbytes
+        self._per_user[user_id] -= 1
+        if not self._per_user[user_id]:
+            del self._per_user[user_id]
+        self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get current queue depth, limits and rejection counts.
+
+        Returns:
+            Dict: Admission statistics
+        """
+        with self._cond:
+            return {
+                'active': self._active,
+                'queued': len(self._queue),
+                'pending_bytes': self._pending_bytes,
+                'users_uploading': len(self._per_user),
+                'max_concurrent': self.max_concurrent,
+                'max_queued': self.max_queued,
+                'max_pending_bytes': self.max_pending_bytes,
+                'max_per_user': self.max_per_user,
+                'admitted': self._admitted,
+                'rejected': {reason: self._rejected[reason]
+                             for reason in ('queue_full', 'pending_bytes', 'timeout', 'user_limit')},
+                'wait_seconds_total': round(self._wait_seconds, 6),
+                'max_wait_seconds': round(self._max_wait_seconds, 6),
+                'avg_hold_seconds': round(self._hold_seconds, 6) if self._hold_seconds is not None else None,
+            }
+
+
+def init_upload_admission(app) -> UploadAdmission:
+    """
+    Create the upload admission controller for a Flask app from its config.
+
+    Args:
+        app (Flask): Application to attach the controller to
+
+    Returns:
+        UploadAdmission: The created controller
+    """
+    admission = UploadAdmission(
+        max_concurrent=app.config['UPLOAD_MAX_CONCURRENT_PARSES'],
+        max_pending_bytes=app.config['UPLOAD_MAX_PENDING_BYTES'],
+        max_queued=app.config['UPLOAD_MAX_QUEUED'],
+        queue_timeout=app.config['UPLOAD_QUEUE_TIMEOUT'],
+        max_per_user=app.config['UPLOAD_MAX_PER_USER'],
+        retry_after=app.config['UPLOAD_RETRY_AFTER'],
+    )
+    app.extensions['upload_admission'] = admission
+    return admission
+
+
+def get_upload_admission() -> UploadAdmission:
+    """Get the upload admission controller of the current Flask app."""
+    return current_app.extensions['upload_admission']
@@ -0,0 +1,296 @@
+"""
+Chart series for the frontend.
+Builds daily price and portfolio value series from the local price history
+and downsamples them with Largest-Triangle-Three-Buckets (LTTB), so a chart
+receives at most `points` points however long the history is. Downsampled
+series are cached per (series, points).
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from flask import current_app
+
+from utils.risk import PriceHistoryError, PriceHistoryStore
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Select the indices of a shape-preserving downsample (LTTB).
+
+    The first and last points are always kept; the points in between are
+    split into points - 2 buckets and each bucket keeps the point forming
+    the largest triangle with the previously kept point and the average of
+    the next bucket. Bucket averages and triangle areas are computed with
+    NumPy; only the walk from bucket to bucket is a Python loop.
+
+    Args:
+        x (np.ndarray): Increasing x values
+        y (np.ndarray): y values
+        points (int): Number of points to keep (at least 3)
+
+    Returns:
+        np.ndarray: Sorted indices of the kept points
+    """
+    length = len(x)
+    if points >= length or length <= 2:
+        return np.arange(length)
+    if points < 3:
+        raise ValueError("LTTB needs at least 3 points")
+
+    buckets = points - 2
+    # Bucket i covers the middle points [starts[i], starts[i + 1])
+    starts = np.floor(np.linspace(1, length - 1, buckets + 1)).astype(np.intp)
+    counts = np.diff(starts)
+    averages_x = np.add.reduceat(x[1:length - 1], starts[:-1] - 1) / counts
+    averages_y = np.add.reduceat(y[1:length - 1], starts[:-1] - 1) / counts
+    # The point after the last bucket is the final point itself
+    next_x = np.append(averages_x[1:], x[-1])
+    next_y = np.append(averages_y[1:], y[-1])
+
+    selected = np.empty(points, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = length - 1
+    anchor = 0
+    for bucket in range(buckets):
+        low, high = starts[bucket], starts[bucket + 1]
+        ax, ay = x[anchor], y[anchor]
+        areas = np.abs((ax - next_x[bucket]) * (y[low:high] - ay)
+                       - (ax - x[low:high]) * (next_y[bucket] - ay))
+        anchor = low + int(np.argmax(areas))
+        selected[bucket + 1] = anchor
+    return selected
+
+
+def downsample(dates: np.ndarray, values: np.ndarray, points: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Downsample a daily series to at most `points` points with LTTB.
+
+    Args:
+        dates (np.ndarray): datetime64[D] dates in increasing order
+        values (np.ndarray): Values per date
+        points (int): Maximum number of points (None keeps every point)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (dates, values) of the kept points
+    """
+    if points is None or points >= len(dates):
+        return dates, values
+    indices = lttb_indices(dates.astype(np.int64).astype(np.float64), values, points)
+    return dates[indices], values[indices]
+
+
+class _LRUCache:
+    """
+    Small thread-safe LRU mapping.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ChartService:
+    """
+    Serves downsampled ticker price and portfolio value series.
+    """
+
+    def __init__(self, prices: PriceHistoryStore, cache_size: int = 1024):
+        """
+        Initialize the service.
+
+        Args:
+            prices (PriceHistoryStore): Source of daily closes
+            cache_size (int): Downsampled series kept in the LRU cache
+        """
+        self.prices = prices
+        self._cache = _LRUCache(cache_size)
+
+    @staticmethod
+    def _window(dates: np.ndarray, start: Optional[str], end: Optional[str]) -> slice:
+        low = np.searchsorted(dates, np.datetime64(start, 'D')) if start else 0
+        high = np.searchsorted(dates, np.datetime64(end, 'D'), side='right') if end else len(dates)
+        return slice(low, high)
+
+    @staticmethod
+    def _to_points(dates: np.ndarray, values: np.ndarray) -> List[Dict[str, Any]]:
+        return [
+            {'date': date, 'value': round(value, 4)}
+            for date, value in zip(dates.astype(str).tolist(), values.tolist())
+        ]
+
+    def _cached(self, key: Tuple, points: Optional[int], build) -> Dict[str, Any]:
+        # Full-resolution series are unbounded in size, so only downsampled
+        # ones are cached
+        if points is None:
+            return build()
+        series = self._cache.get(key)
+        if series is None:
+            series = build()
+            self._cache.put(key, series)
+        return series
+
+    def ticker_history(self, ticker: str, points: Optional[int] = None,
+                       start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get a ticker's daily closes, downsampled to at most `points` points.
+
+        Args:
+            ticker (str): Stock symbol
+            points (int): Maximum number of points (None for full resolution)
+            start (str): First date (YYYY-MM-DD, optional)
+            end (str): Last date (YYYY-MM-DD, optional)
+
+        Returns:
+            Dict: Series with `points` as [{date, value}]
+
+        Raises:
+            PriceHistoryError: If the ticker has no price history
+        """
+        ticker = ticker.upper()
+        version = self.prices.version(ticker)
+        if version is None:
+            raise PriceHistoryError(f"No price history for {ticker}")
+
+        def build():
+            dates, closes = self.prices.load(ticker)
+            window = self._window(dates, start, end)
+            dates, closes = dates[window], closes[window]
+            kept_dates, kept_closes = downsample(dates, closes, points)
+            return {
+                'ticker': ticker,
+                'original_points': len(dates),
+                'points': self._to_points(kept_dates, kept_closes),
+            }
+
+        return self._cached(('ticker', ticker, version, points, start, end), points, build)
+
+    def portfolio_history(self, portfolio_id: int, holdings: List[Dict[str, Any]],
+                          points: Optional[int] = None, start: Optional[str] = None,
+                          end: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get a portfolio's daily market value, downsampled to at most `points` points.
+
+        Each holding counts from its purchase date (or from the start when it
+        has none), valued at the ticker's close forward-filled over days
+        without one. Before a ticker's first close, and for tickers with no
+        price history, the purchase price is used.
+
+        Args:
+            portfolio_id (int): Portfolio the holdings belong to (cache key)
+            holdings (List[Dict]): Holdings with ticker, shares, purchase_price, purchase_date
+            points (int): Maximum number of points (None for full resolution)
+            start (str): First date (YYYY-MM-DD, optional)
+            end (str): Last date (YYYY-MM-DD, optional)
+
+        Returns:
+            Dict: Series with `points` as [{date, value}]
+        """
+        tickers = sorted({holding['ticker'] for holding in holdings})
+        versions = tuple(self.prices.version(ticker) for ticker in tickers)
+
+        def build():
+            histories = {}
+            for ticker, version in zip(tickers, versions):
+                history = self.prices.load(ticker) if version is not None else None
+                if history is not None and len(history[0]):
+                    histories[ticker] = history
+
+            if histories:
+                calendar = np.unique(np.concatenate([dates for dates, _ in histories.values()]))
+            else:
+                calendar = np.empty(0, dtype='datetime64[D]')
+            calendar = calendar[self._window(calendar, start, end)]
+
+            values = np.zeros(len(calendar))
+            for holding in holdings:
+                history = histories.get(holding['ticker'])
+                if history is None:
+                    prices = np.full(len(calendar), float(holding['purchase_price']))
+                else:
+                    dates, closes = history
+                    positions = np.searchsorted(dates, calendar, side='right') - 1
+                    prices = np.where(positions >= 0, closes[np.clip(positions, 0, None)],
+                                      float(holding['purchase_price']))
+                held = float(holding['shares']) * prices
+                if holding.get('purchase_date'):
+                    held[calendar < np.datetime64(holding['purchase_date'], 'D')] = 0.0
+                values += held
+
+            kept_dates, kept_values = downsample(calendar, values, points)
+            return {
+                'portfolio_id': portfolio_id,
+                'missing_tickers': [t for t in tickers if t not in histories],
+                'original_points': len(calendar),
+                'points': self._to_points(kept_dates, kept_values),
+            }
+
+        return self._cached(('portfolio', portfolio_id, versions, points, start, end), points, build)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dict: Cached series count, hits and misses
+        """
+        return {
+            'cached_series': len(self._cache),
+            'max_cached_series': self._cache.max_entries,
+            'hits': self._cache.hits,
+            'misses': self._cache.misses,
+        }
+
+
+def init_chart_service(app) -> ChartService:
+    """
+    Create the chart service for a Flask app from its config.
+
+    Shares the risk engine's price history store (and its parsed files),
+    so init_risk_engine must run first.
+
+    Args:
+        app (Flask): Application to attach the service to
+
+    Returns:
+        ChartService: The created service
+    """
+    service = ChartService(app.extensions['risk_engine'].prices,
+                           cache_size=app.config['CHART_CACHE_SIZE'])
+    app.extensions['chart_service'] = service
+    return service
+
+
+def get_chart_service() -> ChartService:
+    """Get the chart service of the current Flask app."""
+    return current_app.extensions['chart_service']
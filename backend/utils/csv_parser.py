@@ -5,10 +5,12 @@ Handles parsing and validation of uploaded portfolio CSV files.
 
 import csv
 import logging
+import re
 from datetime import datetime
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Iterable, TextIO, Optional
 import pandas as pd
 from io import StringIO
+from utils.mmap_reader import MappedCSVReader, should_use_mmap, MMAP_THRESHOLD_BYTES
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,9 +27,37 @@ class PortfolioCSVParser:
     # Optional columns that can be included
     OPTIONAL_COLUMNS = ['company_name', 'sector', 'notes']
     
-    def __init__(self):
+    # Files on disk at or above this size are parsed through mmap
+    MMAP_THRESHOLD = MMAP_THRESHOLD_BYTES
+    
+    # Row errors after which parsing stops (None parses the whole file)
+    MAX_ERRORS = 100
+    
+    # Row numbers kept as examples of each distinct row error
+    ERROR_SAMPLE_ROWS = 5
+    
+    # Quoted values are masked so e.g. every non-numeric share count is one error
+    _QUOTED_VALUE = re.compile(r"'[^']*'")
+    
+    def __init__(self, max_errors: Optional[int] = MAX_ERRORS, prevalidate_rows: int = 0,
+                 prevalidate_max_error_ratio: float = 0.5):
+        """
+        Initialize the parser.
+        
+        Args:
+            max_errors (int): Row errors after which parsing stops, or None for no limit
+            prevalidate_rows (int): Number of leading rows checked before the rest
+                of the file is read (0 disables pre-validation)
+            prevalidate_max_error_ratio (float): Share of invalid rows among the
+                first prevalidate_rows at which the file is rejected
+        """
+        self.max_errors = max_errors
+        self.prevalidate_rows = prevalidate_rows
+        self.prevalidate_max_error_ratio = prevalidate_max_error_ratio
         self.errors = []
         self.warnings = []
+        self.error_groups = []
+        self.aborted = False
     
     def parse_csv(self, csv_content: str, filename: str = None) -> Tuple[List[Dict[str, Any]], List[str], List[str]]:
         """
@@ -40,31 +70,76 @@ class PortfolioCSVParser:
         Returns:
             Tuple[List[Dict], List[str], List[str]]: (parsed_data, errors, warnings)
         """
-        self.errors = []
-        self.warnings = []
+        self._reset()
         
         try:
             # Read CSV content
             csv_reader = csv.DictReader(StringIO(csv_content))
+            parsed_data = self._parse_rows(csv_reader.fieldnames, csv_reader, filename)
+            return parsed_data, self.errors, self.warnings
+            
+        except Exception as e:
+            error_msg = f"Failed to parse CSV file: {str(e)}"
+            self.errors.append(error_msg)
+            logger.error(f"CSV parsing error in {filename}: {error_msg}")
+            return [], self.errors, self.warnings
+    
+    def parse_csv_stream(self, csv_stream: TextIO, filename: str = None) -> Tuple[List[Dict[str, Any]], List[str], List[str]]:
+        """
+        Parse CSV rows from a text stream as they are read.
+        
+        Unlike parse_csv, errors raised by the stream itself (decoding or
+        decompression failures) are not collected but propagate to the caller.
+        
+        Args:
+            csv_stream (TextIO): Text stream positioned at the CSV header
+            filename (str): Original filename for logging purposes
             
-            # Validate headers
-            if not self._validate_headers(csv_reader.fieldnames):
-                return [], self.errors, self.warnings
+        Returns:
+            Tuple[List[Dict], List[str], List[str]]: (parsed_data, errors, warnings)
+        """
+        self._reset()
+        
+        try:
+            csv_reader = csv.DictReader(csv_stream)
+            parsed_data = self._parse_rows(csv_reader.fieldnames, csv_reader, filename)
+            return parsed_data, self.errors, self.warnings
             
-            # Parse and validate each row
-            parsed_data = []
-            for row_num, row in enumerate(csv_reader, start=2):  # Start at 2 (header is row 1)
-                try:
-                    validated_row = self._validate_and_parse_row(row, row_num)
-                    if validated_row:
-                        parsed_data.append(validated_row)
-                except Exception as e:
-                    error_msg = f"Error processing row {row_num}: {str(e)}"
-                    self.errors.append(error_msg)
-                    logger.error(f"CSV parsing error in {filename}: {error_msg}")
+        except csv.Error as e:
+            error_msg = f"Failed to parse CSV file: {str(e)}"
+            self.errors.append(error_msg)
+            logger.error(f"CSV parsing error in {filename}: {error_msg}")
+            return [], self.errors, self.warnings
+    
+    def parse_csv_file(self, file_path: str, filename: str = None,
+                       collect: bool = True) -> Tuple[List[Dict[str, Any]], List[str], List[str]]:
+        """
+        Parse a CSV file from disk and return validated portfolio data.
+        
+        Files at or above MMAP_THRESHOLD are scanned from a memory-mapped
+        buffer, decoding only the known portfolio columns; smaller files are
+        streamed through csv.DictReader.
+        
+        Args:
+            file_path (str): Path to CSV file
+            filename (str): Original filename for logging purposes
+            collect (bool): Keep parsed rows (False when only validating)
             
-            # Log summary
-            logger.info(f"Successfully parsed {len(parsed_data)} holdings from {filename}")
+        Returns:
+            Tuple[List[Dict], List[str], List[str]]: (parsed_data, errors, warnings)
+        """
+        self._reset()
+        filename = filename or file_path
+        
+        try:
+            if should_use_mmap(file_path, self.MMAP_THRESHOLD):
+                columns = self.REQUIRED_COLUMNS + self.OPTIONAL_COLUMNS
+                with MappedCSVReader(file_path, columns=columns) as reader:
+                    parsed_data = self._parse_rows(reader.fieldnames, reader, filename, collect)
+            else:
+                with open(file_path, 'r', newline='', encoding='utf-8-sig') as file:
+                    csv_reader = csv.DictReader(file)
+                    parsed_data = self._parse_rows(csv_reader.fieldnames, csv_reader, filename, collect)
             
             return parsed_data, self.errors, self.warnings
             
@@ -74,6 +149,87 @@ class PortfolioCSVParser:
             logger.error(f"CSV parsing error in {filename}: {error_msg}")
             return [], self.errors, self.warnings
     
+    def _reset(self):
+        self.errors = []
+        self.warnings = []
+        self.error_groups = []
+        self.aborted = False
+    
+    def _parse_rows(self, fieldnames: List[str], rows: Iterable[Dict[str, str]],
+                    filename: str = None, collect: bool = True) -> List[Dict[str, Any]]:
+        """
+        Validate headers and parse each row from a row iterator.
+        
+        Identical row errors are reported once with a count and sample row
+        numbers. Reading stops early, leaving the rest of the iterator
+        unread, once max_errors row errors were found or as soon as
+        prevalidate_max_error_ratio of the first prevalidate_rows rows are
+        known to be invalid.
+        
+        Args:
+            fieldnames (List[str]): Column headers of the CSV
+            rows (Iterable[Dict]): Raw rows keyed by header name
+            filename (str): Original filename for logging purposes
+            collect (bool): Keep parsed rows (False when only validating)
+            
+        Returns:
+            List[Dict]: Parsed rows (empty when collect is False)
+        """
+        # Validate headers
+        if not self._validate_headers(fieldnames):
+            return []
+        
+        # Parse and validate each row
+        parsed_data = []
+        parsed_count = 0
+        error_count = 0
+        groups = {}
+        for row_num, row in enumerate(rows, start=2):  # Start at 2 (header is row 1)
+            try:
+                validated_row = self._validate_and_parse_row(row, row_num)
+                if validated_row:
+                    parsed_count += 1
+                    if collect:
+                        parsed_data.append(validated_row)
+            except Exception as e:
+                error_count += 1
+                message = str(e)
+                key = self._QUOTED_VALUE.sub("'...'", message)
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = {'message': message, 'count': 0, 'rows': []}
+                    logger.error(f"CSV parsing error in {filename}: Error processing row {row_num}: {message}")
+                group['count'] += 1
+                if len(group['rows']) < self.ERROR_SAMPLE_ROWS:
+                    group['rows'].append(row_num)
+                
+                # Pre-validation: give up as soon as the first rows are mostly invalid
+                if (row_num - 1 <= self.prevalidate_rows
+                        and error_count >= self.prevalidate_max_error_ratio * self.prevalidate_rows):
+                    self.aborted = True
+                    abort_msg = f"File rejected: {error_count} of the first {row_num - 1} rows are invalid"
+                    break
+                if self.max_errors is not None and error_count >= self.max_errors:
+                    self.aborted = True
+                    abort_msg = f"Parsing stopped at row {row_num} after {error_count} row errors"
+                    break
+        
+        self.error_groups = list(groups.values())
+        for group in self.error_groups:
+            if group['count'] == 1:
+                self.errors.append(f"Error processing row {group['rows'][0]}: {group['message']}")
+            else:
+                sample = ', '.join(str(row_num) for row_num in group['rows'])
+                self.errors.append(f"Error processing {group['count']} rows (e.g. rows {sample}): {group['message']}")
+        if self.aborted:
+            self.errors.append(f"{abort_msg}; the rest of the file was not read")
+            logger.warning(f"{abort_msg} in {filename}")
+        
+        # Log summary
+        logger.info(f"Successfully parsed {parsed_count} holdings from {filename}")
+        
+        return parsed_data
+    
     def _validate_headers(self, headers: List[str]) -> bool:
         """
         Validate that CSV has all required columns.
@@ -226,10 +382,7 @@ class PortfolioCSVParser:
             Tuple[bool, List[str], List[str]]: (is_valid, errors, warnings)
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                csv_content = file.read()
-            
-            parsed_data, errors, warnings = self.parse_csv(csv_content, file_path)
+            parsed_data, errors, warnings = self.parse_csv_file(file_path, collect=False)
             return len(errors) == 0, errors, warnings
             
         except Exception as e:
@@ -238,24 +391,57 @@ class PortfolioCSVParser:
             return False, [error_msg], []
 
 
-def parse_portfolio_csv(csv_content: str, filename: str = None) -> Dict[str, Any]:
+def parse_portfolio_csv(csv_content: str, filename: str = None, **options: Any) -> Dict[str, Any]:
     """
     Convenience function to parse portfolio CSV content.
     
     Args:
         csv_content (str): Raw CSV content as string
         filename (str): Original filename for logging purposes
+        **options: max_errors, prevalidate_rows and prevalidate_max_error_ratio
+            passed to PortfolioCSVParser
         
     Returns:
-        Dict[str, Any]: Parsing results with data, errors, and warnings
+        Dict[str, Any]: Parsing results with data, errors (row errors grouped),
+        error_groups, warnings, and aborted when parsing stopped early
     """
-    parser = PortfolioCSVParser()
+    parser = PortfolioCSVParser(**options)
     parsed_data, errors, warnings = parser.parse_csv(csv_content, filename)
     
     return {
         'data': parsed_data,
         'errors': errors,
         'warnings': warnings,
+        'error_groups': parser.error_groups,
+        'aborted': parser.aborted,
+        'success': len(errors) == 0,
+        'count': len(parsed_data)
+    }
+
+
+def parse_portfolio_csv_stream(csv_stream: TextIO, filename: str = None, **options: Any) -> Dict[str, Any]:
+    """
+    Convenience function to parse portfolio CSV rows from a text stream.
+    
+    Args:
+        csv_stream (TextIO): Text stream of CSV content
+        filename (str): Original filename for logging purposes
+        **options: max_errors, prevalidate_rows and prevalidate_max_error_ratio
+            passed to PortfolioCSVParser
+        
+    Returns:
+        Dict[str, Any]: Parsing results with data, errors (row errors grouped),
+        error_groups, warnings, and aborted when parsing stopped early
+    """
+    parser = PortfolioCSVParser(**options)
+    parsed_data, errors, warnings = parser.parse_csv_stream(csv_stream, filename)
+    
+    return {
+        'data': parsed_data,
+        'errors': errors,
+        'warnings': warnings,
+        'error_groups': parser.error_groups,
+        'aborted': parser.aborted,
         'success': len(errors) == 0,
         'count': len(parsed_data)
     }
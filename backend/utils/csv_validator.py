@@ -1,17 +1,27 @@
 import csv
 import os
+from contextlib import contextmanager
 from datetime import datetime
+from utils.mmap_reader import MappedCSVReader, should_use_mmap
 
 REQUIRED_COLUMNS = ['Ticker', 'Shares', 'Purchase Price', 'Current Price', 'Purchase Date']
 
+@contextmanager
+def open_csv_rows(filepath):
+    """Open a CSV file for row iteration, memory-mapping large files"""
+    if should_use_mmap(filepath):
+        with MappedCSVReader(filepath, columns=REQUIRED_COLUMNS) as reader:
+            yield reader
+    else:
+        with open(filepath, 'r', newline='', encoding='utf-8-sig') as file:
+            yield csv.DictReader(file)
+
 def validate_csv_file(filepath):
     """Validate CSV file structure and content"""
     try:
-        with open(filepath, 'r', newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            
+        with open_csv_rows(filepath) as reader:
             # Check if required columns exist
-            if not all(col in reader.fieldnames for col in REQUIRED_COLUMNS):
+            if not reader.fieldnames or not all(col in reader.fieldnames for col in REQUIRED_COLUMNS):
                 return {
                     'valid': False, 
                     'error': f'Missing required columns. Expected: {", ".join(REQUIRED_COLUMNS)}'
@@ -59,9 +69,7 @@ def parse_stocks_csv(filepath):
     """Parse validated CSV file and return structured data"""
     stocks = []
     
-    with open(filepath, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        
+    with open_csv_rows(filepath) as reader:
         for row in reader:
             stock = {
                 'ticker': row['Ticker'].strip().upper(),
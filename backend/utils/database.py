@@ -4,29 +4,266 @@ Handles SQLite database operations for portfolios and holdings.
 """
 
 import sqlite3
+import hashlib
+import json
 import logging
+import math
 import os
-from typing import List, Dict, Any, Optional, Tuple
+import queue
+import threading
+import time
+from urllib.parse import quote
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 from contextlib import contextmanager
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from utils.digest import UNCLASSIFIED_SECTOR, normalize_sector
+from utils.lots import (reconcile_snapshot, snapshot_positions, sold_tickers, validate_method,
+                        LotRebuildThrottledError, LotSyncConflictError)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class IngestWriterQueue:
+    """
+    Single writer thread that group-commits concurrent portfolio ingests.
+    
+    Ingest requests arriving within a short window are written in one
+    transaction (one fsync). Each request runs inside its own savepoint, so
+    a failing request is rolled back on its own and the rest of the batch
+    still commits. Every caller is resolved with its own portfolio_id.
+    """
+    
+    def __init__(self, manager: 'DatabaseManager', shard: int = 0, window: float = 0.005,
+                 max_batch: int = 64, max_batch_rows: int = 200000):
+        """
+        Initialize the writer queue.
+        
+        Args:
+            manager (DatabaseManager): Database to write to
+            shard (int): Shard file this writer commits to
+            window (float): Seconds to wait for more requests after the first
+            max_batch (int): Maximum ingests per transaction
+            max_batch_rows (int): Stop collecting once this many holdings are batched
+        """
+        self.manager = manager
+        self.shard = shard
+        self.window = window
+        self.max_batch = max_batch
+        self.max_batch_rows = max_batch_rows
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f'db-ingest-writer-{shard}', daemon=True)
+        self._thread.start()
+    
+    def submit(self, user_id: str, file_name: str, holdings_list: List[Dict[str, Any]],
+               digest: Optional[Dict[str, Any]] = None) -> Future:
+        """
+        Queue a portfolio ingest.
+        
+        Returns:
+            Future: Resolves to (portfolio_id, holdings_count)
+        """
+        future = Future()
+        self._queue.put((user_id, file_name, holdings_list, digest, future))
+        return future
+    
+    def _collect_batch(self) -> List[Tuple]:
+        batch = [self._queue.get()]
+        rows = len(batch[0][2])
+        deadline = time.monotonic() + self.window
+        
+        while len(batch) < self.max_batch and rows < self.max_batch_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    request = self._queue.get(timeout=remaining)
+                else:
+                    request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            rows += len(request[2])
+        
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            # Skip requests whose callers already gave up
+            batch = [request for request in batch if request[-1].set_running_or_notify_cancel()]
+            if batch:
+                self._commit_batch(batch)
+    
+    def _commit_batch(self, batch: List[Tuple]):
+        results = []
+        discovered_tickers = {}
+        try:
+            with self.manager.get_connection(self.shard) as conn:
+                conn.isolation_level = None  # Manage the transaction explicitly
+                conn.execute("BEGIN IMMEDIATE")
+                
+                for user_id, file_name, holdings_list, digest, future in batch:
+                    conn.execute("SAVEPOINT ingest")
+                    # Ticker ids seen so far in this transaction; dropped if rolled back
+                    request_tickers = dict(discovered_tickers)
+                    try:
+                        local_id = self.manager._insert_portfolio_row(conn, user_id, file_name)
+                        holdings_count = self.manager._insert_holding_rows(
+                            conn, self.shard, local_id, holdings_list, request_tickers
+                        )
+                        if digest is not None:
+                            self.manager._upsert_digest_row(conn, local_id, digest)
+                        conn.execute("RELEASE SAVEPOINT ingest")
+                        discovered_tickers = request_tickers
+                        portfolio_id = self.manager.encode_portfolio_id(self.shard, local_id)
+                        results.append((future, (portfolio_id, holdings_count), None))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO SAVEPOINT ingest")
+                        conn.execute("RELEASE SAVEPOINT ingest")
+                        logger.error(f"Failed to ingest portfolio for user {user_id}: {str(e)}")
+                        results.append((future, None, e))
+                
+                conn.execute("COMMIT")
+                self.manager._cache_ticker_ids(self.shard, discovered_tickers)
+                
+        except Exception as e:
+            logger.error(f"Group commit of {len(batch)} ingests failed: {str(e)}")
+            for request in batch:
+                request[-1].set_exception(e)
+            return
+        
+        logger.info(f"Group-committed {len(batch)} portfolio ingests on shard {self.shard}")
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+class _BackupRestarted(Exception):
+    """Raised from a backup progress callback to stop restarting a paged backup."""
+
+
 class DatabaseManager:
     """
     Manages SQLite database operations for portfolio data.
+    
+    Data can be split across several shard files. Each user lives on exactly
+    one shard, chosen by a stable hash of user_id, and portfolio ids carry
+    their shard in the bits above SHARD_ID_BITS, so a portfolio id alone is
+    enough to route a lookup. With a single shard ids are plain row ids.
     """
     
-    def __init__(self, db_path: str = "captura.db"):
+    # Low bits of a portfolio id hold the per-shard row id
+    SHARD_ID_BITS = 40
+    
+    # Idempotent statements bringing databases created by older versions up to date
+    SCHEMA_UPGRADES = [
+        """CREATE TABLE IF NOT EXISTS tickers (
+               id INTEGER PRIMARY KEY,
+               symbol TEXT NOT NULL UNIQUE,
+               company_name TEXT
+           )""",
+        """CREATE TABLE IF NOT EXISTS sectors (
+               id INTEGER PRIMARY KEY,
+               name TEXT NOT NULL UNIQUE COLLATE NOCASE
+           )""",
+        """CREATE TABLE IF NOT EXISTS portfolio_digests (
+               portfolio_id INTEGER PRIMARY KEY,
+               digest TEXT NOT NULL,
+               created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+               FOREIGN KEY (portfolio_id) REFERENCES portfolios(id) ON DELETE CASCADE
+           )""",
+        """CREATE TABLE IF NOT EXISTS lots (
+               id INTEGER PRIMARY KEY,
+               user_id TEXT NOT NULL,
+               ticker_id INTEGER NOT NULL,
+               purchase_date DATE,
+               acquired_date DATE NOT NULL,
+               cost_per_share REAL NOT NULL,
+               shares REAL NOT NULL,
+               remaining REAL NOT NULL,
+               portfolio_id INTEGER NOT NULL,
+               FOREIGN KEY (ticker_id) REFERENCES tickers(id)
+           )""",
+        """CREATE INDEX IF NOT EXISTS idx_lots_open
+           ON lots(user_id, acquired_date, id) WHERE remaining > 0""",
+        """CREATE TABLE IF NOT EXISTS realized_gains (
+               id INTEGER PRIMARY KEY,
+               user_id TEXT NOT NULL,
+               lot_id INTEGER NOT NULL,
+               portfolio_id INTEGER NOT NULL,
+               sale_date DATE NOT NULL,
+               shares REAL NOT NULL,
+               cost_basis REAL NOT NULL,
+               proceeds REAL,
+               gain REAL,
+               term TEXT NOT NULL,
+               FOREIGN KEY (lot_id) REFERENCES lots(id) ON DELETE CASCADE
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_realized_gains_user ON realized_gains(user_id, sale_date)",
+        "CREATE INDEX IF NOT EXISTS idx_realized_gains_lot ON realized_gains(lot_id)",
+        """CREATE TABLE IF NOT EXISTS lot_state (
+               user_id TEXT PRIMARY KEY,
+               method TEXT NOT NULL,
+               last_upload_date DATETIME NOT NULL,
+               last_portfolio_id INTEGER NOT NULL,
+               updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+               rebuilt_at DATETIME
+           )""",
+    ]
+    
+    # Indexes on the holdings table. idx_holdings_allocation also serves
+    # lookups by portfolio_id and covers the allocation rollups.
+    HOLDINGS_INDEXES = [
+        """CREATE INDEX IF NOT EXISTS idx_holdings_allocation
+           ON holdings(portfolio_id, sector_id, ticker_id, shares, purchase_price)""",
+        "CREATE INDEX IF NOT EXISTS idx_holdings_ticker_id ON holdings(ticker_id)",
+        "CREATE INDEX IF NOT EXISTS idx_holdings_purchase_date ON holdings(purchase_date)",
+    ]
+    
+    # Columns produced by iter_holdings_export, in output order
+    EXPORT_COLUMNS = (
+        'portfolio_id', 'user_id', 'file_name', 'upload_date',
+        'holding_id', 'ticker', 'shares', 'purchase_price', 'purchase_date'
+    )
+    
+    # Paged backups restarted this often by concurrent commits finish in one step
+    MAX_BACKUP_RESTARTS = 3
+    
+    # Columns of iter_snapshot_rows
+    SNAPSHOT_COLUMNS = (
+        'portfolio_id', 'user_id', 'upload_date', 'ticker', 'sector',
+        'shares', 'purchase_price', 'latest'
+    )
+    
+    def __init__(self, db_path: str = "captura.db", shard_count: int = 1,
+                 replica_path: Optional[str] = None):
         """
         Initialize database manager.
         
         Args:
             db_path (str): Path to SQLite database file
+            shard_count (int): Number of shard files (1 keeps a single file at db_path)
+            replica_path (str): Path of the read-only replica refreshed by
+                refresh_replica (sharded like db_path), or None for no replica
         """
+        if shard_count < 1 or shard_count >= 2 ** (63 - self.SHARD_ID_BITS):
+            raise ValueError(f"Invalid shard count: {shard_count}")
+        
         self.db_path = db_path
+        self.shard_count = shard_count
+        self.shard_paths = self.get_shard_paths(db_path, shard_count)
+        self.replica_paths = self.get_shard_paths(replica_path, shard_count) if replica_path else None
+        self._replica_lock = threading.Lock()
+        # Group-commit writers per shard, started on first ingest
+        self._writers = {}
+        self._writer_lock = threading.Lock()
+        # Committed symbol -> tickers.id mappings per shard
+        self._ticker_ids = [{} for _ in range(shard_count)]
+        self._ticker_lock = threading.Lock()
         # Get the absolute path to the schema file
         self.schema_path = self._get_schema_path()
         self._initialize_database()
@@ -48,26 +285,290 @@ class DatabaseManager:
         logger.info(f"Looking for schema file at: {schema_path}")
         return schema_path
     
+    @staticmethod
+    def get_shard_paths(db_path: str, shard_count: int) -> List[str]:
+        """
+        Get the shard file paths for a database path.
+        
+        A single shard uses db_path itself; N shards use
+        <name>.shard0<ext> ... <name>.shard<N-1><ext> next to it.
+        
+        Args:
+            db_path (str): Base database path
+            shard_count (int): Number of shards
+            
+        Returns:
+            List[str]: One path per shard
+        """
+        if shard_count == 1:
+            return [db_path]
+        root, ext = os.path.splitext(db_path)
+        return [f"{root}.shard{shard}{ext}" for shard in range(shard_count)]
+    
+    def shard_for_user(self, user_id: str) -> int:
+        """
+        Get the shard holding a user's portfolios.
+        
+        Uses a stable hash so placement does not change between processes.
+        
+        Args:
+            user_id (str): User identifier
+            
+        Returns:
+            int: Shard index
+        """
+        if self.shard_count == 1:
+            return 0
+        digest = hashlib.blake2b(user_id.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.shard_count
+    
+    def encode_portfolio_id(self, shard: int, local_id: int) -> int:
+        """
+        Build a global portfolio id from a shard index and a shard-local row id.
+        """
+        return (shard << self.SHARD_ID_BITS) | local_id
+    
+    def decode_portfolio_id(self, portfolio_id: int) -> Optional[Tuple[int, int]]:
+        """
+        Split a global portfolio id into (shard, local row id).
+        
+        Returns:
+            Optional[Tuple[int, int]]: (shard, local_id) or None if the shard does not exist
+        """
+        shard = portfolio_id >> self.SHARD_ID_BITS
+        if portfolio_id < 0 or shard >= self.shard_count:
+            return None
+        return shard, portfolio_id & ((1 << self.SHARD_ID_BITS) - 1)
+    
+    def _globalize_rows(self, shard: int, rows: List[sqlite3.Row], keys: Tuple[str, ...]) -> List[Dict[str, Any]]:
+        """
+        Convert rows to dictionaries, encoding the given id columns for the shard.
+        """
+        results = [dict(row) for row in rows]
+        if shard:
+            base = shard << self.SHARD_ID_BITS
+            for result in results:
+                for key in keys:
+                    if result.get(key) is not None:
+                        result[key] += base
+        return results
+    
     def _initialize_database(self):
         """
         Initialize database by creating it and running schema if needed.
         Always ensures schema is applied, even for existing databases.
         """
         try:
-            # Check if database exists
-            if not os.path.exists(self.db_path):
-                logger.info(f"Creating new database: {self.db_path}")
-                self._create_database()
-            else:
-                logger.info(f"Using existing database: {self.db_path}")
-                # Always ensure schema is applied for existing databases
-                self._ensure_schema_applied()
+            for shard, path in enumerate(self.shard_paths):
+                # Check if database exists
+                if not os.path.exists(path):
+                    logger.info(f"Creating new database: {path}")
+                    self._create_database(shard)
+                else:
+                    logger.info(f"Using existing database: {path}")
+                    # Always ensure schema is applied for existing databases
+                    self._ensure_schema_applied(shard)
+                
+                self._apply_schema_upgrades(shard)
+                self._enable_wal(shard)
                 
         except Exception as e:
             logger.error(f"Failed to initialize database: {str(e)}")
             raise
     
-    def _create_database(self):
+    def _apply_schema_upgrades(self, shard: int = 0):
+        """
+        Apply SCHEMA_UPGRADES so existing databases gain newer tables.
+        """
+        with self.get_connection(shard) as conn:
+            for statement in self.SCHEMA_UPGRADES:
+                conn.execute(statement)
+            conn.commit()
+        self._migrate_holdings_ticker_ids(shard)
+        self._migrate_holdings_sectors(shard)
+        self._migrate_lot_positions(shard)
+    
+    def _migrate_holdings_ticker_ids(self, shard: int = 0):
+        """
+        Move holdings from a TEXT ticker column to a ticker_id referencing tickers.
+        
+        Databases created before the tickers table store the symbol in every
+        holding row. The table is rebuilt in one transaction: distinct symbols
+        go into tickers, holdings keep their ids and get the matching ticker_id.
+        """
+        with self.get_connection(shard) as conn:
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(holdings)")}
+            if 'ticker_id' in columns or 'ticker' not in columns:
+                return
+            
+            logger.info(f"Migrating holdings to ticker ids on {self.shard_paths[shard]}")
+            conn.isolation_level = None  # Manage the transaction explicitly
+            conn.execute("PRAGMA foreign_keys = OFF")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    """INSERT OR IGNORE INTO tickers (symbol)
+                       SELECT DISTINCT ticker FROM holdings ORDER BY ticker"""
+                )
+                conn.execute(
+                    """CREATE TABLE holdings_migrated (
+                           id INTEGER PRIMARY KEY AUTOINCREMENT,
+                           portfolio_id INTEGER NOT NULL,
+                           ticker_id INTEGER NOT NULL,
+                           shares REAL NOT NULL,
+                           purchase_price REAL NOT NULL,
+                           purchase_date DATE,
+                           sector_id INTEGER,
+                           notes TEXT,
+                           timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                           FOREIGN KEY (portfolio_id) REFERENCES portfolios(id) ON DELETE CASCADE,
+                           FOREIGN KEY (ticker_id) REFERENCES tickers(id),
+                           FOREIGN KEY (sector_id) REFERENCES sectors(id)
+                       )"""
+                )
+                conn.execute(
+                    """INSERT INTO holdings_migrated
+                       (id, portfolio_id, ticker_id, shares, purchase_price, purchase_date, timestamp)
+                       SELECT h.id, h.portfolio_id, t.id, h.shares, h.purchase_price,
+                              h.purchase_date, h.timestamp
+                       FROM holdings h
+                       JOIN tickers t ON t.symbol = h.ticker"""
+                )
+                conn.execute("DROP TABLE holdings")
+                conn.execute("ALTER TABLE holdings_migrated RENAME TO holdings")
+                for statement in self.HOLDINGS_INDEXES:
+                    conn.execute(statement)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.execute("PRAGMA foreign_keys = ON")
+            
+            migrated = conn.execute("SELECT COUNT(*) FROM holdings").fetchone()[0]
+            logger.info(f"Migrated {migrated} holdings to ticker ids")
+    
+    def _migrate_holdings_sectors(self, shard: int = 0):
+        """
+        Add the sector_id and notes columns to holdings.
+        
+        Databases created before sectors were normalized keep at most one
+        sector per ticker, in tickers.sector. Those names go into the sectors
+        table and become the sector_id of the ticker's holdings, then the old
+        column is dropped.
+        """
+        with self.get_connection(shard) as conn:
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(holdings)")}
+            if 'sector_id' in columns:
+                return
+            ticker_columns = {row['name'] for row in conn.execute("PRAGMA table_info(tickers)")}
+            
+            logger.info(f"Adding holding sectors and notes on {self.shard_paths[shard]}")
+            conn.isolation_level = None  # Manage the transaction explicitly
+            conn.execute("PRAGMA foreign_keys = OFF")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("ALTER TABLE holdings ADD COLUMN sector_id INTEGER REFERENCES sectors(id)")
+                conn.execute("ALTER TABLE holdings ADD COLUMN notes TEXT")
+                if 'sector' in ticker_columns:
+                    conn.execute(
+                        """INSERT OR IGNORE INTO sectors (name)
+                           SELECT DISTINCT sector FROM tickers WHERE sector IS NOT NULL ORDER BY sector"""
+                    )
+                    conn.execute(
+                        """UPDATE holdings SET sector_id = (
+                               SELECT s.id FROM tickers t JOIN sectors s ON s.name = t.sector
+                               WHERE t.id = holdings.ticker_id
+                           )"""
+                    )
+                    # Rebuilt rather than DROP COLUMN, which cannot edit
+                    # table definitions containing comments
+                    conn.execute(
+                        """CREATE TABLE tickers_migrated (
+                               id INTEGER PRIMARY KEY,
+                               symbol TEXT NOT NULL UNIQUE,
+                               company_name TEXT
+                           )"""
+                    )
+                    conn.execute(
+                        """INSERT INTO tickers_migrated (id, symbol, company_name)
+                           SELECT id, symbol, company_name FROM tickers"""
+                    )
+                    conn.execute("DROP TABLE tickers")
+                    conn.execute("ALTER TABLE tickers_migrated RENAME TO tickers")
+                conn.execute("DROP INDEX IF EXISTS idx_holdings_portfolio_id")
+                for statement in self.HOLDINGS_INDEXES:
+                    conn.execute(statement)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.execute("PRAGMA foreign_keys = ON")
+    
+    def _migrate_lot_positions(self, shard: int = 0):
+        """
+        Add the lot_positions table and the lot_state.rebuilt_at column.
+        
+        Users whose lots were synced before positions were stored get the
+        positions of their last applied upload. Where that upload has been
+        purged, their open lots are the closest record left and are used
+        instead.
+        """
+        with self.get_connection(shard) as conn:
+            state_columns = {row['name'] for row in conn.execute("PRAGMA table_info(lot_state)")}
+            has_positions = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'lot_positions'"
+            ).fetchone()
+            if 'rebuilt_at' in state_columns and has_positions:
+                return
+            
+            logger.info(f"Adding lot positions on {self.shard_paths[shard]}")
+            conn.isolation_level = None  # Manage the transaction explicitly
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if 'rebuilt_at' not in state_columns:
+                    conn.execute("ALTER TABLE lot_state ADD COLUMN rebuilt_at DATETIME")
+                if not has_positions:
+                    conn.execute(
+                        """CREATE TABLE lot_positions (
+                               user_id TEXT NOT NULL,
+                               ticker_id INTEGER NOT NULL,
+                               purchase_date TEXT NOT NULL,
+                               price REAL NOT NULL,
+                               shares REAL NOT NULL,
+                               PRIMARY KEY (user_id, ticker_id, purchase_date, price),
+                               FOREIGN KEY (ticker_id) REFERENCES tickers(id)
+                           )"""
+                    )
+                    states = conn.execute("SELECT user_id, last_portfolio_id FROM lot_state").fetchall()
+                    for state in states:
+                        rows = self._snapshot_rows(conn, state['last_portfolio_id'])
+                        if rows is None:
+                            rows = [dict(row) for row in conn.execute(
+                                """SELECT ticker_id, purchase_date, cost_per_share AS purchase_price,
+                                          remaining AS shares
+                                   FROM lots WHERE user_id = ? AND remaining > 0""",
+                                (state['user_id'],)
+                            )]
+                        self._save_lot_positions(conn, state['user_id'], snapshot_positions(rows))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    
+    def _enable_wal(self, shard: int = 0):
+        """
+        Switch the database to write-ahead logging.
+        
+        WAL lets readers proceed while a write transaction is open, so reads
+        keep flowing during a large ingest. The mode is persistent in the file.
+        """
+        with self.get_connection(shard) as conn:
+            mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            logger.info(f"Database journal mode: {mode}")
+    
+    def _create_database(self, shard: int = 0):
         """
         Create database and run schema.
         """
@@ -75,23 +576,23 @@ class DatabaseManager:
             # Read and execute schema
             if os.path.exists(self.schema_path):
                 logger.info(f"Applying schema from: {self.schema_path}")
-                self._execute_schema()
+                self._execute_schema(shard)
             else:
                 logger.warning(f"Schema file not found: {self.schema_path}")
                 # Create basic tables if schema file is missing
-                self._create_basic_tables()
+                self._create_basic_tables(shard)
                 
         except Exception as e:
             logger.error(f"Failed to create database: {str(e)}")
             raise
     
-    def _ensure_schema_applied(self):
+    def _ensure_schema_applied(self, shard: int = 0):
         """
         Ensure schema is applied to existing database.
         Checks if tables exist and applies schema if needed.
         """
         try:
-            with self.get_connection() as conn:
+            with self.get_connection(shard) as conn:
                 # Check if portfolios table exists
                 cursor = conn.execute("""
                     SELECT name FROM sqlite_master 
@@ -101,10 +602,10 @@ class DatabaseManager:
                 if not cursor.fetchone():
                     logger.info("Portfolios table not found, applying schema")
                     if os.path.exists(self.schema_path):
-                        self._execute_schema()
+                        self._execute_schema(shard)
                     else:
                         logger.warning("Schema file not found, creating basic tables")
-                        self._create_basic_tables()
+                        self._create_basic_tables(shard)
                 else:
                     logger.info("Database schema already applied")
                     
@@ -112,7 +613,7 @@ class DatabaseManager:
             logger.error(f"Failed to ensure schema applied: {str(e)}")
             raise
     
-    def _execute_schema(self):
+    def _execute_schema(self, shard: int = 0):
         """
         Execute the database schema from the schema file.
         """
@@ -122,9 +623,12 @@ class DatabaseManager:
             
             logger.info(f"Schema file content length: {len(schema_sql)} characters")
             
-            with self.get_connection() as conn:
+            with self.get_connection(shard) as conn:
                 # Split schema into individual statements
                 statements = [stmt.strip() for stmt in schema_sql.split(';') if stmt.strip()]
+                if self.shard_count > 1:
+                    # Sample rows would place the same user on every shard
+                    statements = [stmt for stmt in statements if not self._is_sample_insert(stmt)]
                 logger.info(f"Found {len(statements)} statements to execute")
                 
                 executed_count = 0
@@ -156,11 +660,22 @@ class DatabaseManager:
             logger.error(f"Failed to execute schema: {str(e)}")
             raise
     
-    def _create_basic_tables(self):
+    @staticmethod
+    def _is_sample_insert(statement: str) -> bool:
+        """
+        Check whether a schema statement inserts sample data.
+        """
+        lines = [line for line in statement.splitlines() if not line.strip().startswith('--')]
+        return ' '.join(lines).strip().upper().startswith('INSERT')
+    
+    def _create_basic_tables(self, shard: int = 0):
         """
         Create basic tables if schema file is not available.
         """
-        with self.get_connection() as conn:
+        with self.get_connection(shard) as conn:
+            # Must precede the first table to take effect
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            
             # Create portfolios table
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS portfolios (
@@ -171,41 +686,71 @@ class DatabaseManager:
                 )
             """)
             
+            # Create tickers table
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tickers (
+                    id INTEGER PRIMARY KEY,
+                    symbol TEXT NOT NULL UNIQUE,
+                    company_name TEXT
+                )
+            """)
+            
+            # Create sectors table
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sectors (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE COLLATE NOCASE
+                )
+            """)
+            
             # Create holdings table
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS holdings (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     portfolio_id INTEGER NOT NULL,
-                    ticker TEXT NOT NULL,
+                    ticker_id INTEGER NOT NULL,
                     shares REAL NOT NULL,
                     purchase_price REAL NOT NULL,
                     purchase_date DATE,
+                    sector_id INTEGER,
+                    notes TEXT,
                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (portfolio_id) REFERENCES portfolios(id) ON DELETE CASCADE
+                    FOREIGN KEY (portfolio_id) REFERENCES portfolios(id) ON DELETE CASCADE,
+                    FOREIGN KEY (ticker_id) REFERENCES tickers(id),
+                    FOREIGN KEY (sector_id) REFERENCES sectors(id)
                 )
             """)
             
             # Create indexes
             conn.execute("CREATE INDEX IF NOT EXISTS idx_portfolios_user_id ON portfolios(user_id)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_portfolios_upload_date ON portfolios(upload_date)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_holdings_portfolio_id ON holdings(portfolio_id)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_holdings_ticker ON holdings(ticker)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_holdings_purchase_date ON holdings(purchase_date)")
+            for statement in self.HOLDINGS_INDEXES:
+                conn.execute(statement)
             
             conn.commit()
             logger.info("Basic database tables created")
     
     @contextmanager
-    def get_connection(self):
+    def get_connection(self, shard: int = 0, replica: bool = False):
         """
         Context manager for database connections.
         
+        Args:
+            shard (int): Shard to connect to
+            replica (bool): Read from the shard's replica when one has been
+                written (falls back to the shard itself otherwise)
+        
         Yields:
             sqlite3.Connection: Database connection
         """
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            if replica and self.replica_paths and os.path.exists(self.replica_paths[shard]):
+                # Replicas are replaced by rename, never modified in place
+                uri = f"file:{quote(os.path.abspath(self.replica_paths[shard]))}?mode=ro&immutable=1"
+                conn = sqlite3.connect(uri, uri=True)
+            else:
+                conn = sqlite3.connect(self.shard_paths[shard])
             conn.row_factory = sqlite3.Row  # Enable dict-like access
             conn.execute("PRAGMA foreign_keys = ON")  # Enable foreign key constraints
             yield conn
@@ -218,6 +763,135 @@ class DatabaseManager:
             if conn:
                 conn.close()
     
+    def _insert_portfolio_row(self, conn: sqlite3.Connection, user_id: str, file_name: str) -> int:
+        """
+        Insert a portfolio row on an open connection without committing.
+        """
+        cursor = conn.execute(
+            "INSERT INTO portfolios (user_id, file_name) VALUES (?, ?)",
+            (user_id, file_name)
+        )
+        return cursor.lastrowid
+    
+    def _resolve_ticker_ids(self, conn: sqlite3.Connection, shard: int,
+                            holdings_list: List[Dict[str, Any]],
+                            discovered: Dict[str, int]) -> Dict[str, int]:
+        """
+        Map the holdings' ticker symbols to tickers.id on an open connection.
+        
+        Symbols come from the shard's in-process cache when possible; the
+        rest are looked up or inserted (with the company name when the
+        holding has one). Ids found this way are added to discovered, to be
+        published to the cache once the transaction commits, since a rolled
+        back insert must not leave a dangling id in the cache.
+        
+        Returns:
+            Dict[str, int]: symbol -> ticker id for every holding
+        """
+        cache = self._ticker_ids[shard]
+        ids = {}
+        missing = {}
+        for holding in holdings_list:
+            symbol = holding['ticker']
+            if symbol in ids or symbol in missing:
+                continue
+            ticker_id = cache.get(symbol) or discovered.get(symbol)
+            if ticker_id is not None:
+                ids[symbol] = ticker_id
+            else:
+                missing[symbol] = holding
+        
+        for symbol, holding in missing.items():
+            row = conn.execute(
+                """INSERT INTO tickers (symbol, company_name) VALUES (?, ?)
+                   ON CONFLICT(symbol) DO UPDATE SET
+                       company_name = COALESCE(tickers.company_name, excluded.company_name)
+                   RETURNING id""",
+                (symbol, holding.get('company_name'))
+            ).fetchone()
+            ids[symbol] = discovered[symbol] = row[0]
+        
+        return ids
+    
+    def _resolve_sector_ids(self, conn: sqlite3.Connection,
+                            holdings_list: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Map the holdings' sector names to sectors.id on an open connection.
+        
+        Names are matched case-insensitively; unknown ones are inserted with
+        the first spelling seen.
+        
+        Returns:
+            Dict[str, int]: normalized sector name -> sector id
+        """
+        names = {normalize_sector(holding.get('sector')) for holding in holdings_list}
+        names.discard(None)
+        ids = {}
+        for name in names:
+            row = conn.execute("SELECT id FROM sectors WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                row = conn.execute(
+                    "INSERT INTO sectors (name) VALUES (?) RETURNING id", (name,)
+                ).fetchone()
+            ids[name] = row[0]
+        return ids
+    
+    def _cache_ticker_ids(self, shard: int, discovered: Dict[str, int]):
+        """
+        Publish committed symbol -> ticker id mappings to the shard's cache.
+        """
+        if discovered:
+            with self._ticker_lock:
+                self._ticker_ids[shard].update(discovered)
+    
+    def clear_ticker_cache(self):
+        """
+        Drop cached ticker ids, e.g. after shard files were replaced.
+        """
+        with self._ticker_lock:
+            for cache in self._ticker_ids:
+                cache.clear()
+    
+    def _insert_holding_rows(self, conn: sqlite3.Connection, shard: int, portfolio_id: int,
+                             holdings_list: List[Dict[str, Any]],
+                             discovered: Dict[str, int]) -> int:
+        """
+        Insert holding rows on an open connection without committing.
+        
+        Ticker ids created or looked up are added to discovered; pass them
+        to _cache_ticker_ids after commit.
+        """
+        ticker_ids = self._resolve_ticker_ids(conn, shard, holdings_list, discovered)
+        sector_ids = self._resolve_sector_ids(conn, holdings_list)
+        conn.executemany(
+            """INSERT INTO holdings 
+               (portfolio_id, ticker_id, shares, purchase_price, purchase_date, sector_id, notes) 
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (
+                (
+                    portfolio_id,
+                    ticker_ids[holding['ticker']],
+                    holding['shares'],
+                    holding['purchase_price'],
+                    holding['purchase_date'],
+                    sector_ids.get(normalize_sector(holding.get('sector'))),
+                    holding.get('notes')
+                )
+                for holding in holdings_list
+            )
+        )
+        return len(holdings_list)
+    
+    def _upsert_digest_row(self, conn: sqlite3.Connection, local_id: int, digest: Dict[str, Any]):
+        """
+        Store a portfolio digest on an open connection without committing.
+        """
+        conn.execute(
+            """INSERT OR REPLACE INTO portfolio_digests (portfolio_id, digest)
+               VALUES (?, ?)""",
+            (local_id, json.dumps(digest, separators=(',', ':')))
+        )
+    
     def insert_portfolio(self, user_id: str, file_name: str) -> int:
         """
         Insert a new portfolio record.
@@ -233,13 +907,11 @@ class DatabaseManager:
             Exception: If insertion fails
         """
         try:
-            with self.get_connection() as conn:
-                cursor = conn.execute(
-                    "INSERT INTO portfolios (user_id, file_name) VALUES (?, ?)",
-                    (user_id, file_name)
-                )
-                portfolio_id = cursor.lastrowid
+            shard = self.shard_for_user(user_id)
+            with self.get_connection(shard) as conn:
+                local_id = self._insert_portfolio_row(conn, user_id, file_name)
                 conn.commit()
+                portfolio_id = self.encode_portfolio_id(shard, local_id)
                 logger.info(f"Inserted portfolio {portfolio_id} for user {user_id}")
                 return portfolio_id
                 
@@ -262,25 +934,16 @@ class DatabaseManager:
             Exception: If insertion fails
         """
         try:
-            with self.get_connection() as conn:
-                inserted_count = 0
-                
-                for holding in holdings_list:
-                    cursor = conn.execute(
-                        """INSERT INTO holdings 
-                           (portfolio_id, ticker, shares, purchase_price, purchase_date) 
-                           VALUES (?, ?, ?, ?, ?)""",
-                        (
-                            portfolio_id,
-                            holding['ticker'],
-                            holding['shares'],
-                            holding['purchase_price'],
-                            holding['purchase_date']
-                        )
-                    )
-                    inserted_count += 1
-                
+            location = self.decode_portfolio_id(portfolio_id)
+            if location is None:
+                raise ValueError(f"Portfolio {portfolio_id} does not belong to any shard")
+            shard, local_id = location
+            with self.get_connection(shard) as conn:
+                discovered_tickers = {}
+                inserted_count = self._insert_holding_rows(conn, shard, local_id, holdings_list,
+                                                           discovered_tickers)
                 conn.commit()
+                self._cache_ticker_ids(shard, discovered_tickers)
                 logger.info(f"Inserted {inserted_count} holdings for portfolio {portfolio_id}")
                 return inserted_count
                 
@@ -288,6 +951,52 @@ class DatabaseManager:
             logger.error(f"Failed to insert holdings: {str(e)}")
             raise
     
+    def submit_ingest(self, user_id: str, file_name: str,
+                      holdings_list: List[Dict[str, Any]],
+                      digest: Optional[Dict[str, Any]] = None) -> Future:
+        """
+        Queue a portfolio and its holdings on the group-commit writer.
+        
+        Concurrent ingests are coalesced into a single transaction, so many
+        simultaneous uploads share one write lock acquisition and one fsync.
+        Each shard has its own writer, so shards commit in parallel.
+        
+        Args:
+            user_id (str): User identifier
+            file_name (str): Original filename of uploaded CSV
+            holdings_list (List[Dict]): List of holding dictionaries
+            digest (Dict): Precomputed portfolio digest stored in the same transaction
+            
+        Returns:
+            Future: Resolves to (portfolio_id, holdings_count)
+        """
+        shard = self.shard_for_user(user_id)
+        with self._writer_lock:
+            writer = self._writers.get(shard)
+            if writer is None:
+                writer = self._writers[shard] = IngestWriterQueue(self, shard)
+        return writer.submit(user_id, file_name, holdings_list, digest)
+    
+    def ingest_portfolio(self, user_id: str, file_name: str,
+                         holdings_list: List[Dict[str, Any]],
+                         timeout: Optional[float] = None,
+                         digest: Optional[Dict[str, Any]] = None) -> Tuple[int, int]:
+        """
+        Insert a portfolio with its holdings through the group-commit writer.
+        
+        Args:
+            user_id (str): User identifier
+            file_name (str): Original filename of uploaded CSV
+            holdings_list (List[Dict]): List of holding dictionaries
+            timeout (float): Seconds to wait for the commit (None waits forever)
+            digest (Dict): Precomputed portfolio digest stored in the same transaction
+            
+        Returns:
+            Tuple[int, int]: (portfolio_id, holdings_count)
+        """
+        future = self.submit_ingest(user_id, file_name, holdings_list, digest)
+        return future.result(timeout=timeout)
+    
     def get_portfolio_by_id(self, portfolio_id: int) -> Optional[Dict[str, Any]]:
         """
         Get portfolio information by ID.
@@ -299,21 +1008,89 @@ class DatabaseManager:
             Optional[Dict]: Portfolio data or None if not found
         """
         try:
-            with self.get_connection() as conn:
+            location = self.decode_portfolio_id(portfolio_id)
+            if location is None:
+                return None
+            shard, local_id = location
+            
+            with self.get_connection(shard) as conn:
                 cursor = conn.execute(
                     "SELECT * FROM portfolios WHERE id = ?",
-                    (portfolio_id,)
+                    (local_id,)
                 )
                 row = cursor.fetchone()
                 
                 if row:
-                    return dict(row)
+                    return self._globalize_rows(shard, [row], ('id',))[0]
                 return None
                 
         except Exception as e:
             logger.error(f"Failed to get portfolio {portfolio_id}: {str(e)}")
             raise
     
+    def get_portfolio_digest(self, portfolio_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get the precomputed digest of a portfolio.
+        
+        Args:
+            portfolio_id (int): Portfolio ID to get the digest for
+            
+        Returns:
+            Optional[Dict]: Digest or None if no digest is stored
+        """
+        try:
+            location = self.decode_portfolio_id(portfolio_id)
+            if location is None:
+                return None
+            shard, local_id = location
+            
+            with self.get_connection(shard) as conn:
+                cursor = conn.execute(
+                    "SELECT digest FROM portfolio_digests WHERE portfolio_id = ?",
+                    (local_id,)
+                )
+                row = cursor.fetchone()
+                
+                if row:
+                    return json.loads(row['digest'])
+                return None
+                
+        except Exception as e:
+            logger.error(f"Failed to get digest for portfolio {portfolio_id}: {str(e)}")
+            raise
+    
+    def save_portfolio_digest(self, portfolio_id: int, digest: Dict[str, Any]) -> bool:
+        """
+        Store (or replace) the digest of an existing portfolio.
+        
+        Args:
+            portfolio_id (int): Portfolio ID the digest belongs to
+            digest (Dict): Digest to store
+            
+        Returns:
+            bool: True if stored, False if the portfolio does not exist
+        """
+        try:
+            location = self.decode_portfolio_id(portfolio_id)
+            if location is None:
+                return False
+            shard, local_id = location
+            
+            with self.get_connection(shard) as conn:
+                exists = conn.execute(
+                    "SELECT 1 FROM portfolios WHERE id = ?", (local_id,)
+                ).fetchone()
+                if not exists:
+                    return False
+                self._upsert_digest_row(conn, local_id, digest)
+                conn.commit()
+                logger.info(f"Stored digest for portfolio {portfolio_id}")
+                return True
+                
+        except Exception as e:
+            logger.error(f"Failed to save digest for portfolio {portfolio_id}: {str(e)}")
+            raise
+    
     def get_holdings_by_portfolio(self, portfolio_id: int) -> List[Dict[str, Any]]:
         """
         Get all holdings for a specific portfolio.
@@ -325,35 +1102,124 @@ class DatabaseManager:
             List[Dict]: List of holding dictionaries
         """
         try:
-            with self.get_connection() as conn:
+            location = self.decode_portfolio_id(portfolio_id)
+            if location is None:
+                return []
+            shard, local_id = location
+            
+            with self.get_connection(shard) as conn:
                 cursor = conn.execute(
-                    """SELECT h.*, p.file_name, p.upload_date 
+                    """SELECT h.*, t.symbol AS ticker, t.company_name, s.name AS sector,
+                              p.file_name, p.upload_date 
                        FROM holdings h 
+                       JOIN tickers t ON t.id = h.ticker_id
+                       LEFT JOIN sectors s ON s.id = h.sector_id
                        JOIN portfolios p ON h.portfolio_id = p.id 
                        WHERE h.portfolio_id = ? 
-                       ORDER BY h.ticker""",
-                    (portfolio_id,)
+                       ORDER BY t.symbol""",
+                    (local_id,)
                 )
                 rows = cursor.fetchall()
                 
-                return [dict(row) for row in rows]
+                return self._globalize_rows(shard, rows, ('id', 'portfolio_id'))
                 
         except Exception as e:
             logger.error(f"Failed to get holdings for portfolio {portfolio_id}: {str(e)}")
             raise
-    
-    def get_portfolios_by_user(self, user_id: str) -> List[Dict[str, Any]]:
+
+    def get_holding_rows(self, portfolio_id: int) -> Tuple[List[str], List[tuple]]:
+        """
+        Get a portfolio's holdings as column names plus plain row tuples.
+        
+        Same data as get_holdings_by_portfolio, but ids are made global in
+        SQL and rows stay cursor tuples, so large portfolios can be
+        serialized without building a dictionary per holding.
+        
+        Args:
+            portfolio_id (int): Portfolio ID to get holdings for
+            
+        Returns:
+            Tuple[List[str], List[tuple]]: (column names, rows)
+        """
+        try:
+            location = self.decode_portfolio_id(portfolio_id)
+            if location is None:
+                return [], []
+            shard, local_id = location
+            base = shard << self.SHARD_ID_BITS
+            
+            with self.get_connection(shard) as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = None
+                cursor.execute(
+                    """SELECT h.id + ? AS id, h.portfolio_id + ? AS portfolio_id, h.ticker_id,
+                              t.symbol AS ticker, t.company_name, h.shares, h.purchase_price,
+                              h.purchase_date, h.sector_id, s.name AS sector, h.notes,
+                              h.timestamp, p.file_name, p.upload_date
+                       FROM holdings h
+                       JOIN tickers t ON t.id = h.ticker_id
+                       LEFT JOIN sectors s ON s.id = h.sector_id
+                       JOIN portfolios p ON h.portfolio_id = p.id
+                       WHERE h.portfolio_id = ?
+                       ORDER BY t.symbol""",
+                    (base, base, local_id)
+                )
+                rows = cursor.fetchall()
+                return [column[0] for column in cursor.description], rows
+                
+        except Exception as e:
+            logger.error(f"Failed to get holding rows for portfolio {portfolio_id}: {str(e)}")
+            raise
+
+    def get_portfolio_tickers(self, portfolio_id: int) -> Optional[List[str]]:
+        """
+        Get the distinct tickers held in a portfolio.
+
+        Args:
+            portfolio_id (int): Portfolio ID to get tickers for
+
+        Returns:
+            Optional[List[str]]: Sorted tickers or None if the portfolio does not exist
+        """
+        try:
+            location = self.decode_portfolio_id(portfolio_id)
+            if location is None:
+                return None
+            shard, local_id = location
+
+            with self.get_connection(shard) as conn:
+                exists = conn.execute(
+                    "SELECT 1 FROM portfolios WHERE id = ?", (local_id,)
+                ).fetchone()
+                if not exists:
+                    return None
+
+                cursor = conn.execute(
+                    """SELECT symbol FROM tickers
+                       WHERE id IN (SELECT ticker_id FROM holdings WHERE portfolio_id = ?)
+                       ORDER BY symbol""",
+                    (local_id,)
+                )
+                return [row['symbol'] for row in cursor.fetchall()]
+
+        except Exception as e:
+            logger.error(f"Failed to get tickers for portfolio {portfolio_id}: {str(e)}")
+            raise
+
+    def get_portfolios_by_user(self, user_id: str, replica: bool = False) -> List[Dict[str, Any]]:
         """
         Get all portfolios for a specific user.
         
         Args:
             user_id (str): User ID to get portfolios for
+            replica (bool): Read from the replica (as of its last refresh)
             
         Returns:
             List[Dict]: List of portfolio dictionaries
         """
         try:
-            with self.get_connection() as conn:
+            shard = self.shard_for_user(user_id)
+            with self.get_connection(shard, replica) as conn:
                 cursor = conn.execute(
                     """SELECT p.*, COUNT(h.id) as holdings_count,
                               SUM(h.shares * h.purchase_price) as total_invested
@@ -366,7 +1232,7 @@ class DatabaseManager:
                 )
                 rows = cursor.fetchall()
                 
-                return [dict(row) for row in rows]
+                return self._globalize_rows(shard, rows, ('id',))
                 
         except Exception as e:
             logger.error(f"Failed to get portfolios for user {user_id}: {str(e)}")
@@ -383,7 +1249,12 @@ class DatabaseManager:
             Optional[Dict]: Portfolio summary or None if not found
         """
         try:
-            with self.get_connection() as conn:
+            location = self.decode_portfolio_id(portfolio_id)
+            if location is None:
+                return None
+            shard, local_id = location
+            
+            with self.get_connection(shard) as conn:
                 # Get portfolio info
                 portfolio = self.get_portfolio_by_id(portfolio_id)
                 if not portfolio:
@@ -399,7 +1270,7 @@ class DatabaseManager:
                            MAX(purchase_date) as latest_purchase
                        FROM holdings 
                        WHERE portfolio_id = ?""",
-                    (portfolio_id,)
+                    (local_id,)
                 )
                 summary = cursor.fetchone()
                 
@@ -414,31 +1285,606 @@ class DatabaseManager:
             logger.error(f"Failed to get portfolio summary {portfolio_id}: {str(e)}")
             raise
     
-    def delete_portfolio(self, portfolio_id: int) -> bool:
+    def _allocation(self, conn: sqlite3.Connection, holdings_filter: str,
+                    params: Tuple) -> Dict[str, Any]:
         """
-        Delete a portfolio and all its holdings.
+        Aggregate cost-basis weights by sector and by ticker in SQL.
+        
+        Both rollups group on the covering idx_holdings_allocation index, so
+        only the tickers and sectors matching the groups are looked up.
         
         Args:
-            portfolio_id (int): Portfolio ID to delete
-            
-        Returns:
-            bool: True if deleted successfully, False otherwise
+            conn (sqlite3.Connection): Open shard connection
+            holdings_filter (str): WHERE condition on holdings h
+            params (Tuple): Parameters of the condition
+        """
+        by_sector = conn.execute(
+            f"""SELECT COALESCE(s.name, ?) AS sector, a.holdings, a.value,
+                       COALESCE(a.value / NULLIF(SUM(a.value) OVER (), 0), 0) AS weight
+                FROM (SELECT h.sector_id, COUNT(*) AS holdings,
+                             SUM(h.shares * h.purchase_price) AS value
+                      FROM holdings h
+                      WHERE {holdings_filter}
+                      GROUP BY h.sector_id) a
+                LEFT JOIN sectors s ON s.id = a.sector_id
+                ORDER BY a.value DESC, sector""",
+            (UNCLASSIFIED_SECTOR, *params)
+        ).fetchall()
+        by_ticker = conn.execute(
+            f"""SELECT t.symbol AS ticker, t.company_name, a.holdings, a.shares, a.value,
+                       COALESCE(a.value / NULLIF(SUM(a.value) OVER (), 0), 0) AS weight
+                FROM (SELECT h.ticker_id, COUNT(*) AS holdings, SUM(h.shares) AS shares,
+                             SUM(h.shares * h.purchase_price) AS value
+                      FROM holdings h
+                      WHERE {holdings_filter}
+                      GROUP BY h.ticker_id) a
+                JOIN tickers t ON t.id = a.ticker_id
+                ORDER BY a.value DESC, t.symbol""",
+            params
+        ).fetchall()
+        return {
+            'total_value': sum(row['value'] for row in by_sector),
+            'by_sector': [dict(row) for row in by_sector],
+            'by_ticker': [dict(row) for row in by_ticker],
+        }
+    
+    def _snapshot_rows(self, conn: sqlite3.Connection, local_id: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get the holdings of an upload in the shape reconcile_snapshot takes.
+        
+        Returns None if the portfolio no longer exists.
+        """
+        if not conn.execute("SELECT 1 FROM portfolios WHERE id = ?", (local_id,)).fetchone():
+            return None
+        cursor = conn.execute(
+            """SELECT h.ticker_id, t.symbol AS ticker, h.shares, h.purchase_price, h.purchase_date
+               FROM holdings h
+               JOIN tickers t ON t.id = h.ticker_id
+               WHERE h.portfolio_id = ?""",
+            (local_id,)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+    
+    @staticmethod
+    def _load_lot_positions(conn: sqlite3.Connection, user_id: str) -> Dict[int, Dict[Tuple[str, float], float]]:
+        """
+        Get the positions of the last snapshot applied to a user's lots.
+        """
+        positions: Dict[int, Dict[Tuple[str, float], float]] = {}
+        for row in conn.execute(
+            "SELECT ticker_id, purchase_date, price, shares FROM lot_positions WHERE user_id = ?",
+            (user_id,)
+        ):
+            positions.setdefault(row['ticker_id'], {})[(row['purchase_date'], row['price'])] = row['shares']
+        return positions
+    
+    @staticmethod
+    def _save_lot_positions(conn: sqlite3.Connection, user_id: str,
+                            positions: Dict[int, Dict[Tuple[str, float], float]]):
+        """
+        Replace the stored positions of a user's last applied snapshot.
+        """
+        conn.execute("DELETE FROM lot_positions WHERE user_id = ?", (user_id,))
+        conn.executemany(
+            """INSERT INTO lot_positions (user_id, ticker_id, purchase_date, price, shares)
+               VALUES (?, ?, ?, ?, ?)""",
+            [(user_id, ticker_id, purchase_date, price, shares)
+             for ticker_id, keys in positions.items()
+             for (purchase_date, price), shares in keys.items()]
+        )
+    
+    @staticmethod
+    def _pending_lot_uploads(conn: sqlite3.Connection, user_id: str, after: Optional[Tuple[str, int]],
+                             through: Optional[Tuple[str, int]]) -> List[sqlite3.Row]:
+        """
+        Get a user's uploads after one watermark and up to another, in upload order.
+        """
+        conditions = ["user_id = ?"]
+        params: List[Any] = [user_id]
+        if after is not None:
+            conditions.append("(upload_date, id) > (?, ?)")
+            params.extend(after)
+        if through is not None:
+            conditions.append("(upload_date, id) <= (?, ?)")
+            params.extend(through)
+        return conn.execute(
+            f"""SELECT id, upload_date FROM portfolios
+                WHERE {' AND '.join(conditions)}
+                ORDER BY upload_date, id""",
+            params
+        ).fetchall()
+    
+    def plan_user_lots(self, user_id: str, method: str = 'fifo', rebuild: bool = False,
+                       min_rebuild_interval: float = 0) -> Dict[str, Any]:
+        """
+        Work out what sync_user_lots has to do, without writing.
+        
+        Lists the (ticker, date) pairs whose sales the sync will need a close
+        for, so callers can price them before handing the sync to the
+        writer. Changing the matching method requires a rebuild.
+        
+        Args:
+            user_id (str): User whose uploads to process
+            method (str): 'fifo' or 'specific' lot matching
+            rebuild (bool): Discard stored lots and start over
+            min_rebuild_interval (float): Seconds that must pass between rebuilds
+            
+        Returns:
+            Dict: user_id, method, rebuild, through ((upload_date, id) of the
+            last upload to apply, or None) and sales ([(ticker, ISO date)])
+            
+        Raises:
+            LotMethodError: If the method is unknown
+            LotRebuildThrottledError: If a rebuild is needed and the last one
+                was less than min_rebuild_interval seconds ago
         """
+        validate_method(method)
         try:
-            with self.get_connection() as conn:
-                # Check if portfolio exists
-                portfolio = self.get_portfolio_by_id(portfolio_id)
-                if not portfolio:
-                    logger.warning(f"Portfolio {portfolio_id} not found for deletion")
-                    return False
+            shard = self.shard_for_user(user_id)
+            with self.get_connection(shard) as conn:
+                state = conn.execute(
+                    """SELECT method, last_upload_date, last_portfolio_id,
+                              (julianday('now') - julianday(rebuilt_at)) * 86400 AS since_rebuild
+                       FROM lot_state WHERE user_id = ?""",
+                    (user_id,)
+                ).fetchone()
+            rebuild = state is not None and (rebuild or state['method'] != method)
+            if rebuild and state['since_rebuild'] is not None and state['since_rebuild'] < min_rebuild_interval:
+                raise LotRebuildThrottledError(
+                    f"Lots of user {user_id} were rebuilt {state['since_rebuild']:.0f}s ago",
+                    math.ceil(min_rebuild_interval - state['since_rebuild'])
+                )
+            
+            with self.get_connection(shard) as conn:
+                if state is None or rebuild:
+                    uploads = self._pending_lot_uploads(conn, user_id, None, None)
+                    previous = {}
+                else:
+                    uploads = self._pending_lot_uploads(
+                        conn, user_id, (state['last_upload_date'], state['last_portfolio_id']), None
+                    )
+                    previous = self._load_lot_positions(conn, user_id) if uploads else {}
+                
+                sales = []
+                for upload in uploads:
+                    holdings = self._snapshot_rows(conn, upload['id'])
+                    if holdings is None:
+                        continue
+                    positions = snapshot_positions(holdings)
+                    sales.extend((ticker_id, upload['upload_date'][:10])
+                                 for ticker_id in sold_tickers(previous, positions))
+                    previous = positions
+                
+                symbols = {}
+                if sales:
+                    ticker_ids = sorted({ticker_id for ticker_id, _ in sales})
+                    symbols = dict(conn.execute(
+                        f"SELECT id, symbol FROM tickers WHERE id IN ({','.join('?' * len(ticker_ids))})",
+                        ticker_ids
+                    ).fetchall())
+                
+                return {
+                    'user_id': user_id,
+                    'method': method,
+                    'rebuild': rebuild,
+                    'through': (uploads[-1]['upload_date'], uploads[-1]['id']) if uploads else None,
+                    'sales': sorted({(symbols[ticker_id], day) for ticker_id, day in sales}),
+                }
+                
+        except LotRebuildThrottledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to plan lots for user {user_id}: {str(e)}")
+            raise
+    
+    def sync_user_lots(self, user_id: str, method: str = 'fifo', price_lookup: Optional[Any] = None,
+                       rebuild: bool = False, through: Optional[Tuple[str, int]] = None) -> Dict[str, Any]:
+        """
+        Bring a user's tax lots and realized gains up to date with their uploads.
+        
+        Uploads are applied in upload order starting after the last one
+        processed, so normally only the newest upload is read. Each upload
+        is compared with the stored positions of the previous one, and is
+        committed with its lot changes, its own positions and the new
+        watermark, so purging old uploads does not affect later syncs. Lots
+        are rebuilt from the first upload when rebuild is set.
+        
+        Args:
+            user_id (str): User whose uploads to process
+            method (str): 'fifo' or 'specific' lot matching
+            price_lookup (Callable): Close of a ticker on or before an ISO date,
+                used to price sales (unpriced sales have no proceeds or gain)
+            rebuild (bool): Discard stored lots and start over
+            through (Tuple[str, int]): (upload_date, id) of the last upload to
+                apply, as planned by plan_user_lots; later ones wait for the next sync
+            
+        Returns:
+            Dict: Method and number of uploads processed
+            
+        Raises:
+            LotMethodError: If the method is unknown
+            LotSyncConflictError: If the stored lots use another method and
+                rebuild is not set
+        """
+        validate_method(method)
+        try:
+            shard = self.shard_for_user(user_id)
+            with self.get_connection(shard) as conn:
+                state = conn.execute(
+                    "SELECT method, last_upload_date, last_portfolio_id FROM lot_state WHERE user_id = ?",
+                    (user_id,)
+                ).fetchone()
+            if state is not None and not rebuild and state['method'] != method:
+                raise LotSyncConflictError(
+                    f"Lots of user {user_id} are matched {state['method']}; rebuild to use {method}"
+                )
+            
+            with self.get_connection(shard) as conn:
+                if state is not None and rebuild:
+                    logger.info(f"Rebuilding {method} lots for user {user_id}")
+                    conn.execute("DELETE FROM realized_gains WHERE user_id = ?", (user_id,))
+                    conn.execute("DELETE FROM lots WHERE user_id = ?", (user_id,))
+                    conn.execute("DELETE FROM lot_positions WHERE user_id = ?", (user_id,))
+                    conn.execute("DELETE FROM lot_state WHERE user_id = ?", (user_id,))
+                    conn.commit()
+                    state = None
+                
+                if state is None:
+                    uploads = self._pending_lot_uploads(conn, user_id, None, through)
+                    previous = {}
+                else:
+                    uploads = self._pending_lot_uploads(
+                        conn, user_id, (state['last_upload_date'], state['last_portfolio_id']), through
+                    )
+                    previous = self._load_lot_positions(conn, user_id) if uploads else {}
+                
+                open_lots = [dict(row) for row in conn.execute(
+                    """SELECT l.id, l.ticker_id, t.symbol AS ticker, l.purchase_date, l.acquired_date,
+                              l.cost_per_share, l.remaining
+                       FROM lots l
+                       JOIN tickers t ON t.id = l.ticker_id
+                       WHERE l.user_id = ? AND l.remaining > 0
+                       ORDER BY l.acquired_date, l.id""",
+                    (user_id,)
+                )] if uploads else []
+                
+                for upload in uploads:
+                    holdings = self._snapshot_rows(conn, upload['id'])
+                    if holdings is None:
+                        continue
+                    before = {lot['id']: lot['remaining'] for lot in open_lots}
+                    new_lots, realized = reconcile_snapshot(
+                        open_lots, previous, holdings, upload['upload_date'][:10], method, price_lookup
+                    )
+                    positions = snapshot_positions(holdings)
+                    
+                    for lot in new_lots:
+                        lot['id'] = conn.execute(
+                            """INSERT INTO lots (user_id, ticker_id, purchase_date, acquired_date,
+                                                 cost_per_share, shares, remaining, portfolio_id)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?) RETURNING id""",
+                            (user_id, lot['ticker_id'], lot['purchase_date'], lot['acquired_date'],
+                             lot['cost_per_share'], lot['shares'], lot['remaining'], upload['id'])
+                        ).fetchone()[0]
+                    conn.executemany(
+                        "UPDATE lots SET remaining = ? WHERE id = ?",
+                        [(lot['remaining'], lot['id']) for lot in open_lots
+                         if lot['remaining'] != before[lot['id']]]
+                    )
+                    conn.executemany(
+                        """INSERT INTO realized_gains (user_id, lot_id, portfolio_id, sale_date, shares,
+                                                       cost_basis, proceeds, gain, term)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        [(user_id, gain['lot']['id'], upload['id'], gain['sale_date'], gain['shares'],
+                          gain['cost_basis'], gain['proceeds'], gain['gain'], gain['term'])
+                         for gain in realized]
+                    )
+                    self._save_lot_positions(conn, user_id, positions)
+                    conn.execute(
+                        """INSERT INTO lot_state (user_id, method, last_upload_date, last_portfolio_id, rebuilt_at)
+                           VALUES (?, ?, ?, ?, CASE WHEN ? THEN CURRENT_TIMESTAMP END)
+                           ON CONFLICT(user_id) DO UPDATE SET
+                               last_upload_date = excluded.last_upload_date,
+                               last_portfolio_id = excluded.last_portfolio_id,
+                               updated_at = CURRENT_TIMESTAMP""",
+                        (user_id, method, upload['upload_date'], upload['id'], rebuild)
+                    )
+                    conn.commit()
+                    
+                    open_lots = sorted(
+                        [lot for lot in open_lots if lot['remaining'] > 0] + new_lots,
+                        key=lambda lot: (lot['acquired_date'], lot['id'])
+                    )
+                    previous = positions
+                
+                if uploads:
+                    logger.info(f"Processed {len(uploads)} uploads into {method} lots for user {user_id}")
+                return {'method': method, 'processed_uploads': len(uploads)}
+                
+        except LotSyncConflictError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to sync lots for user {user_id}: {str(e)}")
+            raise
+    
+    def get_user_lots(self, user_id: str) -> Dict[str, Any]:
+        """
+        Get a user's open tax lots, realized gains and gain totals by term.
+        
+        Reflects the uploads processed by the last sync_user_lots call.
+        
+        Args:
+            user_id (str): User ID to get lots for
+            
+        Returns:
+            Dict: method, processed_through, open_lots, realized and totals
+        """
+        try:
+            shard = self.shard_for_user(user_id)
+            with self.get_connection(shard) as conn:
+                state = conn.execute(
+                    """SELECT method, last_upload_date, last_portfolio_id
+                       FROM lot_state WHERE user_id = ?""",
+                    (user_id,)
+                ).fetchone()
+                open_lots = conn.execute(
+                    """SELECT l.id AS lot_id, t.symbol AS ticker, l.purchase_date, l.acquired_date,
+                              l.cost_per_share, l.shares, l.remaining,
+                              l.remaining * l.cost_per_share AS cost_basis, l.portfolio_id
+                       FROM lots l
+                       JOIN tickers t ON t.id = l.ticker_id
+                       WHERE l.user_id = ? AND l.remaining > 0
+                       ORDER BY t.symbol, l.acquired_date, l.id""",
+                    (user_id,)
+                ).fetchall()
+                realized = conn.execute(
+                    """SELECT r.lot_id, t.symbol AS ticker, l.acquired_date, r.sale_date, r.shares,
+                              r.cost_basis, r.proceeds, r.gain, r.term, r.portfolio_id
+                       FROM realized_gains r
+                       JOIN lots l ON l.id = r.lot_id
+                       JOIN tickers t ON t.id = l.ticker_id
+                       WHERE r.user_id = ?
+                       ORDER BY r.sale_date, r.id""",
+                    (user_id,)
+                ).fetchall()
+                totals = conn.execute(
+                    """SELECT term, COUNT(*) AS sales, SUM(shares) AS shares,
+                              SUM(cost_basis) AS cost_basis, SUM(proceeds) AS proceeds,
+                              SUM(gain) AS gain, SUM(gain IS NULL) AS unpriced_sales
+                       FROM realized_gains
+                       WHERE user_id = ?
+                       GROUP BY term
+                       ORDER BY term""",
+                    (user_id,)
+                ).fetchall()
+                
+                return {
+                    'user_id': user_id,
+                    'method': state['method'] if state else None,
+                    'processed_through': {
+                        'upload_date': state['last_upload_date'],
+                        'portfolio_id': self.encode_portfolio_id(shard, state['last_portfolio_id']),
+                    } if state else None,
+                    'open_lots': self._globalize_rows(shard, open_lots, ('lot_id', 'portfolio_id')),
+                    'realized': self._globalize_rows(shard, realized, ('lot_id', 'portfolio_id')),
+                    'totals': {row['term']: dict(row) for row in totals},
+                }
+                
+        except Exception as e:
+            logger.error(f"Failed to get lots for user {user_id}: {str(e)}")
+            raise
+    
+    def get_portfolio_allocation(self, portfolio_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a portfolio's cost-basis weights by sector and by ticker.
+        
+        Holdings without a sector are grouped as Unclassified.
+        
+        Args:
+            portfolio_id (int): Portfolio ID to get the allocation for
+            
+        Returns:
+            Optional[Dict]: total_value, by_sector and by_ticker, or None if not found
+        """
+        try:
+            location = self.decode_portfolio_id(portfolio_id)
+            if location is None:
+                return None
+            shard, local_id = location
+            
+            with self.get_connection(shard) as conn:
+                exists = conn.execute(
+                    "SELECT 1 FROM portfolios WHERE id = ?", (local_id,)
+                ).fetchone()
+                if not exists:
+                    return None
+                
+                allocation = self._allocation(conn, "h.portfolio_id = ?", (local_id,))
+                return {'portfolio_id': portfolio_id, **allocation}
+                
+        except Exception as e:
+            logger.error(f"Failed to get allocation for portfolio {portfolio_id}: {str(e)}")
+            raise
+    
+    def get_user_allocation(self, user_id: str) -> Dict[str, Any]:
+        """
+        Get cost-basis weights by sector and by ticker across all of a user's portfolios.
+        
+        Args:
+            user_id (str): User ID to get the allocation for
+            
+        Returns:
+            Dict: portfolio_count, total_value, by_sector and by_ticker
+        """
+        try:
+            shard = self.shard_for_user(user_id)
+            with self.get_connection(shard) as conn:
+                portfolio_count = conn.execute(
+                    "SELECT COUNT(*) FROM portfolios WHERE user_id = ?", (user_id,)
+                ).fetchone()[0]
+                allocation = self._allocation(
+                    conn,
+                    "h.portfolio_id IN (SELECT id FROM portfolios WHERE user_id = ?)",
+                    (user_id,)
+                )
+                return {'user_id': user_id, 'portfolio_count': portfolio_count, **allocation}
+                
+        except Exception as e:
+            logger.error(f"Failed to get allocation for user {user_id}: {str(e)}")
+            raise
+    
+    def iter_holdings_export(self, portfolio_id: Optional[int] = None,
+                             user_id: Optional[str] = None,
+                             batch_size: int = 1000) -> Iterator[List[Tuple]]:
+        """
+        Stream holdings for export in batches straight from a cursor.
+        
+        The connection stays open until the generator is exhausted or closed,
+        and at most batch_size rows are held in memory at a time. Rows are
+        plain tuples ordered as EXPORT_COLUMNS.
+        
+        Args:
+            portfolio_id (int): Only export this portfolio (optional)
+            user_id (str): Only export this user's portfolios (optional)
+            batch_size (int): Rows fetched per fetchmany call
+            
+        Yields:
+            List[Tuple]: Batches of holding rows
+        """
+        if portfolio_id is not None:
+            location = self.decode_portfolio_id(portfolio_id)
+            if location is None:
+                return
+            shards = [location[0]]
+        elif user_id is not None:
+            shards = [self.shard_for_user(user_id)]
+        else:
+            shards = range(self.shard_count)
+        
+        exported_count = 0
+        try:
+            for shard in shards:
+                conditions = []
+                # Encode shard-local ids in SQL so rows stay plain tuples
+                params = [shard << self.SHARD_ID_BITS, shard << self.SHARD_ID_BITS]
+                if portfolio_id is not None:
+                    conditions.append("p.id = ?")
+                    params.append(location[1])
+                if user_id is not None:
+                    conditions.append("p.user_id = ?")
+                    params.append(user_id)
+                where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+                
+                with self.get_connection(shard) as conn:
+                    cursor = conn.cursor()
+                    cursor.row_factory = None  # Plain tuples, no per-row mapping
+                    cursor.execute(
+                        f"""SELECT p.id + ?, p.user_id, p.file_name, p.upload_date,
+                                   h.id + ?, t.symbol, h.shares, h.purchase_price, h.purchase_date
+                            FROM portfolios p
+                            JOIN holdings h ON h.portfolio_id = p.id
+                            JOIN tickers t ON t.id = h.ticker_id
+                            {where_clause}
+                            ORDER BY p.id, h.id""",
+                        params
+                    )
+                    
+                    while True:
+                        batch = cursor.fetchmany(batch_size)
+                        if not batch:
+                            break
+                        exported_count += len(batch)
+                        yield batch
+            
+            logger.info(f"Exported {exported_count} holdings")
+                
+        except Exception as e:
+            logger.error(f"Failed to export holdings: {str(e)}")
+            raise
+    
+    def iter_snapshot_rows(self, batch_size: int = 10000) -> Iterator[List[Tuple]]:
+        """
+        Stream every holding for an analytics snapshot, shard by shard.
+        
+        Rows are plain tuples ordered as SNAPSHOT_COLUMNS; latest is 1 for
+        holdings of their user's most recent upload, in the (upload_date, id)
+        order sync_user_lots applies uploads in. Each shard is read in a
+        single read transaction, so the rows of a shard are consistent.
+        
+        Args:
+            batch_size (int): Rows fetched per fetchmany call
+            
+        Yields:
+            List[Tuple]: Batches of holding rows
+        """
+        snapshot_count = 0
+        try:
+            for shard in range(self.shard_count):
+                with self.get_connection(shard) as conn:
+                    cursor = conn.cursor()
+                    cursor.row_factory = None  # Plain tuples, no per-row mapping
+                    cursor.execute(
+                        """WITH latest AS (
+                               SELECT id FROM (
+                                   SELECT id, ROW_NUMBER() OVER (
+                                              PARTITION BY user_id ORDER BY upload_date DESC, id DESC
+                                          ) AS position
+                                   FROM portfolios
+                               )
+                               WHERE position = 1
+                           )
+                           SELECT p.id + ?, p.user_id, p.upload_date, t.symbol, s.name,
+                                  h.shares, h.purchase_price, l.id IS NOT NULL
+                           FROM portfolios p
+                           JOIN holdings h ON h.portfolio_id = p.id
+                           JOIN tickers t ON t.id = h.ticker_id
+                           LEFT JOIN sectors s ON s.id = h.sector_id
+                           LEFT JOIN latest l ON l.id = p.id""",
+                        (shard << self.SHARD_ID_BITS,)
+                    )
+                    
+                    while True:
+                        batch = cursor.fetchmany(batch_size)
+                        if not batch:
+                            break
+                        snapshot_count += len(batch)
+                        yield batch
+            
+            logger.info(f"Read {snapshot_count} holdings for snapshot")
                 
+        except Exception as e:
+            logger.error(f"Failed to read holdings for snapshot: {str(e)}")
+            raise
+    
+    def delete_portfolio(self, portfolio_id: int) -> bool:
+        """
+        Delete a portfolio and all its holdings.
+        
+        Args:
+            portfolio_id (int): Portfolio ID to delete
+            
+        Returns:
+            bool: True if deleted successfully, False otherwise
+        """
+        try:
+            location = self.decode_portfolio_id(portfolio_id)
+            if location is None:
+                logger.warning(f"Portfolio {portfolio_id} not found for deletion")
+                return False
+            shard, local_id = location
+            
+            with self.get_connection(shard) as conn:
                 # Delete portfolio (holdings will be deleted automatically due to CASCADE)
                 cursor = conn.execute(
                     "DELETE FROM portfolios WHERE id = ?",
-                    (portfolio_id,)
+                    (local_id,)
                 )
                 conn.commit()
                 
+                if cursor.rowcount == 0:
+                    logger.warning(f"Portfolio {portfolio_id} not found for deletion")
+                    return False
+                
                 logger.info(f"Deleted portfolio {portfolio_id}")
                 return True
                 
@@ -446,38 +1892,381 @@ class DatabaseManager:
             logger.error(f"Failed to delete portfolio {portfolio_id}: {str(e)}")
             raise
     
-    def get_database_stats(self) -> Dict[str, Any]:
+    def _select_purge_candidates(self, conn: sqlite3.Connection, user_id: Optional[str],
+                                 cutoff: Optional[str], keep_last: Optional[int]) -> List[int]:
+        """
+        Get the shard-local ids of the portfolios matching a retention rule.
+        """
+        conditions = []
+        params: List[Any] = []
+        inner_where = ""
+        if user_id is not None:
+            inner_where = "WHERE user_id = ?"
+            params.append(user_id)
+        if cutoff is not None:
+            conditions.append("upload_date < ?")
+            params.append(cutoff)
+        if keep_last is not None:
+            conditions.append("recency > ?")
+            params.append(keep_last)
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        cursor = conn.execute(
+            f"""SELECT id FROM (
+                    SELECT id, upload_date,
+                           ROW_NUMBER() OVER (PARTITION BY user_id
+                                              ORDER BY upload_date DESC, id DESC) AS recency
+                    FROM portfolios
+                    {inner_where}
+                )
+                {where_clause}
+                ORDER BY id""",
+            params
+        )
+        return [row[0] for row in cursor.fetchall()]
+    
+    def incremental_vacuum(self, shard: int = 0, max_pages: Optional[int] = None) -> int:
+        """
+        Return free pages to the filesystem without a blocking full VACUUM.
+        
+        Only has an effect on databases using auto_vacuum=INCREMENTAL.
+        
+        Args:
+            shard (int): Shard to vacuum
+            max_pages (int): Free at most this many pages (None frees all)
+            
+        Returns:
+            int: Number of pages freed
+        """
+        with self.get_connection(shard) as conn:
+            return self._vacuum_step(conn, max_pages)
+    
+    @staticmethod
+    def _vacuum_step(conn: sqlite3.Connection, max_pages: Optional[int]) -> int:
+        """
+        Run one incremental_vacuum step on an open connection.
+        """
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        pages = max_pages if max_pages is not None else 0  # 0 frees the whole freelist
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return before - after
+    
+    def enable_incremental_vacuum(self, shard: int = 0) -> bool:
+        """
+        Switch an existing database to auto_vacuum=INCREMENTAL.
+        
+        New databases are created in this mode. Older ones need a single full
+        VACUUM to switch, which locks the shard while it rewrites the file.
+        
+        Returns:
+            bool: True if the database was converted, False if it already was
+        """
+        with self.get_connection(shard) as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return False
+            logger.info(f"Converting {self.shard_paths[shard]} to incremental auto-vacuum")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            return True
+    
+    def purge_portfolios(self, user_id: Optional[str] = None,
+                         older_than_days: Optional[float] = None,
+                         keep_last: Optional[int] = None,
+                         chunk_size: int = 500, vacuum_pages: int = 2000,
+                         dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Delete portfolios matching a retention rule, in chunked transactions.
+        
+        A portfolio is deleted when it matches every given criterion: it
+        belongs to user_id, was uploaded more than older_than_days ago, and
+        is not among its user's keep_last most recent uploads. Each chunk of
+        portfolios is deleted in its own short transaction (holdings and
+        digests follow by cascade), so ingests and reads on the shard are
+        never locked out for long. After each chunk up to vacuum_pages free
+        pages are returned to the filesystem with incremental_vacuum.
+        
+        Args:
+            user_id (str): Only purge this user's portfolios
+            older_than_days (float): Only purge portfolios uploaded before this many days ago
+            keep_last (int): Keep each user's N most recent portfolios
+            chunk_size (int): Portfolios deleted per transaction
+            vacuum_pages (int): Pages freed after each chunk (0 disables vacuuming)
+            dry_run (bool): Only count the matching portfolios
+            
+        Returns:
+            Dict: Portfolios and holdings deleted and pages reclaimed
+            
+        Raises:
+            ValueError: If no criterion is given or a criterion is invalid
+        """
+        if user_id is None and older_than_days is None and keep_last is None:
+            raise ValueError("A retention rule needs user_id, older_than_days or keep_last")
+        if keep_last is not None and keep_last < 0:
+            raise ValueError("keep_last must not be negative")
+        if older_than_days is not None and older_than_days < 0:
+            raise ValueError("older_than_days must not be negative")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        
+        cutoff = None
+        if older_than_days is not None:
+            cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+        shards = [self.shard_for_user(user_id)] if user_id is not None else range(self.shard_count)
+        
+        result = {'portfolios': 0, 'holdings': 0, 'pages_reclaimed': 0, 'dry_run': dry_run}
+        try:
+            for shard in shards:
+                with self.get_connection(shard) as conn:
+                    candidates = self._select_purge_candidates(conn, user_id, cutoff, keep_last)
+                    if dry_run:
+                        result['portfolios'] += len(candidates)
+                        continue
+                    
+                    conn.isolation_level = None  # Manage the transactions explicitly
+                    for start in range(0, len(candidates), chunk_size):
+                        chunk = candidates[start:start + chunk_size]
+                        placeholders = ','.join('?' for _ in chunk)
+                        conn.execute("BEGIN IMMEDIATE")
+                        try:
+                            holdings = conn.execute(
+                                f"SELECT COUNT(*) FROM holdings WHERE portfolio_id IN ({placeholders})",
+                                chunk
+                            ).fetchone()[0]
+                            deleted = conn.execute(
+                                f"DELETE FROM portfolios WHERE id IN ({placeholders})",
+                                chunk
+                            ).rowcount
+                            conn.execute("COMMIT")
+                        except Exception:
+                            conn.execute("ROLLBACK")
+                            raise
+                        result['portfolios'] += deleted
+                        result['holdings'] += holdings
+                        
+                        if vacuum_pages:
+                            result['pages_reclaimed'] += self._vacuum_step(conn, vacuum_pages)
+                    
+                    # Return what is left of the freelist, still in bounded steps
+                    while candidates and vacuum_pages:
+                        freed = self._vacuum_step(conn, vacuum_pages)
+                        if not freed:
+                            break
+                        result['pages_reclaimed'] += freed
+                
+                if candidates and not dry_run:
+                    logger.info(f"Purged {len(candidates)} portfolios from shard {shard}")
+            
+            logger.info(f"Retention purge removed {result['portfolios']} portfolios "
+                        f"and {result['holdings']} holdings"
+                        + (" (dry run)" if dry_run else ""))
+            return result
+            
+        except Exception as e:
+            logger.error(f"Failed to purge portfolios: {str(e)}")
+            raise
+    
+    def backup(self, dest_path: str, shard: int = 0, pages: int = 1024,
+               pause: float = 0.005) -> Dict[str, Any]:
+        """
+        Copy a shard to dest_path while the application keeps running.
+        
+        Uses the SQLite online backup API in steps of `pages` pages and
+        sleeps `pause` seconds between steps, so the copy never holds the
+        shard for long. A commit from another connection restarts a paged
+        backup; after MAX_BACKUP_RESTARTS restarts the remainder is copied in
+        one step, which in WAL mode reads a consistent snapshot without
+        blocking the writer.
+        
+        The copy is made next to dest_path, switched to rollback-journal mode
+        so it can be opened read-only, and renamed over dest_path when done.
+        
+        Args:
+            dest_path (str): Path of the backup file
+            shard (int): Shard to copy
+            pages (int): Pages copied per step
+            pause (float): Seconds slept between steps
+            
+        Returns:
+            Dict: Pages copied, steps, restarts and seconds taken
+        """
+        if pages < 1:
+            raise ValueError("pages must be at least 1")
+        
+        started = time.perf_counter()
+        os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+        temp_path = f"{dest_path}.tmp"
+        for path in (temp_path, f"{temp_path}-journal", f"{temp_path}-wal", f"{temp_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        
+        progress = {'steps': 0, 'restarts': 0, 'remaining': None, 'total': 0}
+        
+        def on_step(status, remaining, total):
+            progress['steps'] += 1
+            progress['total'] = total
+            if progress['remaining'] is not None and remaining > progress['remaining']:
+                progress['restarts'] += 1
+                if progress['restarts'] > self.MAX_BACKUP_RESTARTS:
+                    raise _BackupRestarted()
+            progress['remaining'] = remaining
+            if remaining:
+                time.sleep(pause)
+        
+        source = sqlite3.connect(self.shard_paths[shard])
+        target = sqlite3.connect(temp_path)
+        try:
+            try:
+                source.backup(target, pages=pages, progress=on_step)
+            except _BackupRestarted:
+                logger.warning(f"Backup of shard {shard} restarted {progress['restarts']} times, "
+                               f"copying the rest in one step")
+                source.backup(target)
+                progress['steps'] += 1
+            target.execute("PRAGMA journal_mode=DELETE")
+            page_count = target.execute("PRAGMA page_count").fetchone()[0]
+        except Exception:
+            target.close()
+            os.remove(temp_path)
+            raise
+        finally:
+            source.close()
+        target.close()
+        os.replace(temp_path, dest_path)
+        
+        result = {
+            'shard': shard,
+            'path': dest_path,
+            'pages': page_count,
+            'steps': progress['steps'],
+            'restarts': progress['restarts'],
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+        logger.info(f"Backed up shard {shard} to {dest_path}: {page_count} pages in "
+                    f"{progress['steps']} steps, {result['seconds']}s")
+        return result
+    
+    def refresh_replica(self, pages: int = 1024, pause: float = 0.005) -> List[Dict[str, Any]]:
+        """
+        Refresh the read-only replica of every shard with backup().
+        
+        Readers that already opened the previous replica file keep reading
+        it; new connections see the refreshed copy.
+        
+        Args:
+            pages (int): Pages copied per backup step
+            pause (float): Seconds slept between steps
+            
+        Returns:
+            List[Dict]: backup() results per shard
+            
+        Raises:
+            ValueError: If no replica path is configured
+        """
+        if self.replica_paths is None:
+            raise ValueError("No replica path configured")
+        
+        results = []
+        with self._replica_lock:
+            for shard, path in enumerate(self.replica_paths):
+                results.append(self.backup(path, shard, pages, pause))
+        return results
+    
+    def get_replica_status(self) -> List[Dict[str, Any]]:
+        """
+        Get each replica file's path, size and age.
+        
+        Returns:
+            List[Dict]: Status per shard (empty without a replica path)
+        """
+        status = []
+        for shard, path in enumerate(self.replica_paths or []):
+            exists = os.path.exists(path)
+            modified = os.path.getmtime(path) if exists else None
+            status.append({
+                'shard': shard,
+                'path': path,
+                'exists': exists,
+                'size_bytes': os.path.getsize(path) if exists else 0,
+                'age_seconds': round(time.time() - modified, 1) if exists else None,
+            })
+        return status
+    
+    def _get_shard_stats(self, shard: int, replica: bool = False) -> Dict[str, Any]:
+        """
+        Get statistics for a single shard.
+        """
+        with self.get_connection(shard, replica) as conn:
+            # Get portfolio count
+            cursor = conn.execute("SELECT COUNT(*) as count FROM portfolios")
+            portfolio_count = cursor.fetchone()['count']
+            
+            # Get holdings count
+            cursor = conn.execute("SELECT COUNT(*) as count FROM holdings")
+            holdings_count = cursor.fetchone()['count']
+            
+            # Get unique users count (users never span shards)
+            cursor = conn.execute("SELECT COUNT(DISTINCT user_id) as count FROM portfolios")
+            user_count = cursor.fetchone()['count']
+            
+            # Get unique held tickers (ids are per shard, so symbols are
+            # merged across shards by the caller)
+            cursor = conn.execute(
+                "SELECT symbol FROM tickers WHERE id IN (SELECT DISTINCT ticker_id FROM holdings)"
+            )
+            tickers = {row['symbol'] for row in cursor.fetchall()}
+            
+            return {
+                'portfolios': portfolio_count,
+                'holdings': holdings_count,
+                'users': user_count,
+                'tickers': tickers,
+            }
+    
+    def ping(self):
+        """
+        Check that every primary shard can be opened and read.
+        
+        Raises:
+            sqlite3.Error: If a shard cannot be read
+        """
+        for shard in range(self.shard_count):
+            with self.get_connection(shard) as conn:
+                conn.execute("SELECT 1 FROM portfolios LIMIT 1").fetchall()
+    
+    def get_database_stats(self, replica: bool = False) -> Dict[str, Any]:
         """
         Get database statistics.
         
+        Shards are queried in parallel and their results merged.
+        
+        Args:
+            replica (bool): Count from the replica (as of its last refresh)
+        
         Returns:
             Dict: Database statistics
         """
         try:
-            with self.get_connection() as conn:
-                # Get portfolio count
-                cursor = conn.execute("SELECT COUNT(*) as count FROM portfolios")
-                portfolio_count = cursor.fetchone()['count']
-                
-                # Get holdings count
-                cursor = conn.execute("SELECT COUNT(*) as count FROM holdings")
-                holdings_count = cursor.fetchone()['count']
-                
-                # Get unique users count
-                cursor = conn.execute("SELECT COUNT(DISTINCT user_id) as count FROM portfolios")
-                user_count = cursor.fetchone()['count']
-                
-                # Get unique tickers count
-                cursor = conn.execute("SELECT COUNT(DISTINCT ticker) as count FROM holdings")
-                ticker_count = cursor.fetchone()['count']
-                
-                return {
-                    'portfolios': portfolio_count,
-                    'holdings': holdings_count,
-                    'users': user_count,
-                    'unique_tickers': ticker_count,
-                    'database_path': self.db_path
-                }
+            if self.shard_count == 1:
+                shard_stats = [self._get_shard_stats(0, replica)]
+            else:
+                with ThreadPoolExecutor(max_workers=self.shard_count,
+                                        thread_name_prefix='db-stats') as pool:
+                    shard_stats = list(pool.map(lambda shard: self._get_shard_stats(shard, replica),
+                                                range(self.shard_count)))
+            
+            tickers = set()
+            for stats in shard_stats:
+                tickers |= stats['tickers']
+            
+            return {
+                'portfolios': sum(stats['portfolios'] for stats in shard_stats),
+                'holdings': sum(stats['holdings'] for stats in shard_stats),
+                'users': sum(stats['users'] for stats in shard_stats),
+                'unique_tickers': len(tickers),
+                'database_path': self.db_path,
+                'shards': self.shard_count
+            }
                 
         except Exception as e:
             logger.error(f"Failed to get database stats: {str(e)}")
@@ -486,9 +2275,13 @@ class DatabaseManager:
 
 # Global database manager instance
 # Use absolute path to ensure database is created in the backend directory
+# (override with CAPTURA_DB_PATH; CAPTURA_DB_SHARDS splits it into shard files)
 backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-db_path = os.path.join(backend_dir, "captura.db")
-db_manager = DatabaseManager(db_path)
+db_path = os.environ.get('CAPTURA_DB_PATH', os.path.join(backend_dir, "captura.db"))
+db_shards = int(os.environ.get('CAPTURA_DB_SHARDS', '1'))
+# Read-only replica for expensive reads, refreshed with online backups (optional)
+db_replica_path = os.environ.get('CAPTURA_DB_REPLICA_PATH')
+db_manager = DatabaseManager(db_path, db_shards, db_replica_path)
 
 
 # Convenience functions for easy access
@@ -502,19 +2295,46 @@ def insert_holdings(portfolio_id: int, holdings_list: List[Dict[str, Any]]) -> i
     return db_manager.insert_holdings(portfolio_id, holdings_list)
 
 
+def ingest_portfolio(user_id: str, file_name: str, holdings_list: List[Dict[str, Any]],
+                     timeout: Optional[float] = None,
+                     digest: Optional[Dict[str, Any]] = None) -> Tuple[int, int]:
+    """Insert a portfolio with its holdings through the group-commit writer."""
+    return db_manager.ingest_portfolio(user_id, file_name, holdings_list, timeout, digest)
+
+
 def get_portfolio_by_id(portfolio_id: int) -> Optional[Dict[str, Any]]:
     """Get portfolio information by ID."""
     return db_manager.get_portfolio_by_id(portfolio_id)
 
 
+def get_portfolio_digest(portfolio_id: int) -> Optional[Dict[str, Any]]:
+    """Get the precomputed digest of a portfolio."""
+    return db_manager.get_portfolio_digest(portfolio_id)
+
+
+def save_portfolio_digest(portfolio_id: int, digest: Dict[str, Any]) -> bool:
+    """Store (or replace) the digest of an existing portfolio."""
+    return db_manager.save_portfolio_digest(portfolio_id, digest)
+
+
 def get_holdings_by_portfolio(portfolio_id: int) -> List[Dict[str, Any]]:
     """Get all holdings for a specific portfolio."""
     return db_manager.get_holdings_by_portfolio(portfolio_id)
 
 
-def get_portfolios_by_user(user_id: str) -> List[Dict[str, Any]]:
+def get_holding_rows(portfolio_id: int) -> Tuple[List[str], List[tuple]]:
+    """Get a portfolio's holdings as column names plus plain row tuples."""
+    return db_manager.get_holding_rows(portfolio_id)
+
+
+def get_portfolio_tickers(portfolio_id: int) -> Optional[List[str]]:
+    """Get the distinct tickers held in a portfolio."""
+    return db_manager.get_portfolio_tickers(portfolio_id)
+
+
+def get_portfolios_by_user(user_id: str, replica: bool = False) -> List[Dict[str, Any]]:
     """Get all portfolios for a specific user."""
-    return db_manager.get_portfolios_by_user(user_id)
+    return db_manager.get_portfolios_by_user(user_id, replica)
 
 
 def get_portfolio_summary(portfolio_id: int) -> Optional[Dict[str, Any]]:
@@ -522,14 +2342,70 @@ def get_portfolio_summary(portfolio_id: int) -> Optional[Dict[str, Any]]:
     return db_manager.get_portfolio_summary(portfolio_id)
 
 
+def plan_user_lots(user_id: str, method: str = 'fifo', rebuild: bool = False,
+                   min_rebuild_interval: float = 0) -> Dict[str, Any]:
+    """Work out what sync_user_lots has to do and which sales need a price."""
+    return db_manager.plan_user_lots(user_id, method, rebuild, min_rebuild_interval)
+
+
+def sync_user_lots(user_id: str, method: str = 'fifo', price_lookup: Optional[Any] = None,
+                   rebuild: bool = False, through: Optional[Tuple[str, int]] = None) -> Dict[str, Any]:
+    """Bring a user's tax lots and realized gains up to date with their uploads."""
+    return db_manager.sync_user_lots(user_id, method, price_lookup, rebuild, through)
+
+
+def get_user_lots(user_id: str) -> Dict[str, Any]:
+    """Get a user's open tax lots, realized gains and gain totals by term."""
+    return db_manager.get_user_lots(user_id)
+
+
+def get_portfolio_allocation(portfolio_id: int) -> Optional[Dict[str, Any]]:
+    """Get a portfolio's cost-basis weights by sector and by ticker."""
+    return db_manager.get_portfolio_allocation(portfolio_id)
+
+
+def get_user_allocation(user_id: str) -> Dict[str, Any]:
+    """Get cost-basis weights by sector and by ticker across a user's portfolios."""
+    return db_manager.get_user_allocation(user_id)
+
+
+def iter_holdings_export(portfolio_id: Optional[int] = None, user_id: Optional[str] = None,
+                         batch_size: int = 1000) -> Iterator[List[Tuple]]:
+    """Stream holdings for export in batches."""
+    return db_manager.iter_holdings_export(portfolio_id, user_id, batch_size)
+
+
+def iter_snapshot_rows(batch_size: int = 10000) -> Iterator[List[Tuple]]:
+    """Stream every holding for an analytics snapshot."""
+    return db_manager.iter_snapshot_rows(batch_size)
+
+
 def delete_portfolio(portfolio_id: int) -> bool:
     """Delete a portfolio and all its holdings."""
     return db_manager.delete_portfolio(portfolio_id)
 
 
-def get_database_stats() -> Dict[str, Any]:
+def purge_portfolios(user_id: Optional[str] = None, older_than_days: Optional[float] = None,
+                     keep_last: Optional[int] = None, chunk_size: int = 500,
+                     vacuum_pages: int = 2000, dry_run: bool = False) -> Dict[str, Any]:
+    """Delete portfolios matching a retention rule, in chunked transactions."""
+    return db_manager.purge_portfolios(user_id, older_than_days, keep_last,
+                                       chunk_size, vacuum_pages, dry_run)
+
+
+def ping_database():
+    """Check that every primary shard can be opened and read."""
+    db_manager.ping()
+
+
+def get_database_stats(replica: bool = False) -> Dict[str, Any]:
     """Get database statistics."""
-    return db_manager.get_database_stats()
+    return db_manager.get_database_stats(replica)
+
+
+def refresh_replica(pages: int = 1024, pause: float = 0.005) -> List[Dict[str, Any]]:
+    """Refresh the read-only replica of every shard."""
+    return db_manager.refresh_replica(pages, pause)
 
 
 # Example usage and testing
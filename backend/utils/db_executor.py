@@ -0,0 +1,300 @@
+"""
+Bounded execution layer for database work.
+Runs writes on a single dedicated writer thread and reads on a pool of
+reader threads, so a long ingest does not stall reads on the request
+threads. Portfolio ingests go to the database's group-commit writer.
+Both queues are bounded and callers wait with a timeout. Streamed reads
+(exports) keep their cursor on the response thread but hold a read slot
+until the stream ends.
+"""
+
+import atexit
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from flask import current_app
+from utils.database import db_manager
+from utils.profiling import profiled
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturatedError(Exception):
+    """Raised when a database work queue is full."""
+
+    def __init__(self, kind: str, limit: int):
+        super().__init__(f"Too many pending database {kind}s (limit {limit})")
+        self.kind = kind
+        self.limit = limit
+
+
+class _SlotStream:
+    """
+    Iterator that gives back an executor slot when it is exhausted or closed.
+    """
+
+    def __init__(self, iterable: Iterable, release: Callable[[], None]):
+        self._iterator = iter(iterable)
+        self._release = release
+        self._closed = False
+
+    def __iter__(self) -> Iterator:
+        return self
+
+    def __next__(self) -> Any:
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            close = getattr(self._iterator, 'close', None)
+            if close:
+                close()
+        finally:
+            self._release()
+
+
+class DatabaseExecutor:
+    """
+    Runs database calls on a single writer thread and a pool of reader threads.
+    """
+
+    def __init__(self, reader_threads: int = 4, max_pending_reads: int = 64,
+                 max_pending_writes: int = 64, read_timeout: float = 10.0,
+                 write_timeout: float = 60.0):
+        """
+        Initialize the executor.
+
+        Args:
+            reader_threads (int): Number of threads serving reads
+            max_pending_reads (int): Reads queued or running before rejecting
+            max_pending_writes (int): Writes queued or running before rejecting
+            read_timeout (float): Seconds run_read waits for a result
+            write_timeout (float): Seconds run_write waits for a result
+        """
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.max_pending_reads = max_pending_reads
+        self.max_pending_writes = max_pending_writes
+
+        self._readers = ThreadPoolExecutor(max_workers=reader_threads,
+                                           thread_name_prefix='db-reader')
+        self._writer = ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix='db-writer')
+        self._read_slots = threading.BoundedSemaphore(max_pending_reads)
+        self._write_slots = threading.BoundedSemaphore(max_pending_writes)
+
+        self._lock = threading.Lock()
+        self._pending = {'read': 0, 'write': 0}
+        self._rejected = {'read': 0, 'write': 0}
+
+        logger.info(f"Database executor started with {reader_threads} reader threads and 1 writer thread")
+
+    def _acquire(self, kind: str, slots: threading.BoundedSemaphore, limit: int):
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected[kind] += 1
+            logger.warning(f"Database {kind} queue full ({limit} pending)")
+            raise ExecutorSaturatedError(kind, limit)
+
+        with self._lock:
+            self._pending[kind] += 1
+
+    def _release(self, kind: str, slots: threading.BoundedSemaphore):
+        with self._lock:
+            self._pending[kind] -= 1
+        slots.release()
+
+    def _track(self, kind: str, slots: threading.BoundedSemaphore, limit: int,
+               start: Callable[[], Future]) -> Future:
+        self._acquire(kind, slots, limit)
+        try:
+            future = start()
+        except Exception:
+            self._release(kind, slots)
+            raise
+        future.add_done_callback(lambda _future: self._release(kind, slots))
+        return future
+
+    def _submit(self, kind: str, pool: ThreadPoolExecutor, slots: threading.BoundedSemaphore,
+                limit: int, fn: Callable, *args, **kwargs) -> Future:
+        return self._track(kind, slots, limit, lambda: pool.submit(fn, *args, **kwargs))
+
+    def submit_read(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Queue a read on the reader pool.
+
+        Raises:
+            ExecutorSaturatedError: If max_pending_reads reads are already queued
+        """
+        return self._submit('read', self._readers, self._read_slots,
+                            self.max_pending_reads, fn, *args, **kwargs)
+
+    def submit_write(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Queue a write on the single writer thread.
+
+        Raises:
+            ExecutorSaturatedError: If max_pending_writes writes are already queued
+        """
+        return self._submit('write', self._writer, self._write_slots,
+                            self.max_pending_writes, fn, *args, **kwargs)
+
+    def submit_ingest(self, user_id: str, file_name: str,
+                      holdings_list: List[Dict[str, Any]],
+                      digest: Optional[Dict[str, Any]] = None) -> Future:
+        """
+        Queue a portfolio ingest on the database's group-commit writer.
+
+        Ingests count against max_pending_writes like any other write but are
+        committed by DatabaseManager's own writer thread, which coalesces
+        concurrent ingests into one transaction.
+
+        Raises:
+            ExecutorSaturatedError: If max_pending_writes writes are already queued
+        """
+        return self._track('write', self._write_slots, self.max_pending_writes,
+                           lambda: db_manager.submit_ingest(user_id, file_name, holdings_list, digest))
+
+    def stream_read(self, iterable: Iterable) -> Iterator:
+        """
+        Hold a read slot while a streamed read is consumed.
+
+        Streams read on the thread consuming them, not on the reader pool,
+        since their cursor stays open between chunks. The slot is taken now
+        and given back when the stream is exhausted or closed, so open
+        exports count against max_pending_reads.
+
+        Raises:
+            ExecutorSaturatedError: If max_pending_reads reads are already queued
+        """
+        self._acquire('read', self._read_slots, self.max_pending_reads)
+        return _SlotStream(iterable, lambda: self._release('read', self._read_slots))
+
+    def run_read(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a read on the reader pool and wait for its result.
+
+        Raises:
+            ExecutorSaturatedError: If the read queue is full
+            concurrent.futures.TimeoutError: If no result within read_timeout
+        """
+        future = self.submit_read(fn, *args, **kwargs)
+        return self._wait(future, self.read_timeout)
+
+    def run_write(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a write on the writer thread and wait for its result.
+
+        A write that times out after it has started still runs to completion;
+        only writes still waiting in the queue are cancelled.
+
+        Raises:
+            ExecutorSaturatedError: If the write queue is full
+            concurrent.futures.TimeoutError: If no result within write_timeout
+        """
+        future = self.submit_write(fn, *args, **kwargs)
+        return self._wait(future, self.write_timeout)
+
+    def run_ingest(self, user_id: str, file_name: str,
+                   holdings_list: List[Dict[str, Any]],
+                   digest: Optional[Dict[str, Any]] = None) -> Tuple[int, int]:
+        """
+        Ingest a portfolio through the group-commit writer and wait for it.
+
+        Returns:
+            Tuple[int, int]: (portfolio_id, holdings_count)
+
+        Raises:
+            ExecutorSaturatedError: If the write queue is full
+            concurrent.futures.TimeoutError: If not committed within write_timeout
+        """
+        future = self.submit_ingest(user_id, file_name, holdings_list, digest)
+        return self._wait(future, self.write_timeout)
+
+    @staticmethod
+    def _wait(future: Future, timeout: float) -> Any:
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            future.cancel()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get current queue depths and rejection counts.
+
+        Returns:
+            Dict: Executor statistics
+        """
+        with self._lock:
+            return {
+                'pending_reads': self._pending['read'],
+                'pending_writes': self._pending['write'],
+                'max_pending_reads': self.max_pending_reads,
+                'max_pending_writes': self.max_pending_writes,
+                'rejected_reads': self._rejected['read'],
+                'rejected_writes': self._rejected['write'],
+            }
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the worker threads.
+
+        Args:
+            wait (bool): Wait for queued work to finish
+        """
+        self._readers.shutdown(wait=wait)
+        self._writer.shutdown(wait=wait)
+
+
+def init_db_executor(app) -> DatabaseExecutor:
+    """
+    Create the database executor for a Flask app from its config.
+
+    Args:
+        app (Flask): Application to attach the executor to
+
+    Returns:
+        DatabaseExecutor: The created executor
+    """
+    executor = DatabaseExecutor(
+        reader_threads=app.config['DB_READER_THREADS'],
+        max_pending_reads=app.config['DB_MAX_PENDING_READS'],
+        max_pending_writes=app.config['DB_MAX_PENDING_WRITES'],
+        read_timeout=app.config['DB_READ_TIMEOUT'],
+        write_timeout=app.config['DB_WRITE_TIMEOUT'],
+    )
+    app.extensions['db_executor'] = executor
+    atexit.register(executor.shutdown, wait=False)
+    return executor
+
+
+def get_db_executor() -> DatabaseExecutor:
+    """Get the database executor of the current Flask app."""
+    return current_app.extensions['db_executor']
+
+
+def run_read(fn: Callable, *args, **kwargs) -> Any:
+    """Run a read on the current app's reader pool."""
+    return get_db_executor().run_read(profiled(fn), *args, **kwargs)
+
+
+def run_write(fn: Callable, *args, **kwargs) -> Any:
+    """Run a write on the current app's writer thread."""
+    return get_db_executor().run_write(profiled(fn), *args, **kwargs)
+
+
+def run_ingest(user_id: str, file_name: str, holdings_list: List[Dict[str, Any]],
+               digest: Optional[Dict[str, Any]] = None) -> Tuple[int, int]:
+    """Ingest a portfolio (and its digest) through the group-commit writer."""
+    return get_db_executor().run_ingest(user_id, file_name, holdings_list, digest)
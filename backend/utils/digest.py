@@ -0,0 +1,177 @@
+"""
+Compact portfolio digests for the advisor chat.
+Builds a small summary of a portfolio (top positions, concentration,
+sector weights, P&L buckets, date span) once at ingest time, so each chat
+turn can read one stored row instead of the full holdings.
+"""
+
+import logging
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bump when the digest layout or contents change; older stored digests
+# are rebuilt on read
+DIGEST_VERSION = 2
+
+# Unrealized return buckets as (label, lower bound inclusive, upper bound exclusive)
+PNL_BUCKETS = [
+    ('loss_over_20pct', float('-inf'), -0.20),
+    ('loss_0_to_20pct', -0.20, 0.0),
+    ('gain_0_to_20pct', 0.0, 0.20),
+    ('gain_over_20pct', 0.20, float('inf')),
+]
+
+UNCLASSIFIED_SECTOR = 'Unclassified'
+
+
+def normalize_sector(name: Optional[str]) -> Optional[str]:
+    """
+    Collapse whitespace in a sector name (None for blank names).
+
+    Stored sector names are unique case-insensitively, so normalized names
+    that differ only in case are the same sector.
+    """
+    if not name:
+        return None
+    return ' '.join(name.split()) or None
+
+
+def build_portfolio_digest(holdings: List[Dict[str, Any]],
+                           price_lookup: Optional[Callable[[str], Optional[Tuple[str, float]]]] = None,
+                           top_n: int = 10) -> Dict[str, Any]:
+    """
+    Build the digest of a portfolio from its parsed holdings.
+
+    Weights are by cost basis (shares * purchase_price). When price_lookup
+    is given, positions with a known latest close are bucketed by their
+    unrealized return as of that close.
+
+    Args:
+        holdings (List[Dict]): Parsed holdings (ticker, shares, purchase_price,
+            purchase_date and optional company_name/sector)
+        price_lookup (Callable): Returns (date, close) for a ticker, or None
+        top_n (int): Number of top positions to include
+
+    Returns:
+        Dict[str, Any]: Digest
+    """
+    positions: Dict[str, Dict[str, Any]] = {}
+    # Keyed by case-folded name, as the sectors table matches them;
+    # the first spelling seen is the one reported
+    sector_costs: Dict[str, float] = {}
+    sector_names: Dict[str, str] = {}
+    purchase_dates = []
+
+    for holding in holdings:
+        ticker = holding['ticker']
+        cost = holding['shares'] * holding['purchase_price']
+        position = positions.setdefault(ticker, {
+            'ticker': ticker,
+            'company_name': holding.get('company_name'),
+            'shares': 0.0,
+            'cost': 0.0,
+        })
+        position['shares'] += holding['shares']
+        position['cost'] += cost
+        if not position['company_name'] and holding.get('company_name'):
+            position['company_name'] = holding['company_name']
+
+        sector = normalize_sector(holding.get('sector')) or UNCLASSIFIED_SECTOR
+        key = sector.casefold()
+        sector_names.setdefault(key, sector)
+        sector_costs[key] = sector_costs.get(key, 0.0) + cost
+
+        if holding.get('purchase_date'):
+            purchase_dates.append(str(holding['purchase_date']))
+
+    total_cost = sum(position['cost'] for position in positions.values())
+    ranked = sorted(positions.values(), key=lambda p: p['cost'], reverse=True)
+    weights = [p['cost'] / total_cost if total_cost else 0.0 for p in ranked]
+    hhi = sum(w * w for w in weights)
+
+    digest = {
+        'version': DIGEST_VERSION,
+        'generated_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'holdings_count': len(holdings),
+        'positions_count': len(positions),
+        'total_cost': round(total_cost, 2),
+        'top_positions': [
+            {
+                'ticker': p['ticker'],
+                'company_name': p['company_name'],
+                'shares': p['shares'],
+                'cost': round(p['cost'], 2),
+                'weight': round(weights[i], 4),
+            }
+            for i, p in enumerate(ranked[:top_n])
+        ],
+        'concentration': {
+            'top1_weight': round(sum(weights[:1]), 4),
+            'top5_weight': round(sum(weights[:5]), 4),
+            'top10_weight': round(sum(weights[:10]), 4),
+            'hhi': round(hhi, 4),
+            'effective_positions': round(1 / hhi, 2) if hhi else 0,
+        },
+        'sector_weights': {
+            sector_names[key]: round(cost / total_cost, 4) if total_cost else 0.0
+            for key, cost in sorted(sector_costs.items(), key=lambda item: item[1], reverse=True)
+        },
+        'pnl_buckets': _pnl_buckets(ranked, price_lookup),
+        'date_span': _date_span(purchase_dates),
+    }
+    return digest
+
+
+def _pnl_buckets(positions: List[Dict[str, Any]],
+                 price_lookup: Optional[Callable[[str], Optional[Tuple[str, float]]]]) -> Dict[str, Any]:
+    """
+    Bucket positions by unrealized return at their latest known close.
+    """
+    buckets = {label: {'count': 0, 'cost': 0.0, 'market_value': 0.0} for label, _, _ in PNL_BUCKETS}
+    unpriced = {'count': 0, 'cost': 0.0}
+    priced_as_of = None
+
+    for position in positions:
+        quote = price_lookup(position['ticker']) if price_lookup else None
+        if quote is None or position['cost'] <= 0:
+            unpriced['count'] += 1
+            unpriced['cost'] += position['cost']
+            continue
+
+        quote_date, close = quote
+        priced_as_of = max(priced_as_of, quote_date) if priced_as_of else quote_date
+        market_value = position['shares'] * close
+        unrealized_return = market_value / position['cost'] - 1.0
+        for label, lower, upper in PNL_BUCKETS:
+            if lower <= unrealized_return < upper:
+                buckets[label]['count'] += 1
+                buckets[label]['cost'] += position['cost']
+                buckets[label]['market_value'] += market_value
+                break
+
+    for bucket in buckets.values():
+        bucket['cost'] = round(bucket['cost'], 2)
+        bucket['market_value'] = round(bucket['market_value'], 2)
+    unpriced['cost'] = round(unpriced['cost'], 2)
+
+    return {'priced_as_of': priced_as_of, 'buckets': buckets, 'unpriced': unpriced}
+
+
+def _date_span(purchase_dates: List[str]) -> Dict[str, Any]:
+    """
+    Earliest and latest purchase dates and the days between them.
+    """
+    if not purchase_dates:
+        return {'earliest_purchase': None, 'latest_purchase': None, 'span_days': 0}
+
+    earliest = min(purchase_dates)
+    latest = max(purchase_dates)
+    try:
+        span_days = (date.fromisoformat(latest[:10]) - date.fromisoformat(earliest[:10])).days
+    except ValueError:
+        span_days = None
+    return {'earliest_purchase': earliest, 'latest_purchase': latest, 'span_days': span_days}
@@ -0,0 +1,111 @@
+"""
+Streaming export helpers for portfolio data.
+Turns batches of database rows into CSV or NDJSON text chunks, optionally
+gzip-compressed on the fly, without materializing the full export.
+"""
+
+import csv
+import json
+import zlib
+from io import StringIO
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+# Supported export formats and their mimetypes
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def csv_chunks(columns: Sequence[str], batches: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    """
+    Encode row batches as CSV, one chunk per batch.
+
+    Args:
+        columns (Sequence[str]): Header row
+        batches (Iterable[List[Tuple]]): Batches of row tuples
+
+    Yields:
+        bytes: UTF-8 encoded CSV text
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    yield buffer.getvalue().encode('utf-8')
+
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_chunks(columns: Sequence[str], batches: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    """
+    Encode row batches as newline-delimited JSON, one chunk per batch.
+
+    Args:
+        columns (Sequence[str]): Field names for each row
+        batches (Iterable[List[Tuple]]): Batches of row tuples
+
+    Yields:
+        bytes: UTF-8 encoded NDJSON text
+    """
+    encoder = json.JSONEncoder(separators=(',', ':'))
+    columns = tuple(columns)
+
+    for batch in batches:
+        lines = [encoder.encode(dict(zip(columns, row))) for row in batch]
+        lines.append('')
+        yield '\n'.join(lines).encode('utf-8')
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    Gzip-compress a stream of chunks incrementally.
+
+    Args:
+        chunks (Iterable[bytes]): Uncompressed chunks
+        level (int): zlib compression level
+
+    Yields:
+        bytes: Gzip stream pieces (empty pieces are skipped)
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+
+def export_chunks(columns: Sequence[str], batches: Iterable[List[Tuple]],
+                  export_format: str = 'csv', compress: bool = False) -> Iterator[bytes]:
+    """
+    Build the byte stream for an export.
+
+    Args:
+        columns (Sequence[str]): Column names
+        batches (Iterable[List[Tuple]]): Batches of row tuples
+        export_format (str): 'csv' or 'ndjson'
+        compress (bool): Gzip the stream
+
+    Returns:
+        Iterator[bytes]: Export body chunks
+
+    Raises:
+        ValueError: If the format is not supported
+    """
+    if export_format == 'csv':
+        chunks = csv_chunks(columns, batches)
+    elif export_format == 'ndjson':
+        chunks = ndjson_chunks(columns, batches)
+    else:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+    if compress:
+        return gzip_chunks(chunks)
+    return chunks
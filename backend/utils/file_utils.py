@@ -1,5 +1,131 @@
+import io
+import bz2
+import gzip
+import lzma
+import zlib
+import zipfile
 from flask import current_app
 
+# Compressed upload formats and how to open a decompressing reader for each
+COMPRESSED_EXTENSIONS = {
+    'csv.gz': lambda stream: gzip.GzipFile(fileobj=stream, mode='rb'),
+    'csv.bz2': bz2.BZ2File,
+    'csv.xz': lzma.LZMAFile,
+}
+
+# Errors raised by the decompressors on corrupt or truncated input
+DECOMPRESSION_ERRORS = (OSError, EOFError, zlib.error, lzma.LZMAError, zipfile.BadZipFile)
+
+
+class UploadDecompressionError(Exception):
+    """Raised when an uploaded archive cannot be decompressed."""
+
+
+class DecompressedSizeError(UploadDecompressionError):
+    """Raised when an upload decompresses to more than the allowed size."""
+
+
+def get_file_extension(filename):
+    """Return the (possibly compound) extension of a filename, lowercased."""
+    if '.' not in filename:
+        return ''
+    parts = filename.lower().rsplit('.', 2)
+    compound = '.'.join(parts[-2:])
+    if len(parts) > 2 and compound in COMPRESSED_EXTENSIONS:
+        return compound
+    return parts[-1]
+
 def allowed_file(filename):
     return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+           get_file_extension(filename) in current_app.config['ALLOWED_EXTENSIONS']
+
+
+class _LimitedReader(io.RawIOBase):
+    """
+    Binary reader that stops after max_bytes of decompressed data.
+
+    Decompression errors surfacing from the wrapped stream are re-raised
+    as UploadDecompressionError.
+    """
+
+    def __init__(self, stream, max_bytes):
+        self._stream = stream
+        self._max_bytes = max_bytes
+        self._bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        try:
+            data = self._stream.read(len(buffer))
+        except DECOMPRESSION_ERRORS as e:
+            raise UploadDecompressionError(f"Failed to decompress upload: {str(e)}") from e
+
+        self._bytes_read += len(data)
+        if self._max_bytes is not None and self._bytes_read > self._max_bytes:
+            raise DecompressedSizeError(
+                f"Decompressed file exceeds the limit of {self._max_bytes} bytes"
+            )
+
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            super().close()
+
+
+def _open_zip_member(stream):
+    """Open the single CSV member of a zip archive for streaming reads."""
+    try:
+        archive = zipfile.ZipFile(stream)
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and info.filename.lower().endswith('.csv')
+            and not info.filename.startswith('__MACOSX/')
+        ]
+    except DECOMPRESSION_ERRORS as e:
+        raise UploadDecompressionError(f"Invalid zip archive: {str(e)}") from e
+
+    if len(members) != 1:
+        archive.close()
+        raise UploadDecompressionError("Zip archive must contain exactly one CSV file")
+
+    return archive.open(members[0])
+
+
+def open_upload_stream(file, filename, max_decompressed_bytes=None):
+    """
+    Open an uploaded file as a UTF-8 text stream, decompressing on the fly.
+
+    Plain .csv files are read as-is; .csv.gz, .csv.bz2, .csv.xz and .zip
+    uploads are decompressed incrementally as the stream is consumed, so the
+    decompressed file is never held in memory.
+
+    Args:
+        file: Uploaded werkzeug FileStorage
+        filename (str): Name used to pick the decompressor
+        max_decompressed_bytes (int): Limit on decompressed size (None for no limit)
+
+    Returns:
+        io.TextIOWrapper: Text stream over the (decompressed) CSV content
+
+    Raises:
+        UploadDecompressionError: If the archive is invalid
+    """
+    extension = get_file_extension(filename)
+    stream = file.stream
+
+    if extension in COMPRESSED_EXTENSIONS:
+        raw = COMPRESSED_EXTENSIONS[extension](stream)
+    elif extension == 'zip':
+        raw = _open_zip_member(stream)
+    else:
+        raw = stream
+
+    limited = _LimitedReader(raw, max_decompressed_bytes)
+    return io.TextIOWrapper(io.BufferedReader(limited), encoding='utf-8', newline='')
@@ -0,0 +1,233 @@
+"""
+Tax-lot tracking across successive portfolio uploads.
+Each upload is a snapshot of a user's holdings. Comparing a snapshot's
+positions with those of the previously applied one tells which shares were
+bought and which were sold in between; sells are matched to open lots FIFO
+(oldest acquisition first) or by specific lot (the lots whose rows shrank
+or disappeared), and each match becomes a realized gain.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LOT_METHODS = ('fifo', 'specific')
+
+# Lots held longer than this many days are long-term when sold
+LONG_TERM_DAYS = 365
+
+# Share counts are REAL; differences below this are rounding noise
+SHARE_EPSILON = 1e-9
+
+
+class LotMethodError(ValueError):
+    """Raised for an unknown lot matching method."""
+
+
+class LotRebuildThrottledError(Exception):
+    """Raised when a user's lots were rebuilt too recently to rebuild again."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LotSyncConflictError(Exception):
+    """Raised when a user's lots changed method between planning and applying a sync."""
+
+
+def validate_method(method: str) -> str:
+    """
+    Check a lot matching method name.
+
+    Raises:
+        LotMethodError: If the method is not one of LOT_METHODS
+    """
+    if method not in LOT_METHODS:
+        raise LotMethodError(f"Unknown lot method '{method}'. Use one of: {', '.join(LOT_METHODS)}")
+    return method
+
+
+def lot_key(purchase_date: Optional[str], price: float) -> Tuple[str, float]:
+    """
+    Identify a lot across snapshots by its purchase date and price.
+    """
+    return purchase_date or '', round(float(price), 6)
+
+
+def holding_term(acquired_date: str, sale_date: str) -> str:
+    """
+    Get 'long' or 'short' for shares acquired and sold on the given ISO dates.
+    """
+    held_days = (date.fromisoformat(sale_date) - date.fromisoformat(acquired_date)).days
+    return 'long' if held_days > LONG_TERM_DAYS else 'short'
+
+
+def _consume(lot: Dict[str, Any], shares: float, sale_date: str, price: Optional[float],
+             realized: List[Dict[str, Any]]) -> float:
+    """
+    Sell up to `shares` from a lot, recording the realized gain.
+
+    Returns:
+        float: Shares actually taken from the lot
+    """
+    taken = min(shares, lot['remaining'])
+    if taken <= SHARE_EPSILON:
+        return 0.0
+    lot['remaining'] -= taken
+    if lot['remaining'] <= SHARE_EPSILON:
+        lot['remaining'] = 0.0
+    cost_basis = taken * lot['cost_per_share']
+    proceeds = taken * price if price is not None else None
+    realized.append({
+        'lot': lot,
+        'ticker': lot['ticker'],
+        'acquired_date': lot['acquired_date'],
+        'sale_date': sale_date,
+        'shares': taken,
+        'cost_basis': cost_basis,
+        'proceeds': proceeds,
+        'gain': proceeds - cost_basis if proceeds is not None else None,
+        'term': holding_term(lot['acquired_date'], sale_date),
+    })
+    return taken
+
+
+def snapshot_positions(holdings: List[Dict[str, Any]]) -> Dict[int, Dict[Tuple[str, float], float]]:
+    """
+    Sum a snapshot's shares per ticker_id and lot key.
+
+    Args:
+        holdings (List[Dict]): Snapshot rows with ticker_id, shares,
+            purchase_price and purchase_date
+
+    Returns:
+        Dict: {ticker_id: {lot_key: shares}}
+    """
+    positions: Dict[int, Dict[Tuple[str, float], float]] = defaultdict(lambda: defaultdict(float))
+    for row in holdings:
+        positions[row['ticker_id']][lot_key(row['purchase_date'], row['purchase_price'])] += float(row['shares'])
+    return positions
+
+
+def _shrunk(before: Dict[Tuple[str, float], float],
+            after: Dict[Tuple[str, float], float]) -> Dict[Tuple[str, float], float]:
+    # Shares that left each lot key of one ticker
+    shrunk = {}
+    for key in sorted(set(before) | set(after)):
+        change = after.get(key, 0.0) - before.get(key, 0.0)
+        if change < -SHARE_EPSILON:
+            shrunk[key] = -change
+    return shrunk
+
+
+def sold_tickers(previous: Dict[int, Dict[Tuple[str, float], float]],
+                 positions: Dict[int, Dict[Tuple[str, float], float]]) -> List[int]:
+    """
+    Get the ticker_ids with sales between two snapshots' positions.
+    """
+    return sorted(ticker_id for ticker_id in previous
+                  if _shrunk(previous[ticker_id], positions.get(ticker_id, {})))
+
+
+def reconcile_snapshot(open_lots: List[Dict[str, Any]], previous: Dict[int, Dict[Tuple[str, float], float]],
+                       holdings: List[Dict[str, Any]], snapshot_date: str, method: str = 'fifo',
+                       price_lookup: Optional[Callable[[str, str], Optional[float]]] = None
+                       ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Apply one uploaded snapshot to a user's open lots.
+
+    Shares per ticker and (purchase_date, purchase_price) in the snapshot
+    are compared with the positions of the previously applied snapshot: a
+    key that grew is a buy and opens a lot, a key that shrank or
+    disappeared is a sell. Sold shares are matched FIFO against the
+    ticker's oldest open lots, or with 'specific' against the open lots of
+    the key that shrank. Open lots are never compared with the snapshot:
+    after FIFO matching their remainders no longer follow the rows.
+
+    Open lots are updated in place (their `remaining` shares). Sales are
+    dated snapshot_date and priced with price_lookup(ticker, date) when it
+    knows a close; otherwise proceeds and gain are None.
+
+    Args:
+        open_lots (List[Dict]): Lots with remaining > 0, ordered by acquired_date then id;
+            each has ticker_id, ticker, purchase_date, acquired_date, cost_per_share, remaining
+        previous (Dict): snapshot_positions() of the previous snapshot
+            ({} before the first)
+        holdings (List[Dict]): Snapshot rows with ticker_id, ticker, shares,
+            purchase_price and purchase_date
+        snapshot_date (str): ISO date of the upload
+        method (str): 'fifo' or 'specific'
+        price_lookup (Callable): Close of a ticker on or before a date
+
+    Returns:
+        Tuple[List[Dict], List[Dict]]: (new lots, realized gains); each
+        realized gain refers to its lot under 'lot'
+    """
+    validate_method(method)
+
+    lots_by_ticker: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    tickers: Dict[int, str] = {}
+    for lot in open_lots:
+        if lot['remaining'] > SHARE_EPSILON:
+            lots_by_ticker[lot['ticker_id']].append(lot)
+            tickers[lot['ticker_id']] = lot['ticker']
+    for row in holdings:
+        tickers[row['ticker_id']] = row['ticker']
+
+    target = snapshot_positions(holdings)
+
+    new_lots: List[Dict[str, Any]] = []
+    realized: List[Dict[str, Any]] = []
+    for ticker_id in sorted(set(previous) | set(target)):
+        lots = lots_by_ticker.get(ticker_id, [])
+        before, after = previous.get(ticker_id, {}), target.get(ticker_id, {})
+
+        for key in sorted(after):
+            change = after[key] - before.get(key, 0.0)
+            if change > SHARE_EPSILON:
+                purchase_date, price = key
+                new_lots.append({
+                    'ticker_id': ticker_id,
+                    'ticker': tickers[ticker_id],
+                    'purchase_date': purchase_date or None,
+                    'acquired_date': purchase_date or snapshot_date,
+                    'cost_per_share': price,
+                    'shares': change,
+                    'remaining': change,
+                })
+
+        shrunk = _shrunk(before, after)
+        if not shrunk or not lots:
+            continue
+        ticker = tickers[ticker_id]
+        price = price_lookup(ticker, snapshot_date) if price_lookup else None
+
+        unmatched = 0.0
+        if method == 'specific':
+            for key, shares in shrunk.items():
+                for lot in lots:
+                    if shares <= SHARE_EPSILON:
+                        break
+                    if lot_key(lot['purchase_date'], lot['cost_per_share']) == key:
+                        shares -= _consume(lot, shares, snapshot_date, price, realized)
+                unmatched += max(shares, 0.0)
+        else:
+            unmatched = sum(shrunk.values())
+
+        # FIFO, and the specific-lot remainder when a key's lots were
+        # already consumed (e.g. after switching methods)
+        for lot in lots:
+            if unmatched <= SHARE_EPSILON:
+                break
+            unmatched -= _consume(lot, unmatched, snapshot_date, price, realized)
+        if unmatched > SHARE_EPSILON:
+            logger.warning(f"{unmatched:g} sold shares of {ticker} matched no open lot")
+
+    new_lots.sort(key=lambda lot: (lot['acquired_date'], lot['ticker']))
+    return new_lots, realized
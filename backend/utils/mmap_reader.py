@@ -0,0 +1,196 @@
+"""
+Memory-mapped CSV reader for large on-disk files.
+Scans rows directly from the mapped file buffer and only decodes the
+columns the caller asks for, instead of reading the whole file into
+Python strings first.
+"""
+
+import codecs
+import csv
+import mmap
+import os
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Files at or above this size are read through mmap by default
+MMAP_THRESHOLD_BYTES = 8 * 1024 * 1024  # 8MB
+
+_QUOTE = b'"'
+_NEWLINE = b'\n'
+
+
+def should_use_mmap(file_path: str, threshold: int = MMAP_THRESHOLD_BYTES) -> bool:
+    """
+    Decide whether a file is large enough to be read through mmap.
+
+    Args:
+        file_path (str): Path to the file on disk
+        threshold (int): Minimum size in bytes for the mmap path
+
+    Returns:
+        bool: True if the file exists, is non-empty and at least threshold bytes
+    """
+    try:
+        size = os.path.getsize(file_path)
+    except OSError:
+        return False
+    return size > 0 and size >= threshold
+
+
+class MappedCSVReader:
+    """
+    Iterate CSV rows from a memory-mapped file.
+
+    Rows are yielded as dictionaries keyed by the raw header names, like
+    csv.DictReader, but only for the requested columns. A UTF-8 byte order
+    mark before the header is skipped. Unquoted lines are
+    split on the raw bytes and only the needed fields are decoded; lines that
+    contain quotes fall back to the csv module for that row only.
+
+    Use as a context manager so the mapping and file handle are released:
+
+        with MappedCSVReader(path, columns=['ticker', 'shares']) as reader:
+            for row in reader:
+                ...
+    """
+
+    def __init__(self, file_path: str, columns: Optional[Iterable[str]] = None,
+                 encoding: str = 'utf-8'):
+        """
+        Initialize the reader.
+
+        Args:
+            file_path (str): Path to the CSV file
+            columns (Iterable[str]): Header names to decode (None for all)
+            encoding (str): Text encoding of the file
+        """
+        self.file_path = file_path
+        self.encoding = encoding
+        self._wanted = set(columns) if columns is not None else None
+        self._file = None
+        self._mm = None
+        self._data_start = 0
+        self.fieldnames: Optional[List[str]] = None
+        self._selected: List[tuple] = []
+
+    def __enter__(self) -> 'MappedCSVReader':
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        """
+        Map the file and read its header line.
+        """
+        self._file = open(self.file_path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            self._file = None
+            raise
+
+        start = 0
+        if self._mm[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 and \
+                codecs.lookup(self.encoding).name in ('utf-8', 'utf-8-sig'):
+            start = len(codecs.BOM_UTF8)
+        header, self._data_start = self._read_record(start)
+        if header is None:
+            self.fieldnames = None
+            return
+
+        self.fieldnames = self._split_quoted(header)
+        self._selected = [
+            (index, name) for index, name in enumerate(self.fieldnames)
+            if self._wanted is None or name in self._wanted
+        ]
+        logger.info(f"Memory-mapped {self.file_path} ({len(self._mm)} bytes)")
+
+    def close(self):
+        """
+        Release the mapping and the underlying file handle.
+        """
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __iter__(self) -> Iterator[Dict[str, Optional[str]]]:
+        if self._mm is None:
+            raise ValueError("MappedCSVReader is not open")
+        if self.fieldnames is None:
+            return
+
+        position = self._data_start
+        size = len(self._mm)
+        while position < size:
+            record, position = self._read_record(position)
+            if not record:
+                # csv.DictReader skips blank lines as well
+                continue
+
+            if _QUOTE in record:
+                yield self._select(self._split_quoted(record))
+            else:
+                yield self._select_raw(record.split(b','))
+
+    def _read_record(self, position: int):
+        """
+        Read one CSV record starting at position.
+
+        A record normally ends at the next newline; when it contains an odd
+        number of quotes it continues onto the following lines so quoted
+        fields with embedded newlines stay intact.
+
+        Returns:
+            Tuple[Optional[bytes], int]: (record bytes, position after it)
+        """
+        mm = self._mm
+        size = len(mm)
+        if position >= size:
+            return None, size
+
+        start = position
+        end = mm.find(_NEWLINE, position)
+        while True:
+            if end == -1:
+                end = size
+            record = mm[start:end]
+            if record.count(_QUOTE) % 2 == 0 or end >= size:
+                break
+            end = mm.find(_NEWLINE, end + 1)
+
+        if record.endswith(b'\r'):
+            record = record[:-1]
+        return record, end + 1
+
+    def _split_quoted(self, record: bytes) -> List[str]:
+        """
+        Split a record with the csv module (handles quoting and escapes).
+        """
+        return next(csv.reader([record.decode(self.encoding)]), [])
+
+    def _select(self, fields: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Pick the selected columns from already decoded fields.
+        """
+        count = len(fields)
+        return {name: fields[index] if index < count else None
+                for index, name in self._selected}
+
+    def _select_raw(self, fields: List[bytes]) -> Dict[str, Optional[str]]:
+        """
+        Pick and decode only the selected columns from raw byte fields.
+        """
+        count = len(fields)
+        encoding = self.encoding
+        return {name: fields[index].decode(encoding) if index < count else None
+                for index, name in self._selected}
@@ -0,0 +1,480 @@
+"""
+Local market news store backed by SQLite FTS5.
+Articles are bulk-loaded from JSON/NDJSON/CSV dumps into a full-text index
+plus a ticker -> article index, so news for a whole portfolio is one
+ranked query instead of a lookup per ticker.
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from flask import current_app
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+NEWS_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS articles (
+           id INTEGER PRIMARY KEY,
+           external_id TEXT NOT NULL UNIQUE,
+           published_at TEXT NOT NULL,
+           title TEXT NOT NULL,
+           summary TEXT,
+           source TEXT,
+           url TEXT
+       )""",
+    # External-content FTS index over the article text
+    """CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+           title, summary, content='articles', content_rowid='id'
+       )""",
+    # Ticker -> article index, clustered for "latest articles for these tickers"
+    """CREATE TABLE IF NOT EXISTS article_tickers (
+           ticker TEXT NOT NULL,
+           published_at TEXT NOT NULL,
+           article_id INTEGER NOT NULL,
+           PRIMARY KEY (ticker, published_at, article_id)
+       ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_article_tickers_article ON article_tickers(article_id)",
+]
+
+# Separators accepted in a CSV `tickers` column
+_TICKER_SEPARATORS = (';', '|', ',', ' ')
+
+# published_at is stored in this format (UTC), so comparing the strings
+# compares the moments, for ordering and for the `days` cutoff
+PUBLISHED_AT_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Non-ISO date formats accepted besides epoch seconds/milliseconds and RFC 2822
+_PUBLISHED_AT_FORMATS = ('%b %d, %Y', '%B %d, %Y', '%d %b %Y', '%d %B %Y', '%Y/%m/%d', '%m/%d/%Y')
+
+# PRAGMA user_version once stored published_at values are normalized
+_NEWS_SCHEMA_VERSION = 1
+
+
+class NewsQueryError(ValueError):
+    """Raised when a full-text query is not valid FTS5 syntax."""
+
+
+class NewsStore:
+    """
+    Manages the local news database.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Initialize the news store, creating its tables if needed.
+
+        Args:
+            db_path (str): Path to the news SQLite database file
+        """
+        self.db_path = db_path
+        self.skipped_records = 0
+        with self.get_connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in NEWS_SCHEMA:
+                conn.execute(statement)
+            if conn.execute("PRAGMA user_version").fetchone()[0] < _NEWS_SCHEMA_VERSION:
+                self._normalize_stored_dates(conn)
+                conn.execute(f"PRAGMA user_version = {_NEWS_SCHEMA_VERSION}")
+            conn.commit()
+
+    @classmethod
+    def _normalize_stored_dates(cls, conn: sqlite3.Connection):
+        """
+        Rewrite published_at values loaded before they were normalized.
+
+        Values that cannot be parsed are left as they are.
+        """
+        updates = []
+        unparsed = 0
+        for article_id, published_at in conn.execute("SELECT id, published_at FROM articles"):
+            normalized = cls._parse_published_at(published_at)
+            if normalized is None:
+                unparsed += 1
+            elif normalized != published_at:
+                updates.append((normalized, article_id))
+        conn.executemany("UPDATE articles SET published_at = ? WHERE id = ?", updates)
+        conn.executemany("UPDATE article_tickers SET published_at = ? WHERE article_id = ?", updates)
+        if updates or unparsed:
+            logger.info(f"Normalized published_at of {len(updates)} news articles "
+                        f"({unparsed} could not be parsed)")
+
+    @contextmanager
+    def get_connection(self):
+        """
+        Context manager for news database connections.
+
+        Yields:
+            sqlite3.Connection: Database connection
+        """
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            yield conn
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.error(f"News database error: {str(e)}")
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+    # -----------------------------------------------------------------
+    # Loading
+    # -----------------------------------------------------------------
+
+    @staticmethod
+    def _parse_tickers(value: Any) -> List[str]:
+        if not value:
+            return []
+        if isinstance(value, str):
+            for separator in _TICKER_SEPARATORS:
+                if separator in value:
+                    value = value.split(separator)
+                    break
+            else:
+                value = [value]
+        return sorted({str(ticker).strip().upper() for ticker in value if str(ticker).strip()})
+
+    @staticmethod
+    def _parse_published_at(value: Any) -> Optional[str]:
+        """
+        Convert a publication time to PUBLISHED_AT_FORMAT in UTC.
+
+        Accepts ISO 8601 (with or without an offset), epoch seconds or
+        milliseconds, RFC 2822 and the dates in _PUBLISHED_AT_FORMATS. Times
+        without an offset are taken as UTC. Returns None if nothing matches.
+        """
+        if value is None or isinstance(value, bool):
+            return None
+        text = str(value).strip()
+        if not text:
+            return None
+
+        moment = None
+        try:
+            epoch = float(text)
+        except ValueError:
+            epoch = None
+        if epoch is not None:
+            try:
+                # Anything past the year 5000 in seconds is milliseconds
+                moment = datetime.fromtimestamp(epoch / 1000 if abs(epoch) >= 1e11 else epoch, timezone.utc)
+            except (OverflowError, OSError, ValueError):
+                return None
+        else:
+            try:
+                moment = datetime.fromisoformat(text)
+            except ValueError:
+                try:
+                    moment = parsedate_to_datetime(text)
+                except (TypeError, ValueError):
+                    for date_format in _PUBLISHED_AT_FORMATS:
+                        try:
+                            moment = datetime.strptime(text, date_format)
+                            break
+                        except ValueError:
+                            continue
+        if moment is None or moment.year < 1000:
+            return None
+
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.astimezone(timezone.utc).strftime(PUBLISHED_AT_FORMAT)
+
+    @classmethod
+    def _normalize(cls, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Normalize a raw article record; returns None for unusable records
+        (no title, or a publication time that cannot be parsed).
+        """
+        title = (record.get('title') or record.get('headline') or '').strip()
+        raw_published_at = record.get('published_at') or record.get('date')
+        published_at = cls._parse_published_at(raw_published_at)
+        if not title or published_at is None:
+            return None
+
+        url = record.get('url') or None
+        external_id = record.get('id') or record.get('external_id')
+        if not external_id:
+            # Keyed on the value as given, like articles loaded before dates were normalized
+            key = url or f"{str(raw_published_at).strip()}|{title}"
+            external_id = hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+        return {
+            'external_id': str(external_id),
+            'published_at': published_at,
+            'title': title,
+            'summary': record.get('summary') or record.get('excerpt') or record.get('description') or None,
+            'source': record.get('source') or None,
+            'url': url,
+            'tickers': cls._parse_tickers(record.get('tickers') or record.get('ticker')),
+        }
+
+    @staticmethod
+    def iter_file_records(path: str) -> Iterator[Dict[str, Any]]:
+        """
+        Read raw article records from a dump file.
+
+        Supports .json (a list of objects or {"articles": [...]}),
+        .jsonl/.ndjson (one object per line) and .csv (header row with
+        title, published_at, summary, source, url, tickers, id columns).
+        """
+        extension = os.path.splitext(path)[1].lower()
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            if extension == '.csv':
+                yield from csv.DictReader(file)
+            elif extension in ('.jsonl', '.ndjson'):
+                for line in file:
+                    if line.strip():
+                        yield json.loads(line)
+            elif extension == '.json':
+                data = json.load(file)
+                if isinstance(data, dict):
+                    data = data.get('articles', [])
+                yield from data
+            else:
+                raise ValueError(f"Unsupported news dump format: {path}")
+
+    def load_records(self, records: Iterable[Dict[str, Any]], batch_size: int = 10000) -> int:
+        """
+        Bulk-load article records in one transaction.
+
+        Articles already present (same id, or same url/title when there is no
+        id) are skipped. Records without a title or a parseable publication
+        time are skipped and counted in skipped_records.
+
+        Args:
+            records (Iterable[Dict]): Raw article records
+            batch_size (int): Articles inserted per executemany batch
+
+        Returns:
+            int: Number of new articles loaded
+        """
+        loaded = 0
+        skipped = 0
+        with self.get_connection() as conn:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            batch = []
+            for record in records:
+                article = self._normalize(record)
+                if article is None:
+                    skipped += 1
+                    continue
+                batch.append(article)
+                if len(batch) >= batch_size:
+                    loaded += self._insert_batch(conn, batch)
+                    batch = []
+            if batch:
+                loaded += self._insert_batch(conn, batch)
+            conn.commit()
+
+        self.skipped_records += skipped
+        if skipped:
+            logger.warning(f"Skipped {skipped} news records without a title or a parseable published_at")
+        logger.info(f"Loaded {loaded} news articles")
+        return loaded
+
+    def load_files(self, paths: Iterable[str], batch_size: int = 10000) -> int:
+        """
+        Bulk-load articles from dump files.
+
+        Args:
+            paths (Iterable[str]): JSON, NDJSON or CSV dump files
+            batch_size (int): Articles inserted per executemany batch
+
+        Returns:
+            int: Number of new articles loaded
+        """
+        total = 0
+        for path in paths:
+            logger.info(f"Loading news dump {path}")
+            total += self.load_records(self.iter_file_records(path), batch_size)
+        return total
+
+    @staticmethod
+    def _insert_batch(conn: sqlite3.Connection, batch: List[Dict[str, Any]]) -> int:
+        first_new_id = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM articles").fetchone()[0]) + 1
+
+        conn.executemany(
+            """INSERT OR IGNORE INTO articles
+               (external_id, published_at, title, summary, source, url)
+               VALUES (:external_id, :published_at, :title, :summary, :source, :url)""",
+            batch
+        )
+
+        new_rows = conn.execute(
+            "SELECT id, external_id, published_at FROM articles WHERE id >= ?",
+            (first_new_id,)
+        ).fetchall()
+        if not new_rows:
+            return 0
+
+        conn.execute(
+            """INSERT INTO articles_fts (rowid, title, summary)
+               SELECT id, title, summary FROM articles WHERE id >= ?""",
+            (first_new_id,)
+        )
+
+        tickers_by_id = {article['external_id']: article['tickers'] for article in batch}
+        conn.executemany(
+            "INSERT OR IGNORE INTO article_tickers (ticker, published_at, article_id) VALUES (?, ?, ?)",
+            (
+                (ticker, row['published_at'], row['id'])
+                for row in new_rows
+                for ticker in tickers_by_id.get(row['external_id'], ())
+            )
+        )
+        return len(new_rows)
+
+    # -----------------------------------------------------------------
+    # Queries
+    # -----------------------------------------------------------------
+
+    def search(self, tickers: List[str], query: Optional[str] = None, limit: int = 20,
+               days: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Get the most recent / relevant articles mentioning any of the tickers.
+
+        Without a text query, articles are ordered by recency, then by how
+        many of the tickers they mention. With a query, FTS5 bm25 relevance
+        ranks first. Either way this is a single SQL statement.
+
+        Args:
+            tickers (List[str]): Tickers to match
+            query (str): Optional FTS5 full-text query
+            limit (int): Maximum number of articles
+            days (int): Only articles published in the last N days
+
+        Returns:
+            List[Dict]: Articles with the matched tickers
+
+        Raises:
+            NewsQueryError: If the full-text query is malformed
+        """
+        tickers = sorted({ticker.upper() for ticker in tickers})
+        if not tickers:
+            return []
+
+        since = ''
+        if days:
+            since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime(PUBLISHED_AT_FORMAT)
+        wanted = ','.join('(?)' for _ in tickers)
+
+        if query:
+            # Let FTS5 find the matching articles first, then keep those
+            # tagged with a portfolio ticker; CROSS JOIN pins that order, as
+            # matching per ticker row re-runs the full-text query every time
+            sql = f"""
+                WITH wanted(ticker) AS (VALUES {wanted}),
+                hits AS MATERIALIZED (
+                    SELECT rowid AS article_id, rank FROM articles_fts
+                    WHERE articles_fts MATCH ?
+                )
+                SELECT a.id, a.published_at, a.title, a.summary, a.source, a.url,
+                       group_concat(t.ticker) AS tickers, COUNT(*) AS matched_tickers,
+                       MIN(h.rank) AS relevance
+                FROM hits h
+                CROSS JOIN article_tickers t ON t.article_id = h.article_id
+                JOIN articles a ON a.id = h.article_id
+                WHERE t.ticker IN wanted AND t.published_at >= ?
+                GROUP BY a.id
+                ORDER BY relevance, a.published_at DESC, a.id DESC
+                LIMIT ?"""
+            params = tickers + [query, since, limit]
+        else:
+            # The newest `limit` articles overall are among the newest `limit`
+            # of each ticker, so each ticker only scans its index range from
+            # its own cutoff date instead of its whole history. The cutoffs
+            # only pick candidates (those up to the `limit`-th newest date,
+            # ties included): their tickers and counts come from a second
+            # join without cutoffs, which could drop an article's other tickers
+            sql = f"""
+                WITH wanted(ticker) AS (VALUES {wanted}),
+                candidates AS MATERIALIZED (
+                    SELECT DISTINCT t.article_id, t.published_at
+                    FROM wanted w
+                    JOIN article_tickers t ON t.ticker = w.ticker
+                    WHERE t.published_at >= MAX(?, COALESCE(
+                        (SELECT c.published_at FROM article_tickers c
+                         WHERE c.ticker = w.ticker
+                         ORDER BY c.published_at DESC
+                         LIMIT 1 OFFSET ?), ''))
+                ),
+                picked AS (
+                    SELECT article_id FROM candidates
+                    WHERE published_at >= COALESCE(
+                        (SELECT published_at FROM candidates
+                         ORDER BY published_at DESC
+                         LIMIT 1 OFFSET ?), '')
+                )
+                SELECT a.id, a.published_at, a.title, a.summary, a.source, a.url,
+                       group_concat(t.ticker) AS tickers, COUNT(*) AS matched_tickers
+                FROM picked p
+                JOIN articles a ON a.id = p.article_id
+                JOIN article_tickers t ON t.article_id = p.article_id
+                WHERE t.ticker IN wanted
+                GROUP BY a.id
+                ORDER BY a.published_at DESC, matched_tickers DESC, a.id DESC
+                LIMIT ?"""
+            params = tickers + [since, limit - 1, limit - 1, limit]
+
+        with self.get_connection() as conn:
+            if query:
+                try:
+                    conn.execute(
+                        "SELECT rowid FROM articles_fts WHERE articles_fts MATCH ? LIMIT 1", (query,)
+                    ).fetchall()
+                except sqlite3.OperationalError as e:
+                    raise NewsQueryError(f"Invalid search query: {str(e)}") from e
+            rows = conn.execute(sql, params).fetchall()
+
+        articles = []
+        for row in rows:
+            article = dict(row)
+            article['tickers'] = sorted(set(article['tickers'].split(',')))
+            articles.append(article)
+        return articles
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get news store statistics.
+
+        Returns:
+            Dict: Article and ticker counts
+        """
+        with self.get_connection() as conn:
+            articles = conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+            links = conn.execute("SELECT COUNT(*) FROM article_tickers").fetchone()[0]
+        return {'articles': articles, 'ticker_links': links, 'database_path': self.db_path}
+
+
+def init_news_store(app) -> NewsStore:
+    """
+    Create the news store for a Flask app from its config.
+
+    Args:
+        app (Flask): Application to attach the store to
+
+    Returns:
+        NewsStore: The created store
+    """
+    store = NewsStore(app.config['NEWS_DB_PATH'])
+    app.extensions['news_store'] = store
+    return store
+
+
+def get_news_store() -> NewsStore:
+    """Get the news store of the current Flask app."""
+    return current_app.extensions['news_store']
@@ -0,0 +1,275 @@
+"""
+Opt-in request profiling with cProfile.
+A request is profiled when it carries PROFILE_TOKEN in the X-Captura-Profile
+header, or when it is picked at PROFILE_SAMPLE_RATE. Database calls it makes
+through the executor are profiled on their worker threads too and merged
+into its stats. Profiles are kept in a bounded ring buffer keyed by request
+id and served by /api/debug/profiles. With neither a token nor a sample
+rate configured no hook is installed and requests run as before.
+"""
+
+import cProfile
+import hmac
+import io
+import logging
+import marshal
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from flask import current_app, g, has_request_context, request
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Captura-Profile'
+REQUEST_ID_HEADER = 'X-Request-ID'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+# Orders accepted when rendering a profile as text
+SORT_KEYS = ('cumulative', 'tottime', 'calls', 'ncalls')
+
+# Client supplied request ids are used as is only when they look like ids
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Set by init_profiler; profiled() returns functions unchanged while False
+_enabled = False
+
+
+class RequestProfile:
+    """
+    cProfile data of one request, including its executor calls.
+    """
+
+    def __init__(self, request_id: str, reason: str):
+        self.request_id = request_id
+        self.reason = reason
+        self.profiler = cProfile.Profile()
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self._workers: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Call fn on the current (worker) thread under its own profiler.
+        """
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active on this thread (or interpreter)
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with self._lock:
+                self._workers.append(profiler)
+
+    def stats(self) -> pstats.Stats:
+        """
+        Merge the request thread and worker thread profiles.
+        """
+        stats = pstats.Stats(self.profiler)
+        with self._lock:
+            for profiler in self._workers:
+                stats.add(profiler)
+        return stats
+
+
+def profiled(fn: Callable) -> Callable:
+    """
+    Wrap fn so a profiled request also profiles it on an executor thread.
+
+    Returns fn itself when profiling is off or the current request is not
+    being profiled.
+    """
+    if not _enabled or not has_request_context():
+        return fn
+    profile = g.get('_request_profile')
+    if profile is None:
+        return fn
+    return lambda *args, **kwargs: profile.run(fn, *args, **kwargs)
+
+
+class RequestProfiler:
+    """
+    Decides which requests to profile and keeps the latest profiles.
+    """
+
+    def __init__(self, token: Optional[str] = None, sample_rate: float = 0.0, capacity: int = 50):
+        """
+        Initialize the profiler.
+
+        Args:
+            token (str): Value of the X-Captura-Profile header that requests
+                profiling and grants access to the stored profiles
+            sample_rate (float): Fraction of all requests profiled at random
+            capacity (int): Profiles kept; the oldest are dropped first
+        """
+        self.token = token or None
+        self.sample_rate = sample_rate
+        self.capacity = capacity
+        self._profiles: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._profiled = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.token is not None or self.sample_rate > 0
+
+    def authorized(self) -> bool:
+        """Check whether the current request carries the profiling token."""
+        supplied = request.headers.get(PROFILE_HEADER, '')
+        return self.token is not None and hmac.compare_digest(supplied.encode(), self.token.encode())
+
+    def _reason(self) -> Optional[str]:
+        if request.path.startswith('/api/debug/'):
+            return None
+        if self.token is not None and PROFILE_HEADER in request.headers and self.authorized():
+            return 'header'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def before_request(self):
+        reason = self._reason()
+        if reason is None:
+            return
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        if not _REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        profile = RequestProfile(request_id, reason)
+        try:
+            profile.profiler.enable()
+        except ValueError:
+            logger.warning(f"Not profiling request {request_id}: another profiler is active")
+            return
+        g._request_profile = profile
+
+    def after_request(self, response):
+        profile = g.pop('_request_profile', None)
+        if profile is None:
+            return response
+        profile.profiler.disable()
+        duration_ms = (time.perf_counter() - profile.started) * 1000
+        stats = profile.stats()
+        entry = {
+            'request_id': profile.request_id,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'reason': profile.reason,
+            'started_at': profile.started_at.isoformat(timespec='milliseconds'),
+            'duration_ms': round(duration_ms, 3),
+            'function_calls': stats.total_calls,
+            'stats': stats,
+        }
+        with self._lock:
+            self._profiles[profile.request_id] = entry
+            self._profiles.move_to_end(profile.request_id)
+            while len(self._profiles) > self.capacity:
+                self._profiles.popitem(last=False)
+            self._profiled += 1
+        response.headers[PROFILE_ID_HEADER] = profile.request_id
+        logger.info(f"Profiled {request.method} {request.path} as {profile.request_id} ({duration_ms:.1f} ms)")
+        return response
+
+    def teardown_request(self, exc):
+        # A request that failed before after_request still stops profiling
+        profile = g.pop('_request_profile', None)
+        if profile is not None:
+            profile.profiler.disable()
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """
+        Get the stored profiles without their stats, newest first.
+        """
+        with self._lock:
+            entries = list(self._profiles.values())
+        return [{key: value for key, value in entry.items() if key != 'stats'}
+                for entry in reversed(entries)]
+
+    def get_profile(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """Get a stored profile entry by request id."""
+        with self._lock:
+            return self._profiles.get(request_id)
+
+    def dump(self, entry: Dict[str, Any]) -> bytes:
+        """
+        Serialize a profile in the pstats file format (as cProfile -o writes).
+        """
+        with self._lock:
+            return marshal.dumps(entry['stats'].stats)
+
+    def render(self, entry: Dict[str, Any], sort: str = 'cumulative', limit: int = 30) -> str:
+        """
+        Render a profile as pstats text, sorted by sort and cut at limit rows.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of: {', '.join(SORT_KEYS)}")
+        stream = io.StringIO()
+        with self._lock:
+            stats = entry['stats']
+            stats.stream = stream
+            stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get profiler settings and counters.
+
+        Returns:
+            Dict: Profiler statistics
+        """
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'sample_rate': self.sample_rate,
+                'stored': len(self._profiles),
+                'capacity': self.capacity,
+                'profiled': self._profiled,
+            }
+
+
+def init_profiler(app) -> RequestProfiler:
+    """
+    Create the request profiler for a Flask app from its config.
+
+    Request hooks are only registered when a token or a sample rate is
+    configured. Call this before other after_request hooks are registered
+    so their work is part of the profile.
+
+    Args:
+        app (Flask): Application to attach the profiler to
+
+    Returns:
+        RequestProfiler: The created profiler
+    """
+    global _enabled
+
+    profiler = RequestProfiler(token=app.config['PROFILE_TOKEN'],
+                               sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+                               capacity=app.config['PROFILE_BUFFER_SIZE'])
+    app.extensions['request_profiler'] = profiler
+    if profiler.enabled:
+        app.before_request(profiler.before_request)
+        app.after_request(profiler.after_request)
+        app.teardown_request(profiler.teardown_request)
+        _enabled = True
+        logger.info(f"Request profiling enabled (sample rate {profiler.sample_rate:g}, "
+                    f"token {'set' if profiler.token else 'not set'})")
+    return profiler
+
+
+def get_profiler() -> RequestProfiler:
+    """Get the request profiler of the current Flask app."""
+    return current_app.extensions['request_profiler']
@@ -0,0 +1,167 @@
+"""
+Scheduled refresh of the read-only database replica.
+DatabaseManager.refresh_replica copies every shard with the SQLite online
+backup API; this module runs it on a background thread every
+DB_REPLICA_INTERVAL seconds so expensive reads routed to the replica
+(DB_REPLICA_READS) see data at most one interval old.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List
+from flask import current_app
+from utils.database import db_manager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ReplicaRefresher:
+    """
+    Refreshes a DatabaseManager's replica on a background thread, on a
+    schedule and on request.
+    """
+
+    def __init__(self, manager, interval: float = 300, pages: int = 1024, pause: float = 0.005):
+        """
+        Initialize the refresher.
+
+        Args:
+            manager (DatabaseManager): Database whose replica is refreshed
+            interval (float): Seconds between refreshes (0 disables the schedule)
+            pages (int): Pages copied per backup step
+            pause (float): Seconds slept between backup steps
+        """
+        self.manager = manager
+        self.interval = interval
+        self.pages = pages
+        self.pause = pause
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._refreshing = False
+        self._refreshes = 0
+        self._last_seconds = None
+        self._last_error = None
+
+    @property
+    def configured(self) -> bool:
+        return self.manager.replica_paths is not None
+
+    def refresh(self) -> List[Dict[str, Any]]:
+        """
+        Refresh the replica of every shard now.
+
+        Returns:
+            List[Dict]: backup() results per shard
+        """
+        started = time.perf_counter()
+        try:
+            results = self.manager.refresh_replica(self.pages, self.pause)
+        except Exception as e:
+            with self._lock:
+                self._last_error = str(e)
+            raise
+        with self._lock:
+            self._refreshes += 1
+            self._last_seconds = round(time.perf_counter() - started, 3)
+            self._last_error = None
+        return results
+
+    def _run(self):
+        # Scheduled refreshes start right away when a shard has no replica yet
+        if self.interval > 0 and any(not status['exists'] for status in self.manager.get_replica_status()):
+            self._wake.set()
+        while True:
+            self._wake.wait(self.interval if self.interval > 0 else None)
+            if self._stop.is_set():
+                return
+            self._wake.clear()
+            with self._lock:
+                self._refreshing = True
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Replica refresh failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-replica', daemon=True)
+                self._thread.start()
+
+    def start(self):
+        """Start scheduled refreshes when a replica path and an interval are set."""
+        if self.configured and self.interval > 0:
+            self._ensure_thread()
+
+    def request_refresh(self) -> bool:
+        """
+        Ask the background thread to refresh the replica.
+
+        Requests made while one is already waiting are merged into it.
+
+        Returns:
+            bool: False if a requested refresh was already waiting
+        """
+        self._ensure_thread()
+        queued = not self._wake.is_set()
+        self._wake.set()
+        return queued
+
+    def stop(self):
+        """Stop the background thread."""
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the replica files and refresh counters.
+
+        Returns:
+            Dict: Replica statistics
+        """
+        with self._lock:
+            return {
+                'configured': self.configured,
+                'interval_seconds': self.interval,
+                'refreshing': self._refreshing,
+                'refreshes': self._refreshes,
+                'last_refresh_seconds': self._last_seconds,
+                'last_error': self._last_error,
+                'shards': self.manager.get_replica_status(),
+            }
+
+
+def init_replica(app) -> ReplicaRefresher:
+    """
+    Create the replica refresher for a Flask app from its config and start
+    its schedule.
+
+    Args:
+        app (Flask): Application to attach the refresher to
+
+    Returns:
+        ReplicaRefresher: The created refresher
+    """
+    refresher = ReplicaRefresher(db_manager,
+                                 interval=app.config['DB_REPLICA_INTERVAL'],
+                                 pages=app.config['DB_BACKUP_PAGES'],
+                                 pause=app.config['DB_BACKUP_PAUSE'])
+    app.extensions['db_replica'] = refresher
+    refresher.start()
+    if app.config['DB_REPLICA_READS'] and not refresher.configured:
+        logger.warning("DB_REPLICA_READS is set but CAPTURA_DB_REPLICA_PATH is not; reading from the primary")
+    return refresher
+
+
+def get_replica() -> ReplicaRefresher:
+    """Get the replica refresher of the current Flask app."""
+    return current_app.extensions['db_replica']
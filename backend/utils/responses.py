@@ -0,0 +1,161 @@
+"""
+Response layer for the API.
+Serializes JSON with orjson when it is installed (falling back to the
+standard library encoder) and compresses responses with gzip or deflate
+when the client accepts it and the body is large enough to benefit.
+"""
+
+import gzip
+import json
+import logging
+import zlib
+from typing import Any, List, Optional, Sequence
+
+from flask import Response, current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency, the stdlib encoder is used instead
+    orjson = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Supported content codings, preferred first when the client rates them equally
+ENCODINGS = ('gzip', 'deflate')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider encoding with orjson when available.
+
+    Responses are equivalent JSON to the default provider's, not
+    byte-identical. Both use compact separators, sorted keys, and dates in
+    HTTP date format (they are passed to DefaultJSONProvider.default). With
+    orjson:
+
+    - floats use the shortest exponent form (2e-7, 1e16 rather than
+      2e-07, 1e+16)
+    - non-ASCII text is written as raw UTF-8 even though ensure_ascii is
+      set, which is valid in the UTF-8 response body
+    - NaN and infinity become null instead of the non-standard NaN and
+      Infinity tokens
+
+    dumps(), the text API used outside responses, keeps the stdlib encoder
+    while ensure_ascii is set so its output stays ASCII.
+    """
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        """
+        Serialize obj to compact UTF-8 JSON.
+
+        Args:
+            obj (Any): Value to serialize (tuples are written as arrays)
+
+        Returns:
+            bytes: JSON document
+        """
+        if orjson is not None:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(obj, default=self.default, option=option)
+        return json.dumps(obj, default=self.default, ensure_ascii=self.ensure_ascii,
+                          sort_keys=self.sort_keys, separators=(',', ':')).encode('utf-8')
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is None or kwargs or self.ensure_ascii:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)  # indented output for debugging
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def columnar(columns: Sequence[str], rows: List[tuple]) -> dict:
+    """
+    Build the columnar layout of a row set: {"columns": [...], "rows": [[...], ...]}.
+
+    The rows are serialized as they come from the cursor, so no dictionary
+    is built (or sent) per row.
+
+    Args:
+        columns (Sequence[str]): Column names
+        rows (List[tuple]): Row tuples in column order
+
+    Returns:
+        dict: Columnar payload
+    """
+    return {'columns': list(columns), 'rows': rows}
+
+
+def negotiate_encoding() -> Optional[str]:
+    """
+    Pick the content coding for the current request from Accept-Encoding.
+
+    Returns:
+        Optional[str]: 'gzip', 'deflate' or None for an uncompressed response
+    """
+    accept = request.accept_encodings
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accept.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress_response(response: Response) -> Response:
+    """
+    Compress a response body for clients that accept gzip or deflate.
+
+    Streamed responses (exports compress themselves), bodies below
+    COMPRESS_MIN_SIZE and types outside COMPRESS_MIMETYPES are left as is.
+
+    Args:
+        response (Response): Response about to be sent
+
+    Returns:
+        Response: The same response, possibly compressed
+    """
+    config = current_app.config
+    if (response.direct_passthrough or response.is_streamed
+            or not 200 <= response.status_code < 300 or response.status_code == 204
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in config['COMPRESS_MIMETYPES']):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    level = config['COMPRESS_LEVEL']
+    if encoding == 'gzip':
+        body = gzip.compress(data, compresslevel=level, mtime=0)
+    else:
+        body = zlib.compress(data, level)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_response_layer(app):
+    """
+    Install the fast JSON provider and response compression on a Flask app.
+
+    Args:
+        app (Flask): Application to configure
+    """
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
+    logger.info(f"JSON encoder: {'orjson' if orjson is not None else 'stdlib json'}")
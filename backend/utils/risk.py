@@ -0,0 +1,501 @@
+"""
+Risk analytics for portfolios.
+Computes returns, volatility, beta, max drawdown and correlations from a
+local daily price history with NumPy. Per-ticker return series and the
+covariance matrix are cached and shared across portfolios.
+"""
+
+import csv
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from flask import current_app
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS_PER_YEAR = 252
+
+# Symbols that may name a price file; anything else (e.g. path separators)
+# never reaches the filesystem
+TICKER_PATTERN = re.compile(r'^[A-Z0-9.^-]{1,10}$')
+
+
+class PriceHistoryError(Exception):
+    """Raised when the price history needed for a calculation is missing."""
+
+
+class InvalidTickerError(ValueError):
+    """Raised for a ticker symbol that cannot name a price file."""
+
+
+def validate_ticker(ticker: str) -> str:
+    """
+    Check a ticker symbol against TICKER_PATTERN.
+
+    Returns:
+        str: The upper-cased symbol
+
+    Raises:
+        InvalidTickerError: If the symbol does not match
+    """
+    symbol = ticker.upper()
+    if not TICKER_PATTERN.match(symbol):
+        raise InvalidTickerError(f"Invalid ticker symbol '{ticker}'")
+    return symbol
+
+
+class PriceHistoryStore:
+    """
+    Daily closing prices stored as one CSV file per ticker.
+
+    Each file is <data_dir>/<TICKER>.csv with a header row and `date,close`
+    columns (YYYY-MM-DD dates, any order). Parsed series are cached until
+    the file's modification time changes.
+    """
+
+    def __init__(self, data_dir: str):
+        """
+        Initialize the store.
+
+        Args:
+            data_dir (str): Directory holding the per-ticker CSV files
+        """
+        self.data_dir = data_dir
+        self._cache: Dict[str, Tuple[float, np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, ticker: str) -> str:
+        return os.path.join(self.data_dir, f"{validate_ticker(ticker)}.csv")
+
+    def version(self, ticker: str) -> Optional[float]:
+        """
+        Get the modification time of a ticker's price file.
+
+        Returns:
+            Optional[float]: mtime, or None if there is no history for the
+            ticker (including symbols that are not valid tickers)
+        """
+        try:
+            return os.path.getmtime(self._path(ticker))
+        except (OSError, InvalidTickerError):
+            return None
+
+    def load(self, ticker: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Load a ticker's daily closes sorted by date.
+
+        Args:
+            ticker (str): Stock symbol
+
+        Returns:
+            Optional[Tuple[np.ndarray, np.ndarray]]: (datetime64[D] dates, float closes)
+            or None if there is no history for the ticker
+        """
+        version = self.version(ticker)
+        if version is None:
+            return None
+
+        with self._lock:
+            cached = self._cache.get(ticker)
+            if cached and cached[0] == version:
+                return cached[1], cached[2]
+
+        dates = []
+        closes = []
+        with open(self._path(ticker), 'r', newline='', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            next(reader, None)  # Skip header
+            for row in reader:
+                if len(row) < 2 or not row[0].strip() or not row[1].strip():
+                    continue
+                dates.append(row[0].strip())
+                closes.append(float(row[1]))
+
+        date_array = np.array(dates, dtype='datetime64[D]')
+        close_array = np.array(closes, dtype=np.float64)
+        order = np.argsort(date_array, kind='stable')
+        date_array, close_array = date_array[order], close_array[order]
+
+        with self._lock:
+            self._cache[ticker] = (version, date_array, close_array)
+        return date_array, close_array
+
+    def latest_close(self, ticker: str) -> Optional[Tuple[str, float]]:
+        """
+        Get a ticker's most recent close.
+
+        Returns:
+            Optional[Tuple[str, float]]: (ISO date, close) or None if there is no history
+        """
+        history = self.load(ticker)
+        if history is None or len(history[1]) == 0:
+            return None
+        return str(history[0][-1]), float(history[1][-1])
+
+    def close_on(self, ticker: str, day: str) -> Optional[float]:
+        """
+        Get a ticker's close on a date, or the last close before it.
+
+        Args:
+            ticker (str): Stock symbol
+            day (str): ISO date
+
+        Returns:
+            Optional[float]: Close, or None if there is no history up to that date
+        """
+        history = self.load(ticker)
+        if history is None:
+            return None
+        position = int(np.searchsorted(history[0], np.datetime64(day, 'D'), side='right')) - 1
+        return float(history[1][position]) if position >= 0 else None
+
+
+class _CovarianceBlock:
+    """
+    Cached return columns and covariance for one calendar (benchmark + window).
+
+    Tickers are appended as portfolios request them; only the rows and
+    columns for new tickers are computed, and the rest is reused.
+    """
+
+    def __init__(self, dates: np.ndarray, benchmark_returns: np.ndarray):
+        self.dates = dates
+        self.benchmark_returns = benchmark_returns
+        self.benchmark_centered = benchmark_returns - benchmark_returns.mean()
+        self.reset()
+
+    def reset(self):
+        """
+        Drop all cached ticker columns.
+        """
+        periods = len(self.benchmark_returns)
+        self.index: Dict[str, int] = {}
+        self.versions: List[float] = []
+        self.last_prices = np.empty(0)
+        self.centered = np.empty((periods, 0))
+        self.returns = np.empty((periods, 0))
+        self.covariance = np.empty((0, 0))
+        self.benchmark_covariance = np.empty(0)
+
+    def add(self, tickers: List[str], returns: np.ndarray, last_prices: np.ndarray,
+            versions: List[float]):
+        """
+        Append return columns for new tickers and extend the covariance matrix.
+        """
+        periods = returns.shape[0]
+        denominator = max(periods - 1, 1)
+        centered = returns - returns.mean(axis=0)
+
+        cross = self.centered.T @ centered / denominator
+        own = centered.T @ centered / denominator
+        old_count = self.covariance.shape[0]
+        new_count = len(tickers)
+
+        covariance = np.empty((old_count + new_count, old_count + new_count))
+        covariance[:old_count, :old_count] = self.covariance
+        covariance[:old_count, old_count:] = cross
+        covariance[old_count:, :old_count] = cross.T
+        covariance[old_count:, old_count:] = own
+
+        self.covariance = covariance
+        self.benchmark_covariance = np.concatenate(
+            [self.benchmark_covariance, centered.T @ self.benchmark_centered / denominator]
+        )
+        self.centered = np.hstack([self.centered, centered])
+        self.returns = np.hstack([self.returns, returns])
+        self.last_prices = np.concatenate([self.last_prices, last_prices])
+        for offset, ticker in enumerate(tickers):
+            self.index[ticker] = old_count + offset
+        self.versions.extend(versions)
+
+
+class RiskEngine:
+    """
+    Computes portfolio risk metrics with cached returns and covariance.
+
+    Blocks are kept for the max_blocks most recently used (benchmark, window)
+    calendars, and a block holding more than max_block_tickers tickers is
+    cleared before new ones are added. Price files are read outside the
+    engine's lock, which only guards the cached blocks.
+    """
+
+    def __init__(self, prices: PriceHistoryStore, default_benchmark: str = 'SPY',
+                 default_window: int = TRADING_DAYS_PER_YEAR, max_blocks: int = 2,
+                 max_block_tickers: int = 2000):
+        """
+        Initialize the engine.
+
+        Args:
+            prices (PriceHistoryStore): Source of daily closes
+            default_benchmark (str): Benchmark ticker when none is given
+            default_window (int): Number of daily returns used when none is given
+            max_blocks (int): Covariance blocks (benchmark + window) kept
+            max_block_tickers (int): Tickers cached per block
+        """
+        self.prices = prices
+        self.default_benchmark = default_benchmark
+        self.default_window = default_window
+        self.max_blocks = max(max_blocks, 1)
+        self.max_block_tickers = max_block_tickers
+        self._blocks: 'OrderedDict[Tuple[str, int], Tuple[float, _CovarianceBlock]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached_block(self, key: Tuple[str, int], version: float) -> Optional[_CovarianceBlock]:
+        # Caller holds self._lock
+        cached = self._blocks.get(key)
+        if cached and cached[0] == version:
+            self._blocks.move_to_end(key)
+            return cached[1]
+        return None
+
+    def _get_block(self, benchmark: str, window: int) -> _CovarianceBlock:
+        benchmark_version = self.prices.version(benchmark)
+        if benchmark_version is None:
+            raise PriceHistoryError(f"No price history for benchmark {benchmark}")
+
+        key = (benchmark, window)
+        with self._lock:
+            block = self._cached_block(key, benchmark_version)
+        if block is not None:
+            return block
+
+        history = self.prices.load(benchmark)
+        if history is None or len(history[1]) < 3:
+            raise PriceHistoryError(f"Not enough price history for benchmark {benchmark}")
+
+        dates = history[0][-(window + 1):]
+        closes = history[1][-(window + 1):]
+        block = _CovarianceBlock(dates, closes[1:] / closes[:-1] - 1.0)
+
+        with self._lock:
+            # Another request may have built the same block meanwhile
+            cached = self._cached_block(key, benchmark_version)
+            if cached is not None:
+                return cached
+            self._blocks[key] = (benchmark_version, block)
+            while len(self._blocks) > self.max_blocks:
+                evicted, _ = self._blocks.popitem(last=False)
+                logger.info(f"Evicted risk calendar for {evicted[0]} ({evicted[1]} days)")
+        logger.info(f"Built risk calendar for {benchmark} with {len(dates) - 1} daily returns")
+        return block
+
+    @staticmethod
+    def _aligned_returns(calendar: np.ndarray, dates: np.ndarray,
+                         closes: np.ndarray) -> Tuple[np.ndarray, float]:
+        """
+        Align a ticker's closes to the calendar and compute daily returns.
+
+        Prices are forward-filled onto calendar days; days before the ticker's
+        first close count as a zero return.
+        """
+        positions = np.searchsorted(dates, calendar, side='right') - 1
+        aligned = np.where(positions >= 0, closes[np.clip(positions, 0, None)], np.nan)
+
+        returns = aligned[1:] / aligned[:-1] - 1.0
+        returns[~np.isfinite(returns)] = 0.0
+
+        last_price = aligned[-1] if np.isfinite(aligned[-1]) else np.nan
+        return returns, last_price
+
+    def _load_column(self, block: _CovarianceBlock,
+                     ticker: str) -> Optional[Tuple[np.ndarray, float]]:
+        """
+        Read a ticker's closes and align them to the block's calendar.
+
+        Returns:
+            Optional[Tuple[np.ndarray, float]]: (returns, last price), or None
+            if the ticker has no usable price history
+        """
+        history = self.prices.load(ticker)
+        if history is None or len(history[1]) == 0:
+            return None
+        return self._aligned_returns(block.dates, *history)
+
+    def _ensure_tickers(self, block: _CovarianceBlock, versions: Dict[str, Optional[float]],
+                        columns: Dict[str, Optional[Tuple[np.ndarray, float]]]) -> List[str]:
+        """
+        Add the loaded columns the block is missing. Caller holds self._lock.
+
+        Args:
+            block (_CovarianceBlock): Block to extend
+            versions (Dict): Price file version per requested ticker
+            columns (Dict): _load_column() results loaded so far
+
+        Returns:
+            List[str]: Tickers that must be loaded before the block can be
+            extended (nothing is added then)
+        """
+        # Drop the block's cache if any known ticker's file changed
+        stale = [t for t, version in versions.items()
+                 if t in block.index and block.versions[block.index[t]] != version]
+        if stale:
+            logger.info(f"Price history changed for {', '.join(stale)}; rebuilding covariance cache")
+            block.reset()
+
+        wanted = [t for t, version in versions.items() if version is not None and t not in block.index]
+        pending = [t for t in wanted if t not in columns]
+        if pending:
+            return pending
+
+        new_tickers = [t for t in wanted if columns[t] is not None]
+        if not new_tickers:
+            return []
+        if block.index and len(block.index) + len(new_tickers) > self.max_block_tickers:
+            logger.info(f"Covariance cache is full ({len(block.index)} tickers); clearing it")
+            block.reset()
+            return self._ensure_tickers(block, versions, columns)
+
+        block.add(new_tickers,
+                  np.column_stack([columns[t][0] for t in new_tickers]),
+                  np.array([columns[t][1] for t in new_tickers]),
+                  [versions[t] for t in new_tickers])
+        logger.info(f"Added {len(new_tickers)} tickers to covariance cache "
+                    f"({len(block.index)} cached)")
+        return []
+
+    def compute(self, holdings: List[Dict[str, Any]], benchmark: Optional[str] = None,
+                window: Optional[int] = None, include_correlation: bool = True) -> Dict[str, Any]:
+        """
+        Compute risk metrics for a set of holdings.
+
+        Positions are valued at the latest close in the window (purchase price
+        when a ticker has no history); tickers without history are reported
+        and left out of the return-based metrics.
+
+        Args:
+            holdings (List[Dict]): Holdings with ticker, shares and purchase_price
+            benchmark (str): Benchmark ticker for beta
+            window (int): Number of daily returns to use
+            include_correlation (bool): Include the ticker correlation matrix
+
+        Returns:
+            Dict[str, Any]: Risk metrics
+
+        Raises:
+            PriceHistoryError: If the benchmark has no usable history
+        """
+        benchmark = (benchmark or self.default_benchmark).upper()
+        window = window or self.default_window
+
+        # Aggregate shares and fallback prices per ticker
+        shares: Dict[str, float] = {}
+        fallback_prices: Dict[str, float] = {}
+        for holding in holdings:
+            ticker = holding['ticker']
+            shares[ticker] = shares.get(ticker, 0.0) + holding['shares']
+            fallback_prices.setdefault(ticker, holding['purchase_price'])
+        tickers = sorted(shares)
+
+        block = self._get_block(benchmark, window)
+        versions = {t: self.prices.version(t) for t in tickers}
+        loaded: Dict[str, Optional[Tuple[np.ndarray, float]]] = {}
+        while True:
+            with self._lock:
+                pending = self._ensure_tickers(block, versions, loaded)
+                if not pending:
+                    missing = {t for t in tickers if t not in block.index}
+                    priced = [t for t in tickers if t not in missing]
+                    columns = np.array([block.index[t] for t in priced], dtype=np.intp)
+                    covariance = block.covariance[np.ix_(columns, columns)]
+                    returns = block.returns[:, columns]
+                    benchmark_covariance = block.benchmark_covariance[columns]
+                    last_prices = block.last_prices[columns]
+                    benchmark_returns = block.benchmark_returns
+                    dates = block.dates
+                    break
+            # Read price files without holding the lock, then try again
+            for ticker in pending:
+                loaded[ticker] = self._load_column(block, ticker)
+
+        share_array = np.array([shares[t] for t in priced], dtype=np.float64)
+        last_prices = np.where(np.isfinite(last_prices), last_prices,
+                               np.array([fallback_prices[t] for t in priced], dtype=np.float64))
+        values = share_array * last_prices
+        total_value = float(values.sum()) + sum(shares[t] * fallback_prices[t] for t in missing)
+
+        periods = len(benchmark_returns)
+        benchmark_variance = float(benchmark_returns.var(ddof=1)) if periods > 1 else 0.0
+        result: Dict[str, Any] = {
+            'benchmark': benchmark,
+            'window_days': periods,
+            'start_date': str(dates[0]),
+            'end_date': str(dates[-1]),
+            'market_value': total_value,
+            'tickers_priced': len(priced),
+            'missing_tickers': sorted(missing),
+        }
+
+        if not priced or values.sum() <= 0:
+            result.update({'annualized_return': None, 'annualized_volatility': None,
+                           'beta': None, 'max_drawdown': None, 'positions': []})
+            return result
+
+        weights = values / values.sum()
+        portfolio_returns = returns @ weights
+        wealth = np.cumprod(1.0 + portfolio_returns)
+        drawdowns = wealth / np.maximum.accumulate(wealth) - 1.0
+
+        variances = np.clip(np.diag(covariance), 0.0, None)
+        volatilities = np.sqrt(variances * TRADING_DAYS_PER_YEAR)
+        portfolio_variance = max(float(weights @ covariance @ weights), 0.0)
+        betas = benchmark_covariance / benchmark_variance if benchmark_variance else np.full(len(priced), np.nan)
+
+        result.update({
+            'annualized_return': float(portfolio_returns.mean() * TRADING_DAYS_PER_YEAR),
+            'annualized_volatility': float(np.sqrt(portfolio_variance * TRADING_DAYS_PER_YEAR)),
+            'beta': float(weights @ betas) if benchmark_variance else None,
+            'max_drawdown': float(drawdowns.min()),
+            'positions': [
+                {
+                    'ticker': ticker,
+                    'weight': round(float(weights[i]), 6),
+                    'last_price': float(last_prices[i]),
+                    'annualized_volatility': round(float(volatilities[i]), 6),
+                    'beta': round(float(betas[i]), 6) if benchmark_variance else None,
+                }
+                for i, ticker in enumerate(priced)
+            ],
+        })
+
+        if include_correlation:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                deviations = np.sqrt(variances)
+                correlation = covariance / np.outer(deviations, deviations)
+            correlation = np.nan_to_num(np.round(correlation, 4))
+            np.fill_diagonal(correlation, 1.0)
+            result['correlation'] = {'tickers': priced, 'matrix': correlation.tolist()}
+
+        return result
+
+
+def init_risk_engine(app) -> RiskEngine:
+    """
+    Create the risk engine for a Flask app from its config.
+
+    Args:
+        app (Flask): Application to attach the engine to
+
+    Returns:
+        RiskEngine: The created engine
+    """
+    engine = RiskEngine(
+        PriceHistoryStore(app.config['PRICE_HISTORY_DIR']),
+        default_benchmark=app.config['RISK_BENCHMARK'],
+        default_window=app.config['RISK_WINDOW_DAYS'],
+        max_blocks=app.config['RISK_CACHE_BLOCKS'],
+        max_block_tickers=app.config['RISK_CACHE_TICKERS'],
+    )
+    app.extensions['risk_engine'] = engine
+    return engine
+
+
+def get_risk_engine() -> RiskEngine:
+    """Get the risk engine of the current Flask app."""
+    return current_app.extensions['risk_engine']
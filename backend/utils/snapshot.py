@@ -0,0 +1,475 @@
+"""
+Columnar analytics snapshots of all holdings.
+A snapshot job exports every holding into one NumPy array per column, with
+tickers, sectors and users stored as integer codes into small dictionary
+files. Snapshots are opened memory-mapped, so cross-user questions such as
+"total exposure to AAPL" are answered with vectorized group-bys over the
+arrays, without touching the live SQLite database.
+
+Layout of a snapshot root:
+
+    CURRENT                     name of the latest complete snapshot
+    20240115T093000123456Z/     one directory per snapshot
+        manifest.json           creation time, row count, columns
+        dictionaries.json       tickers, sectors and users by code
+        <column>.npy            one array per column
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from flask import current_app
+from utils.database import db_manager
+from utils.digest import UNCLASSIFIED_SECTOR
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Column arrays of a snapshot; user, ticker and sector are dictionary codes
+COLUMN_DTYPES = {
+    'portfolio_id': np.int64,
+    'user': np.int32,
+    'ticker': np.int32,
+    'sector': np.int32,  # -1 for holdings without a sector
+    'shares': np.float64,
+    'cost_basis': np.float64,
+    'upload_date': 'datetime64[s]',
+    'latest': np.bool_,
+}
+
+# Columns a query can group by
+GROUP_KEYS = ('ticker', 'sector', 'user', 'portfolio')
+
+POINTER_FILE = 'CURRENT'
+
+
+class SnapshotQueryError(ValueError):
+    """Raised for an invalid snapshot query."""
+
+
+def build_snapshot(manager, root: str, keep: int = 3, batch_size: int = 10000) -> Dict[str, Any]:
+    """
+    Export all holdings of a database into a new snapshot under root.
+
+    The snapshot is written to a temporary directory and published by
+    renaming it and then replacing the CURRENT pointer, so readers never
+    see a partial snapshot. Snapshots beyond the newest `keep` are removed.
+
+    Args:
+        manager (DatabaseManager): Database to export
+        root (str): Snapshot root directory
+        keep (int): Number of snapshots to keep
+        batch_size (int): Rows fetched per batch
+
+    Returns:
+        Dict: Manifest of the new snapshot
+    """
+    started = time.perf_counter()
+    created_at = datetime.now(timezone.utc)
+    name = created_at.strftime('%Y%m%dT%H%M%S%fZ')
+    os.makedirs(root, exist_ok=True)
+
+    codes = {'user': {}, 'ticker': {}, 'sector': {}}
+    chunks: Dict[str, List[np.ndarray]] = {column: [] for column in COLUMN_DTYPES}
+    rows = 0
+    for batch in manager.iter_snapshot_rows(batch_size):
+        portfolio_ids, users, uploaded, tickers, sectors, shares, prices, latest = zip(*batch)
+        shares = np.array(shares, dtype=np.float64)
+        chunks['portfolio_id'].append(np.array(portfolio_ids, dtype=np.int64))
+        chunks['user'].append(_encode(users, codes['user']))
+        chunks['ticker'].append(_encode(tickers, codes['ticker']))
+        chunks['sector'].append(_encode(sectors, codes['sector']))
+        chunks['shares'].append(shares)
+        chunks['cost_basis'].append(shares * np.array(prices, dtype=np.float64))
+        chunks['upload_date'].append(np.array(uploaded, dtype='datetime64[s]'))
+        chunks['latest'].append(np.array(latest, dtype=np.bool_))
+        rows += len(batch)
+
+    staging = os.path.join(root, f".{name}.tmp")
+    os.makedirs(staging)
+    try:
+        for column, dtype in COLUMN_DTYPES.items():
+            array = np.concatenate(chunks[column]) if chunks[column] else np.empty(0, dtype=dtype)
+            np.save(os.path.join(staging, f"{column}.npy"), array)
+        with open(os.path.join(staging, 'dictionaries.json'), 'w', encoding='utf-8') as handle:
+            json.dump({key: list(values) for key, values in codes.items()}, handle)
+        manifest = {
+            'id': name,
+            'created_at': created_at.isoformat(timespec='seconds'),
+            'holdings': rows,
+            'tickers': len(codes['ticker']),
+            'users': len(codes['user']),
+            'shards': manager.shard_count,
+            'columns': {column: np.dtype(dtype).str for column, dtype in COLUMN_DTYPES.items()},
+            'build_seconds': round(time.perf_counter() - started, 3),
+        }
+        with open(os.path.join(staging, 'manifest.json'), 'w', encoding='utf-8') as handle:
+            json.dump(manifest, handle, indent=2)
+        os.rename(staging, os.path.join(root, name))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(root, f".{POINTER_FILE}.tmp")
+    with open(pointer, 'w', encoding='utf-8') as handle:
+        handle.write(name)
+    os.replace(pointer, os.path.join(root, POINTER_FILE))
+
+    _prune(root, keep)
+    logger.info(f"Snapshot {name}: {rows} holdings in {manifest['build_seconds']}s")
+    return manifest
+
+
+def _encode(values: Sequence[Optional[str]], dictionary: Dict[str, int]) -> np.ndarray:
+    # None (no sector) is coded -1
+    return np.fromiter(
+        (-1 if value is None else dictionary.setdefault(value, len(dictionary)) for value in values),
+        dtype=np.int32, count=len(values)
+    )
+
+
+def _prune(root: str, keep: int):
+    names = sorted(entry for entry in os.listdir(root)
+                   if not entry.startswith('.') and os.path.isdir(os.path.join(root, entry)))
+    for name in names[:-keep] if keep > 0 else []:
+        # Open snapshots keep working: their memory maps outlive the files
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def current_snapshot_path(root: str) -> Optional[str]:
+    """
+    Get the directory of the latest complete snapshot under root, or None.
+    """
+    try:
+        with open(os.path.join(root, POINTER_FILE), encoding='utf-8') as handle:
+            name = handle.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(root, name) if name else None
+
+
+class HoldingsSnapshot:
+    """
+    A memory-mapped snapshot with group-by and filter queries.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open a snapshot directory.
+
+        Args:
+            path (str): Snapshot directory written by build_snapshot
+        """
+        self.path = path
+        with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as handle:
+            self.manifest = json.load(handle)
+        with open(os.path.join(path, 'dictionaries.json'), encoding='utf-8') as handle:
+            self.dictionaries = json.load(handle)
+        self.columns = {
+            column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode='r')
+            for column in COLUMN_DTYPES
+        }
+        self._index = {
+            'ticker': {value: code for code, value in enumerate(self.dictionaries['ticker'])},
+            'sector': {value.lower(): code for code, value in enumerate(self.dictionaries['sector'])},
+            'user': {value: code for code, value in enumerate(self.dictionaries['user'])},
+        }
+        self._portfolio_codes = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.manifest['holdings']
+
+    def _portfolios(self):
+        # Dense codes for portfolio ids, computed on first use
+        with self._lock:
+            if self._portfolio_codes is None:
+                values, codes = np.unique(self.columns['portfolio_id'], return_inverse=True)
+                self._portfolio_codes = (values, codes.astype(np.int64))
+            return self._portfolio_codes
+
+    def _group_column(self, key: str):
+        """
+        Get (dense codes, number of codes, code -> label) for a group key.
+        """
+        if key == 'portfolio':
+            values, codes = self._portfolios()
+            return codes, len(values), lambda code: int(values[code])
+        if key == 'sector':
+            # Shift so the unclassified code -1 becomes 0
+            names = self.dictionaries['sector']
+            return (self.columns['sector'].astype(np.int64) + 1, len(names) + 1,
+                    lambda code: names[code - 1] if code else UNCLASSIFIED_SECTOR)
+        names = self.dictionaries[key]
+        return self.columns[key], len(names), lambda code: names[code]
+
+    def _filter(self, mask: np.ndarray, key: str, values: Optional[Sequence[str]]) -> np.ndarray:
+        if not values:
+            return mask
+        if key == 'ticker':
+            wanted = [self._index[key].get(value.strip().upper()) for value in values]
+        elif key == 'sector':
+            wanted = [-1 if value.strip().lower() == UNCLASSIFIED_SECTOR.lower()
+                      else self._index[key].get(value.strip().lower()) for value in values]
+        else:
+            wanted = [self._index[key].get(value) for value in values]
+        wanted = [code for code in wanted if code is not None]
+        return mask & np.isin(self.columns[key], wanted)
+
+    def query(self, group_by: Sequence[str] = ('ticker',), tickers: Optional[Sequence[str]] = None,
+              sectors: Optional[Sequence[str]] = None, users: Optional[Sequence[str]] = None,
+              latest_only: bool = True, limit: Optional[int] = 100) -> Dict[str, Any]:
+        """
+        Sum holdings, shares and cost basis per group.
+
+        Args:
+            group_by (Sequence[str]): Keys from GROUP_KEYS; empty for totals only
+            tickers (Sequence[str]): Only these tickers (optional)
+            sectors (Sequence[str]): Only these sectors, 'Unclassified' for none (optional)
+            users (Sequence[str]): Only these users (optional)
+            latest_only (bool): Only each user's most recent upload, the
+                user's current position; False counts every upload
+            limit (int): Largest groups by cost basis to return (None for all)
+
+        Returns:
+            Dict: Groups with holdings, distinct users, shares, cost basis and
+            weight of the filtered total, plus the totals
+
+        Raises:
+            SnapshotQueryError: For unknown group keys or a negative limit
+        """
+        unknown = [key for key in group_by if key not in GROUP_KEYS]
+        if unknown:
+            raise SnapshotQueryError(f"Unknown group key '{unknown[0]}'. Use any of: {', '.join(GROUP_KEYS)}")
+        if len(set(group_by)) != len(group_by):
+            raise SnapshotQueryError("Group keys must not repeat")
+        if limit is not None and limit < 0:
+            raise SnapshotQueryError("limit must not be negative")
+
+        started = time.perf_counter()
+        columns = self.columns
+        mask = np.array(columns['latest']) if latest_only else np.ones(len(self), dtype=np.bool_)
+        mask = self._filter(mask, 'ticker', tickers)
+        mask = self._filter(mask, 'sector', sectors)
+        mask = self._filter(mask, 'user', users)
+
+        selected = np.flatnonzero(mask)
+        user_codes = columns['user'][selected].astype(np.int64)
+        shares = columns['shares'][selected]
+        cost_basis = columns['cost_basis'][selected]
+
+        # Combine the group columns into one integer key per row
+        key = np.zeros(len(selected), dtype=np.int64)
+        labels = []
+        for name in group_by:
+            codes, size, label = self._group_column(name)
+            key = key * size + codes[selected]
+            labels.append((name, size, label))
+        group_keys, inverse = np.unique(key, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        count = len(group_keys)
+
+        holdings = np.bincount(inverse, minlength=count)
+        share_sums = np.bincount(inverse, weights=shares, minlength=count)
+        cost_sums = np.bincount(inverse, weights=cost_basis, minlength=count)
+        user_space = max(len(self.dictionaries['user']), 1)
+        user_pairs = np.unique(inverse.astype(np.int64) * user_space + user_codes)
+        user_counts = np.bincount(user_pairs // user_space, minlength=count)
+
+        total_cost = float(cost_sums.sum())
+        order = np.argsort(-cost_sums, kind='stable')
+        if limit is not None:
+            order = order[:limit]
+
+        groups = []
+        for index in order:
+            group = {}
+            remainder = int(group_keys[index])
+            for name, size, label in reversed(labels):
+                remainder, code = divmod(remainder, size)
+                group[name] = label(code)
+            group.update({
+                'holdings': int(holdings[index]),
+                'users': int(user_counts[index]),
+                'shares': float(share_sums[index]),
+                'cost_basis': float(cost_sums[index]),
+                'weight': float(cost_sums[index]) / total_cost if total_cost else 0.0,
+            })
+            groups.append(group)
+
+        return {
+            'snapshot': {key: self.manifest[key] for key in ('id', 'created_at', 'holdings')},
+            'group_by': list(group_by),
+            'groups': groups,
+            'group_count': count,
+            'totals': {
+                'holdings': int(len(selected)),
+                'users': int(len(np.unique(user_codes))),
+                'shares': float(shares.sum()),
+                'cost_basis': total_cost,
+            },
+            'query_ms': round((time.perf_counter() - started) * 1000, 3),
+        }
+
+
+class SnapshotService:
+    """
+    Builds snapshots on a background thread, on a schedule and on request,
+    and serves queries from the latest one.
+    """
+
+    def __init__(self, manager, root: str, interval: float = 0, keep: int = 3):
+        """
+        Initialize the service.
+
+        Args:
+            manager (DatabaseManager): Database to snapshot
+            root (str): Snapshot root directory
+            interval (float): Seconds between scheduled builds (0 disables the schedule)
+            keep (int): Number of snapshots to keep
+        """
+        self.manager = manager
+        self.root = root
+        self.interval = interval
+        self.keep = keep
+
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._snapshot: Optional[HoldingsSnapshot] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._building = False
+        self._builds = 0
+        self._last_error = None
+
+    def current(self) -> Optional[HoldingsSnapshot]:
+        """
+        Get the latest complete snapshot, reopening it when a newer one was
+        published (by this process or an external job).
+
+        Returns:
+            Optional[HoldingsSnapshot]: Snapshot, or None before the first build
+        """
+        path = current_snapshot_path(self.root)
+        with self._lock:
+            if path is None:
+                return None
+            if self._snapshot is None or self._snapshot.path != path:
+                self._snapshot = HoldingsSnapshot(path)
+                logger.info(f"Opened snapshot {self._snapshot.manifest['id']}")
+            return self._snapshot
+
+    def refresh(self) -> Dict[str, Any]:
+        """
+        Build a new snapshot now; concurrent calls build one at a time.
+
+        Returns:
+            Dict: Manifest of the new snapshot
+        """
+        with self._build_lock:
+            try:
+                manifest = build_snapshot(self.manager, self.root, self.keep)
+            except Exception as e:
+                self._last_error = str(e)
+                raise
+            self._builds += 1
+            self._last_error = None
+            return manifest
+
+    def _run(self):
+        # Scheduled builds start right away when there is no snapshot yet
+        if self.interval > 0 and current_snapshot_path(self.root) is None:
+            self._wake.set()
+        while True:
+            self._wake.wait(self.interval if self.interval > 0 else None)
+            if self._stop.is_set():
+                return
+            self._wake.clear()
+            with self._lock:
+                self._building = True
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Snapshot build failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._building = False
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='snapshot-builder', daemon=True)
+                self._thread.start()
+
+    def start(self):
+        """Start scheduled builds, the first right away if no snapshot exists."""
+        if self.interval > 0:
+            self._ensure_thread()
+
+    def request_refresh(self) -> bool:
+        """
+        Ask the background thread to build a new snapshot.
+
+        Requests made while one is already waiting are merged into it.
+
+        Returns:
+            bool: False if a requested build was already waiting
+        """
+        self._ensure_thread()
+        queued = not self._wake.is_set()
+        self._wake.set()
+        return queued
+
+    def stop(self):
+        """Stop the background thread."""
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the current snapshot and build counters.
+
+        Returns:
+            Dict: Snapshot statistics
+        """
+        snapshot = self.current()
+        return {
+            'snapshot': snapshot.manifest['id'] if snapshot else None,
+            'holdings': len(snapshot) if snapshot else 0,
+            'building': self._building,
+            'builds': self._builds,
+            'interval_seconds': self.interval,
+            'last_error': self._last_error,
+        }
+
+
+def init_snapshot_service(app) -> SnapshotService:
+    """
+    Create the snapshot service for a Flask app from its config and start
+    its schedule.
+
+    Args:
+        app (Flask): Application to attach the service to
+
+    Returns:
+        SnapshotService: The created service
+    """
+    service = SnapshotService(db_manager, app.config['SNAPSHOT_DIR'],
+                              interval=app.config['SNAPSHOT_INTERVAL'],
+                              keep=app.config['SNAPSHOT_KEEP'])
+    app.extensions['snapshot_service'] = service
+    service.start()
+    return service
+
+
+def get_snapshot_service() -> SnapshotService:
+    """Get the snapshot service of the current Flask app."""
+    return current_app.extensions['snapshot_service']